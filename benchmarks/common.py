@@ -0,0 +1,165 @@
+"""Shared helpers for the benchmark scripts: process management and load driving."""
+
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CAR_SERVICE_DIR = REPO_ROOT / "infinity" / "car_service"
+GATEWAY_DIR = REPO_ROOT / "gateway"
+SEEDER_SQL = REPO_ROOT / "initdb" / "seeder_db_car.sql"
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    total = len(latencies)
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def start_process(args: List[str], cwd: Path, env: Dict[str, str], log_path: Optional[Path] = None) -> subprocess.Popen:
+    output = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        args,
+        cwd=cwd,
+        env={**os.environ, **env},
+        stdout=output,
+        stderr=subprocess.STDOUT if log_path else subprocess.DEVNULL,
+    )
+
+
+def start_car_service(port: int, env: Dict[str, str], log_path: Optional[Path] = None) -> subprocess.Popen:
+    return start_process(
+        [sys.executable, "main.py"],
+        cwd=CAR_SERVICE_DIR,
+        env={"CAR_SERVICE_PORT": str(port), **env},
+        log_path=log_path,
+    )
+
+
+def start_gateway(port: int, car_service_url: str, log_path: Optional[Path] = None) -> subprocess.Popen:
+    return start_process(
+        [sys.executable, "-m", "uvicorn", "gateway:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=GATEWAY_DIR,
+        # gateway imports the tracing module that lives next to car_service
+        env={"CAR_SERVICE_URL": car_service_url, "PYTHONPATH": str(CAR_SERVICE_DIR)},
+        log_path=log_path,
+    )
+
+
+def stop_process(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def seed_database(database_url: str) -> None:
+    """Drop the public schema and load initdb/seeder_db_car.sql."""
+    import psycopg2
+
+    connection = psycopg2.connect(database_url)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DROP SCHEMA IF EXISTS public CASCADE; CREATE SCHEMA public;")
+            cursor.execute(SEEDER_SQL.read_text())
+    finally:
+        connection.close()
+
+
+def wait_healthy(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+
+RequestFactory = Callable[[random.Random], Dict[str, Any]]
+
+
+async def drive(
+    base_url: str,
+    make_request: RequestFactory,
+    concurrency: int,
+    duration: float,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Run ``concurrency`` closed-loop users against ``base_url`` for ``duration`` seconds.
+
+    ``make_request`` returns ``{"name", "method", "path", "json"?}`` and is
+    called with a per-user seeded RNG, so a run is reproducible for a given
+    seed and concurrency. Results are reported overall and per request name.
+    """
+    latencies: List[float] = []
+    errors = 0
+    status_counts: Dict[str, int] = {}
+    per_name: Dict[str, Dict[str, Any]] = {}
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        async def user(index: int):
+            nonlocal errors
+            rng = random.Random(seed * 1000003 + index)
+            while time.monotonic() < deadline:
+                spec = make_request(rng)
+                bucket = per_name.setdefault(spec["name"], {"latencies": [], "errors": 0})
+                started = time.perf_counter()
+                failed = False
+                try:
+                    response = await client.request(spec.get("method", "GET"), spec["path"], json=spec.get("json"))
+                    failed = response.status_code >= 400
+                    status = str(response.status_code)
+                except httpx.HTTPError:
+                    failed = True
+                    status = "transport_error"
+                status_counts[status] = status_counts.get(status, 0) + 1
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                latencies.append(elapsed_ms)
+                bucket["latencies"].append(elapsed_ms)
+                if failed:
+                    errors += 1
+                    bucket["errors"] += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    result = summarize(latencies, errors, elapsed)
+    result["status_counts"] = dict(sorted(status_counts.items()))
+    result["per_request"] = {
+        name: summarize(bucket["latencies"], bucket["errors"], elapsed)
+        for name, bucket in sorted(per_name.items())
+    }
+    return result
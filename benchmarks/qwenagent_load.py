@@ -0,0 +1,100 @@
+"""
+Load test for the qwenagent HTTP API.
+
+Drives /api/chat (or /api/chat/stream with --stream) on a running qwenagent
+at increasing concurrency levels and reports, per level, completed-turn
+throughput, latency percentiles, how many requests the agent pool rejected
+with 429 (those return at once, so read latency together with
+rejected_rate) and the pool counters from /api/health.
+
+Throughput should grow with concurrency until every pooled agent in every
+worker is busy (QWEN_WORKERS * AGENT_POOL_SIZE); past that point latency
+grows while the waiting room fills, and beyond the waiting room requests
+are rejected instead of timing out.
+
+Usage:
+    # qwenagent under gunicorn, e.g. QWEN_WORKERS=2 AGENT_POOL_SIZE=4
+    cd qwenagent && gunicorn -c gunicorn.conf.py "main:create_api()"
+
+    python benchmarks/qwenagent_load.py --url http://127.0.0.1:9000 \
+        --concurrency 1,2,4,8,16,32 --duration 60 --output qwen_load.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+
+from common import drive
+
+QUESTIONS = [
+    "Rekomendasi mobil keluarga 7 kursi dengan budget 300 juta",
+    "Berapa lama inden Fortuner di Medan?",
+    "Bandingkan Veloz Q dengan Rush G AT",
+    "Promo apa yang berlaku untuk Innova Zenix?",
+    "Mobil hybrid untuk eksekutif apa saja?",
+    "Stok Avanza di Surabaya ada berapa?",
+]
+
+
+def chat_request(path):
+    def make(rng):
+        return {"name": path, "method": "POST", "path": path, "json": {"message": rng.choice(QUESTIONS)}}
+    return make
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:9000")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per level")
+    parser.add_argument("--stream", action="store_true", help="Use /api/chat/stream instead of /api/chat")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    path = "/api/chat/stream" if args.stream else "/api/chat"
+    results = []
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        run = asyncio.run(drive(args.url, chat_request(path), concurrency, args.duration, seed=args.seed))
+        run.pop("per_request", None)
+        statuses = run["status_counts"]
+        rejected = statuses.get("429", 0)
+        completed = statuses.get("200", 0)
+        run = {
+            "concurrency": concurrency,
+            **run,
+            "completed": completed,
+            "rejected": rejected,
+            "rejected_rate": round(rejected / run["requests"], 4) if run["requests"] else 0.0,
+            "turns_per_minute": round(completed / args.duration * 60, 1),
+        }
+        try:
+            run["pool"] = httpx.get(f"{args.url}/api/health", timeout=5.0).json().get("pool")
+        except (httpx.HTTPError, ValueError):
+            run["pool"] = None
+        try:
+            # Per-stage histograms of whichever worker answers
+            run["agent_metrics"] = httpx.get(f"{args.url}/api/metrics", timeout=5.0).json().get("histograms")
+        except (httpx.HTTPError, ValueError):
+            run["agent_metrics"] = None
+        results.append(run)
+        print(
+            f"c={concurrency}: {run['turns_per_minute']} turns/min, p50 {run['p50_ms']} ms, "
+            f"p95 {run['p95_ms']} ms, rejected {run['rejected_rate']:.1%}",
+            file=sys.stderr,
+        )
+
+    report = {"url": args.url, "path": path, "duration_s": args.duration, "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Stand-in for an OpenAI-compatible LLM server (Ollama's /v1, vLLM, ...).
+
+Serves ``/v1/chat/completions`` (streamed or not) and ``/v1/models`` so
+qwenagent, its LLM backend pool and the batch evaluation can run without a
+GPU. Every completion waits ``--latency-ms`` (time to first token), then
+sends the answer a word at a time, ``--token-ms`` apart.
+
+With ``--tool-call NAME`` the stub answers a fresh question with a
+qwen_agent (nous format) call of that tool, when the tool is offered in the
+prompt, and answers from the tool result once it comes back. Without it
+every question is answered directly.
+
+``--max-concurrency`` makes requests over the limit fail with 503, like an
+overloaded server; ``POST /admin/down`` and ``/admin/up`` take the whole
+stub out of service and back, for the pool's health checks.
+
+Usage:
+    python benchmarks/stub_llm.py --port 18434 --model qwen3:latest --latency-ms 300 --token-ms 20
+    # then set LLM_MODEL_SERVER=http://127.0.0.1:18434/v1 (or list it in LLM_BACKENDS)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="LLM server stub")
+
+MODEL = os.getenv("STUB_LLM_MODEL", "qwen3:latest")
+LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "300"))
+JITTER_MS = float(os.getenv("STUB_LLM_JITTER_MS", "0"))
+TOKEN_MS = float(os.getenv("STUB_LLM_TOKEN_MS", "20"))
+ERROR_RATE = float(os.getenv("STUB_LLM_ERROR_RATE", "0"))
+MAX_CONCURRENCY = int(os.getenv("STUB_LLM_MAX_CONCURRENCY", "0"))
+TOOL_CALL = os.getenv("STUB_LLM_TOOL_CALL", "")
+TOOL_ARGS = os.getenv("STUB_LLM_TOOL_ARGS", "{}")
+
+state = {"up": True, "active": 0, "requests": 0, "rejected": 0}
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return content or ""
+
+
+def reply(messages) -> str:
+    last = _text(messages[-1].get("content")) if messages else ""
+    prompt = "".join(_text(m.get("content")) for m in messages)
+    if "<tool_response>" in last:
+        result = " ".join(last.replace("<tool_response>", "").replace("</tool_response>", "").split())
+        return f"[stub:{MODEL}] Based on the data: {result[:200]}"
+    if TOOL_CALL and "<tools>" in prompt and f'"{TOOL_CALL}"' in prompt:
+        call = json.dumps({"name": TOOL_CALL, "arguments": json.loads(TOOL_ARGS)}, ensure_ascii=False)
+        return f"<tool_call>\n{call}\n</tool_call>"
+    user = next((_text(m.get("content")) for m in reversed(messages) if m.get("role") == "user"), "")
+    return f"[stub:{MODEL}] {user[:200]}"
+
+
+def _usage(messages, text):
+    # Same 4 characters per token estimate as qwenagent
+    prompt = sum(len(_text(m.get("content"))) for m in messages) // 4
+    completion = len(text) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    if not state["up"]:
+        return JSONResponse(status_code=503, content={"error": "stub is down"})
+    if MAX_CONCURRENCY and state["active"] >= MAX_CONCURRENCY:
+        state["rejected"] += 1
+        return JSONResponse(status_code=503, content={"error": "stub overloaded"})
+    payload = await request.json()
+    messages = payload.get("messages", [])
+    state["active"] += 1
+    state["requests"] += 1
+    try:
+        delay = max(0.0, random.gauss(LATENCY_MS, JITTER_MS) if JITTER_MS else LATENCY_MS)
+        await asyncio.sleep(delay / 1000)
+        if ERROR_RATE and random.random() < ERROR_RATE:
+            state["active"] -= 1
+            return JSONResponse(status_code=500, content={"error": "stubbed failure"})
+        text = reply(messages)
+        max_tokens = payload.get("max_tokens")
+        words = text.split(" ")
+        if max_tokens:
+            words = words[:max_tokens]
+            text = " ".join(words)
+    except BaseException:
+        state["active"] -= 1
+        raise
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    if not payload.get("stream"):
+        await asyncio.sleep(TOKEN_MS * len(words) / 1000)
+        state["active"] -= 1
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": MODEL,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(messages, text),
+        }
+
+    def chunk(delta, finish_reason=None):
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": MODEL,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    async def events():
+        try:
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                await asyncio.sleep(TOKEN_MS / 1000)
+                yield chunk({"content": word if i == 0 else " " + word})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            state["active"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+async def models():
+    if not state["up"]:
+        return JSONResponse(status_code=503, content={"error": "stub is down"})
+    return {"object": "list", "data": [{"id": MODEL, "object": "model", "owned_by": "stub"}]}
+
+
+@app.post("/admin/{action}")
+async def admin(action: str):
+    if action not in ("up", "down"):
+        return JSONResponse(status_code=404, content={"error": "use /admin/up or /admin/down"})
+    state["up"] = action == "up"
+    return state
+
+
+@app.get("/admin/stats")
+async def stats():
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM server stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18434)
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="Time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--token-ms", type=float, default=TOKEN_MS, help="Delay per generated word")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY, help="0 = unlimited")
+    parser.add_argument("--tool-call", default=TOOL_CALL, help="Tool to call for fresh questions")
+    parser.add_argument("--tool-args", default=TOOL_ARGS, help="JSON arguments of that tool call")
+    args = parser.parse_args()
+
+    MODEL = args.model
+    LATENCY_MS = args.latency_ms
+    JITTER_MS = args.jitter_ms
+    TOKEN_MS = args.token_ms
+    ERROR_RATE = args.error_rate
+    MAX_CONCURRENCY = args.max_concurrency
+    TOOL_CALL = args.tool_call
+    TOOL_ARGS = args.tool_args
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,62 @@
+"""
+Stand-in for the n8n chatbot webhook.
+
+Answers every POST with a canned response in the shape car_service expects,
+after sleeping for a configurable latency so the chat path can be measured
+without n8n or an LLM.
+
+Usage:
+    python benchmarks/stub_n8n.py --port 18678 --latency-ms 800 --jitter-ms 200
+    # then set N8N_CHATBOT_WEBHOOK_URL=http://127.0.0.1:18678/webhook/get-message
+"""
+
+import argparse
+import asyncio
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="n8n webhook stub")
+
+LATENCY_MS = float(os.getenv("STUB_N8N_LATENCY_MS", "500"))
+JITTER_MS = float(os.getenv("STUB_N8N_JITTER_MS", "0"))
+ERROR_RATE = float(os.getenv("STUB_N8N_ERROR_RATE", "0"))
+
+
+@app.post("/webhook/{name}")
+async def webhook(name: str, request: Request):
+    payload = await request.json()
+    delay = max(0.0, random.gauss(LATENCY_MS, JITTER_MS) if JITTER_MS else LATENCY_MS)
+    await asyncio.sleep(delay / 1000)
+
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse(status_code=500, content={"error": "stubbed failure"})
+
+    message = payload.get("message", "")
+    return {
+        "output": f"[stub] {message[:200]}",
+        "session_id": payload.get("session_id"),
+    }
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="n8n webhook stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18678)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    args = parser.parse_args()
+
+    LATENCY_MS = args.latency_ms
+    JITTER_MS = args.jitter_ms
+    ERROR_RATE = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,178 @@
+"""
+Tool-call latency: MCP over SSE versus the native HTTP tools.
+
+Calls the same car_service operations with the same arguments two ways:
+
+* ``mcp``  - one MCP ``ClientSession`` over SSE to car_service's ``/mcp``
+  mount, as qwen_agent keeps it (the connect + initialize + list_tools
+  handshake is reported separately as ``setup_ms``);
+* ``http`` - plain GETs with one pooled ``httpx`` client, as the
+  ``CAR_TOOLS_MODE=http`` tools in qwenagent/http_tools.py make them
+  (fetching the OpenAPI document and building the schemas is ``setup_ms``).
+
+Both ask for the compact tool output, so the payloads are the same size.
+By default the HTTP tools go through the gateway, as in production, which
+adds a hop the MCP path does not have; point ``--http-url`` at car_service
+itself to compare the transports alone. The report also compares the size
+of the tool schemas each path puts in front of the model.
+
+Needs a running car_service (and gateway) with data loaded, and
+qwenagent's requirements (qwen-agent with the ``mcp`` extra) installed.
+
+Usage:
+    python benchmarks/tool_transport.py --mcp-url http://127.0.0.1:8007/mcp \
+        --http-url http://127.0.0.1:2323 --openapi-url http://127.0.0.1:8007/openapi.json \
+        --concurrency 1,4,16 --calls 200 --output tool_transport.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from common import REPO_ROOT, summarize
+from e2e import SEED_CAR_IDS, SEED_VARIANT_IDS
+
+sys.path.insert(0, str(REPO_ROOT / "qwenagent"))
+from http_tools import DEFAULT_OPERATIONS, compact_operations  # noqa: E402
+
+CASES: List[Tuple[str, Dict[str, Any]]] = [
+    ("list cars", {}),
+    ("list car variants", {"car_id": SEED_CAR_IDS[0]}),
+    ("get car recommendations", {"budget_max": 300000000, "seating_capacity": 7}),
+    ("compare variants", {"variant_ids": ",".join(SEED_VARIANT_IDS[:2])}),
+    ("list promotions", {}),
+    ("get stock info", {"city": "Medan"}),
+]
+
+Call = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+
+def schema_tokens(schemas: List[Dict[str, Any]]) -> int:
+    # Same 4 characters per token estimate as car_service and qwenagent
+    return math.ceil(len(json.dumps(schemas, ensure_ascii=False)) / 4)
+
+
+async def run_level(call: Call, concurrency: int, calls: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    per_tool: Dict[str, List[float]] = {}
+    errors = 0
+    sizes: List[int] = []
+    queue: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+    for i in range(calls):
+        queue.put_nowait(CASES[i % len(CASES)])
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            name, args = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                text = await call(name, dict(args))
+                sizes.append(len(text))
+            except Exception:
+                errors += 1
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+            latencies.append(elapsed)
+            per_tool.setdefault(name, []).append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = {"concurrency": concurrency, **summarize(latencies, errors, time.perf_counter() - started)}
+    result["avg_result_chars"] = round(sum(sizes) / len(sizes)) if sizes else None
+    result["per_tool"] = {name: summarize(values, 0, 0)["p50_ms"] for name, values in per_tool.items()}
+    return result
+
+
+async def bench_mcp(url: str, levels: List[int], calls: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    async with sse_client(url) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            tools = (await session.list_tools()).tools
+            setup_ms = (time.perf_counter() - started) * 1000
+
+            async def call(name, args):
+                result = await session.call_tool(name, args)
+                if result.isError:
+                    raise RuntimeError(result.content)
+                return "".join(getattr(item, "text", "") for item in result.content)
+
+            schemas = [
+                {"name": t.name, "description": t.description, "parameters": t.inputSchema}
+                for t in tools if t.name in DEFAULT_OPERATIONS
+            ]
+            return {
+                "setup_ms": round(setup_ms, 1),
+                "schema_tokens": schema_tokens(schemas),
+                "levels": [await run_level(call, c, calls) for c in levels],
+            }
+
+
+async def bench_http(base_url: str, openapi_url: str, levels: List[int], calls: int) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+        started = time.perf_counter()
+        response = await client.get(openapi_url)
+        response.raise_for_status()
+        specs = {spec["operation_id"]: spec for spec in compact_operations(response.json(), DEFAULT_OPERATIONS)}
+        setup_ms = (time.perf_counter() - started) * 1000
+
+        async def call(name, args):
+            spec = specs[name]
+            path = spec["path"]
+            for param in spec["path_params"]:
+                path = path.replace("{" + param + "}", str(args.pop(param)))
+            response = await client.get(f"{base_url.rstrip('/')}{path}", params=args, headers={"X-Tool-Format": "compact"})
+            response.raise_for_status()
+            return response.text
+
+        return {
+            "setup_ms": round(setup_ms, 1),
+            "schema_tokens": schema_tokens([spec["function"] for spec in specs.values()]),
+            "levels": [await run_level(call, c, calls) for c in levels],
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mcp-url", default="http://127.0.0.1:8007/mcp")
+    parser.add_argument("--http-url", default="http://127.0.0.1:2323", help="Gateway (or car_service) base URL")
+    parser.add_argument("--openapi-url", default="http://127.0.0.1:8007/openapi.json")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--calls", type=int, default=200, help="Tool calls per level")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    report = {
+        "mcp_url": args.mcp_url,
+        "http_url": args.http_url,
+        "calls_per_level": args.calls,
+        "mcp": asyncio.run(bench_mcp(args.mcp_url, levels, args.calls)),
+        "http": asyncio.run(bench_http(args.http_url, args.openapi_url, levels, args.calls)),
+    }
+    for mcp_level, http_level in zip(report["mcp"]["levels"], report["http"]["levels"]):
+        print(
+            f"c={mcp_level['concurrency']}: mcp p50 {mcp_level['p50_ms']} ms / p95 {mcp_level['p95_ms']} ms, "
+            f"http p50 {http_level['p50_ms']} ms / p95 {http_level['p95_ms']} ms",
+            file=sys.stderr,
+        )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
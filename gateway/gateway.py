@@ -1,10 +1,15 @@
 # gateway_service.py
 from fastapi import FastAPI, Request, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import httpx
 from typing import Optional, Dict, Any
+import contextvars
 import logging
+from contextlib import asynccontextmanager
+import os
+import time
+from tracing import TraceExporter, current_trace, end_trace, propagation_headers, start_trace
 
 app = FastAPI(
     title="Infinity Gateway", 
@@ -14,6 +19,20 @@ app = FastAPI(
 
 logger = logging.getLogger(__name__)
 
+TRACING_CONFIG = {
+    "server_timing": os.getenv("SERVER_TIMING", "true").lower() == "true",
+    "exporter": os.getenv("TRACE_EXPORTER", "none").lower(),  # none, file, atau otlp
+    "file": os.getenv("TRACE_FILE", "/tmp/gateway_traces.jsonl"),
+    "otlp_endpoint": os.getenv("OTLP_TRACES_ENDPOINT", "http://otel-collector:4318/v1/traces"),
+}
+
+trace_exporter = TraceExporter(
+    TRACING_CONFIG["exporter"],
+    service_name="gateway",
+    file_path=TRACING_CONFIG["file"],
+    otlp_endpoint=TRACING_CONFIG["otlp_endpoint"],
+)
+
 
 
 def _to_optional_str(value: Any) -> Optional[str]:
@@ -125,21 +144,111 @@ app.add_middleware(
 )
 
 # Base URLs for microservices
-CAR_SERVICE_URL = "http://car_service:8007"
+CAR_SERVICE_URL = os.getenv("CAR_SERVICE_URL", "http://car_service:8007")
+
+# Headers agents send to ask car_service for compact tool output (see
+# car_service tool_output.py); forwarded on every car_service call.
+TOOL_REQUEST_HEADERS = ("x-tool-caller", "x-tool-format", "x-tool-fields", "x-tool-token-budget")
+_tool_headers: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("tool_headers", default={})
+
+
+async def _add_context_headers(request: httpx.Request):
+    # Per-request headers on the shared client: request id and tool output format
+    request.headers.update({**propagation_headers(), **_tool_headers.get()})
+
+
+async def _mark_upstream_start(request: httpx.Request):
+    request.extensions["trace_start_ns"] = time.time_ns()
+
+
+async def _record_upstream_span(response: httpx.Response):
+    trace = current_trace()
+    if trace is None:
+        return
+    request = response.request
+    trace.add_span(
+        "upstream",
+        f"{request.method} {request.url.path}",
+        request.extensions.get("trace_start_ns", trace.start_ns),
+        time.time_ns(),
+        status_code=response.status_code,
+    )
+    upstream_timing = response.headers.get("server-timing")
+    if upstream_timing:
+        trace.attributes["upstream_server_timing"] = upstream_timing
+
+
+# One keep-alive client per timeout, shared by all requests; building a
+# client (and its connection and SSL context) per request cost more than
+# most car_service calls take.
+_car_service_clients: Dict[float, httpx.AsyncClient] = {}
+
+
+@asynccontextmanager
+async def car_service_client(timeout: float = 5.0):
+    """Pooled httpx client for car_service calls that propagates the request id and records upstream time."""
+    client = _car_service_clients.get(timeout)
+    if client is None:
+        client = _car_service_clients[timeout] = httpx.AsyncClient(
+            timeout=timeout,
+            event_hooks={"request": [_add_context_headers, _mark_upstream_start], "response": [_record_upstream_span]},
+        )
+    yield client
+
+
+@app.on_event("shutdown")
+async def close_car_service_clients():
+    for client in _car_service_clients.values():
+        await client.aclose()
+    _car_service_clients.clear()
+
+
+@app.middleware("http")
+async def request_tracing(request: Request, call_next):
+    """Assign the request id for the whole chain and merge car_service's Server-Timing into ours."""
+    trace, token = start_trace(request.headers, f"{request.method} {request.url.path}")
+    trace.attributes.update({"http.method": request.method, "http.path": request.url.path})
+    tool_token = _tool_headers.set({k: v for k, v in request.headers.items() if k.lower() in TOOL_REQUEST_HEADERS})
+    try:
+        response = await call_next(request)
+    finally:
+        trace.end_ns = time.time_ns()
+        _tool_headers.reset(tool_token)
+        end_trace(token)
+        trace_exporter.submit(trace)
+
+    trace.attributes["http.status_code"] = response.status_code
+    response.headers["X-Request-ID"] = trace.request_id
+    if TRACING_CONFIG["server_timing"]:
+        timing = trace.server_timing()
+        upstream_timing = trace.attributes.get("upstream_server_timing")
+        if upstream_timing:
+            timing += ", " + ", ".join(
+                f"car_service-{entry.strip()}" for entry in upstream_timing.split(",") if entry.strip()
+            )
+        response.headers["Server-Timing"] = timing
+    return response
 
 @app.get("/health", tags=["Gateway"])
 def health_check():
     return {"status": "ok", "gateway": "Infinity Gateway"}
 
 # ========== CAR ENDPOINTS ==========
+def upstream_body(response: httpx.Response):
+    """car_service's JSON as before; compact tool tables (text) pass through unchanged."""
+    content_type = response.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        return response.json()
+    return Response(content=response.content, media_type=content_type or None)
+
 @app.get("/cars", tags=["Car"])
 async def get_cars():
     """Ambil semua model mobil"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/cars")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch cars: {str(e)}")
 
@@ -147,10 +256,10 @@ async def get_cars():
 async def get_car_variants(car_id: str):
     """Ambil varian mobil berdasarkan model"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/cars/{car_id}/variants")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch car variants: {str(e)}")
 
@@ -158,34 +267,58 @@ async def get_car_variants(car_id: str):
 async def get_variant_detail(variant_id: str):
     """Ambil detail varian mobil"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/variants/{variant_id}")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch variant detail: {str(e)}")
 
+@app.get("/variants/{variant_id}/quote", tags=["Car"])
+async def get_variant_quote(variant_id: str, request: Request):
+    """Hitung harga varian plus aksesoris setelah promo"""
+    try:
+        async with car_service_client() as client:
+            params = dict(request.query_params)
+            response = await client.get(f"{CAR_SERVICE_URL}/variants/{variant_id}/quote", params=params)
+            response.raise_for_status()
+            return upstream_body(response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch quote: {str(e)}")
+
 @app.get("/recommendations", tags=["Car"])
 async def get_car_recommendations(request: Request):
     """Ambil rekomendasi mobil berdasarkan kriteria"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             params = dict(request.query_params)
             response = await client.get(f"{CAR_SERVICE_URL}/recommendations", params=params)
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch recommendations: {str(e)}")
 
+@app.get("/recommendations/facets", tags=["Car"])
+async def get_recommendation_facets(request: Request):
+    """Ambil nilai filter rekomendasi yang tersedia beserta jumlahnya"""
+    try:
+        async with car_service_client() as client:
+            params = dict(request.query_params)
+            response = await client.get(f"{CAR_SERVICE_URL}/recommendations/facets", params=params)
+            response.raise_for_status()
+            return upstream_body(response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch recommendation facets: {str(e)}")
+
 @app.get("/compare", tags=["Car"])
 async def compare_variants(request: Request):
     """Bandingkan varian mobil"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             params = dict(request.query_params)
             response = await client.get(f"{CAR_SERVICE_URL}/compare", params=params)
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to compare variants: {str(e)}")
 
@@ -193,10 +326,10 @@ async def compare_variants(request: Request):
 async def get_variant_accessories(variant_id: str):
     """Ambil aksesoris untuk varian tertentu"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/variants/{variant_id}/accessories")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch variant accessories: {str(e)}")
 
@@ -204,10 +337,10 @@ async def get_variant_accessories(variant_id: str):
 async def get_accessories():
     """Ambil semua aksesoris"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/accessories")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch accessories: {str(e)}")
 
@@ -215,10 +348,10 @@ async def get_accessories():
 async def get_promotions():
     """Ambil promosi yang sedang aktif"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/promotions")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch promotions: {str(e)}")
 
@@ -226,23 +359,84 @@ async def get_promotions():
 async def get_stock(request: Request):
     """Ambil informasi stok dan inden"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             params = dict(request.query_params)
             response = await client.get(f"{CAR_SERVICE_URL}/stock", params=params)
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch stock: {str(e)}")
 
+@app.get("/stock/summary", tags=["Car"])
+async def get_stock_summary(request: Request):
+    """Ambil ringkasan ketersediaan stok per varian"""
+    try:
+        async with car_service_client() as client:
+            params = dict(request.query_params)
+            response = await client.get(f"{CAR_SERVICE_URL}/stock/summary", params=params)
+            response.raise_for_status()
+            return upstream_body(response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch stock summary: {str(e)}")
+
+@app.get("/catalog/changes", tags=["Car"])
+async def get_catalog_changes(request: Request):
+    """Ambil perubahan katalog sejak versi tertentu"""
+    try:
+        async with car_service_client() as client:
+            params = dict(request.query_params)
+            response = await client.get(f"{CAR_SERVICE_URL}/catalog/changes", params=params)
+            response.raise_for_status()
+            return upstream_body(response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch catalog changes: {str(e)}")
+
+SNAPSHOT_REQUEST_HEADERS = ("accept", "accept-encoding", "if-none-match")
+SNAPSHOT_RESPONSE_HEADERS = ("etag", "cache-control", "vary", "content-encoding", "content-type", "x-catalog-snapshot")
+
+
+async def proxy_catalog_snapshot(request: Request, path: str) -> Response:
+    # Pass the pre-compressed body and its caching headers through untouched
+    headers = {k: v for k, v in request.headers.items() if k.lower() in SNAPSHOT_REQUEST_HEADERS}
+    async with car_service_client() as client:
+        async with client.stream("GET", f"{CAR_SERVICE_URL}{path}", headers=headers) as response:
+            if response.status_code not in (200, 304):
+                await response.aread()
+                response.raise_for_status()
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+            return Response(
+                content=body,
+                status_code=response.status_code,
+                headers={k: v for k, v in response.headers.items() if k.lower() in SNAPSHOT_RESPONSE_HEADERS},
+            )
+
+@app.get("/catalog/snapshot", tags=["Car"])
+async def get_catalog_snapshot(request: Request):
+    """Ambil snapshot katalog terkompresi untuk pemuatan awal frontend"""
+    try:
+        return await proxy_catalog_snapshot(request, "/catalog/snapshot")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch catalog snapshot: {str(e)}")
+
+@app.get("/catalog/snapshot/{digest}", tags=["Car"])
+async def get_catalog_snapshot_immutable(digest: str, request: Request):
+    """Ambil snapshot katalog dari URL berbasis konten"""
+    try:
+        return await proxy_catalog_snapshot(request, f"/catalog/snapshot/{digest}")
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail="Catalog snapshot not available")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch catalog snapshot: {str(e)}")
+
 @app.get("/workshops", tags=["Car"])
 async def get_workshops(request: Request):
     """Ambil daftar bengkel modifikasi"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             params = dict(request.query_params)
             response = await client.get(f"{CAR_SERVICE_URL}/workshops", params=params)
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch workshops: {str(e)}")
 
@@ -250,11 +444,11 @@ async def get_workshops(request: Request):
 async def get_communities(request: Request):
     """Ambil daftar komunitas mobil"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             params = dict(request.query_params)
             response = await client.get(f"{CAR_SERVICE_URL}/communities", params=params)
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch communities: {str(e)}")
 
@@ -262,21 +456,26 @@ async def get_communities(request: Request):
 async def get_dress_codes():
     """Ambil panduan dress code untuk staf"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with car_service_client() as client:
             response = await client.get(f"{CAR_SERVICE_URL}/dress-codes")
             response.raise_for_status()
-            return response.json()
+            return upstream_body(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch dress codes: {str(e)}")
 
 # ========== CHAT ENDPOINTS ==========
+def idempotency_headers(request: Request) -> Dict[str, str]:
+    """Pass the client's Idempotency-Key on so car_service can deduplicate retries."""
+    key = request.headers.get("idempotency-key")
+    return {"Idempotency-Key": key} if key else {}
+
 @app.post("/chat", tags=["Chat"])
 async def chat_with_assistant(request: Request):
     """Chat dengan assistant untuk konsultasi mobil"""
     try:
         body = await request.json()
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{CAR_SERVICE_URL}/chat", json=body)
+        async with car_service_client() as client:
+            response = await client.post(f"{CAR_SERVICE_URL}/chat", json=body, headers=idempotency_headers(request))
             response.raise_for_status()
             return response.json()
     except Exception as e:
@@ -303,11 +502,13 @@ async def api_chat_with_assistant(request: Request):
     fallback_envelope = build_chat_envelope(context, fallback_message)
 
     car_service_payload: Any = None
+    replayed: Optional[str] = None
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(f"{CAR_SERVICE_URL}/chat", json=body)
+        async with car_service_client(timeout=30.0) as client:
+            response = await client.post(f"{CAR_SERVICE_URL}/chat", json=body, headers=idempotency_headers(request))
             response.raise_for_status()
+            replayed = response.headers.get("idempotent-replayed")
             try:
                 car_service_payload = response.json()
             except Exception as decode_error:
@@ -357,4 +558,7 @@ async def api_chat_with_assistant(request: Request):
         fallback_message
     )
 
-    return JSONResponse(content=normalized_payload)
+    return JSONResponse(
+        content=normalized_payload,
+        headers={"Idempotent-Replayed": replayed} if replayed else None,
+    )
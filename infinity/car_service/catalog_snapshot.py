@@ -0,0 +1,110 @@
+"""
+Prebuilt catalog snapshot for first-load clients (the PWA).
+
+The snapshot is one document with everything the frontend needs before the
+first paint: cars, variants, accessories and their compatibility, active
+promotions and a per-variant stock summary. It is built once per catalog
+version (and day, since promotions depend on the date), serialized
+deterministically, and pre-encoded on demand:
+
+* JSON, or MessagePack when ``msgpack`` is installed
+* gzip, or brotli when ``brotli`` is installed
+
+The strong ETag is a digest of the serialized body plus the encoding, so
+every worker produces the same ETag for the same catalog and the response
+can be served from a content-addressed, immutable URL.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def available_encodings() -> List[str]:
+    return (["br"] if brotli else []) + ["gzip", "identity"]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> str:
+    """Pick the best content coding the client accepts (ignores q-values other than q=0)."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if token and params.replace(" ", "") != "q=0":
+            accepted.add(token.lower())
+    for encoding in available_encodings():
+        if encoding == "identity" or encoding in accepted or "*" in accepted:
+            return encoding
+    return "identity"
+
+
+def choose_media_type(accept: Optional[str]) -> str:
+    if msgpack and MSGPACK_MEDIA_TYPE in (accept or ""):
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+class Snapshot:
+    def __init__(self, key: Tuple, document: Dict[str, Any]):
+        self.key = key
+        self.document = jsonable_encoder(document)
+        self.json_bytes = json.dumps(
+            self.document, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+        ).encode("utf-8")
+        self.digest = hashlib.sha256(self.json_bytes).hexdigest()[:32]
+        self._encoded: Dict[Tuple[str, str], bytes] = {}
+        self._lock = threading.Lock()
+
+    def body(self, media_type: str, encoding: str) -> bytes:
+        cached = self._encoded.get((media_type, encoding))
+        if cached is not None:
+            return cached
+        with self._lock:
+            if (media_type, encoding) not in self._encoded:
+                raw = msgpack.packb(self.document) if media_type == MSGPACK_MEDIA_TYPE else self.json_bytes
+                if encoding == "br":
+                    raw = brotli.compress(raw, quality=11)
+                elif encoding == "gzip":
+                    raw = gzip.compress(raw, compresslevel=9, mtime=0)
+                self._encoded[(media_type, encoding)] = raw
+            return self._encoded[(media_type, encoding)]
+
+    def etag(self, media_type: str, encoding: str) -> str:
+        fmt = "msgpack" if media_type == MSGPACK_MEDIA_TYPE else "json"
+        return f'"{self.digest}-{fmt}-{encoding}"'
+
+    def sizes(self) -> Dict[str, int]:
+        return {f"{m}+{e}": len(b) for (m, e), b in self._encoded.items()}
+
+
+class SnapshotStore:
+    """Holds the snapshot for the current key; builds at most one at a time."""
+
+    def __init__(self):
+        self._current: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple, build: Callable[[], Dict[str, Any]]) -> Snapshot:
+        current = self._current
+        if current is not None and current.key == key:
+            return current
+        with self._lock:
+            if self._current is None or self._current.key != key:
+                self._current = Snapshot(key, build())
+            return self._current
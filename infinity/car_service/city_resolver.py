@@ -0,0 +1,186 @@
+"""
+City name resolution for location filters.
+
+Users (and the LLM) write cities in many ways: "DKI", "Jkt", "Jakarta
+Selatan", "kota bandung", "Sby". The catalog stores one canonical name per
+city (``stock_inventory.city``, ``workshops.city``, ``communities.base_city``),
+so location filters resolve the input to canonical names first and then use
+indexed equality / IN lookups instead of ``ILIKE '%x%'`` scans.
+
+The dictionary lives in the ``regions``, ``cities`` and ``city_aliases``
+tables and is loaded into memory as a sorted prefix map:
+
+* exact alias or canonical name  -> that city
+* region name ("Jabodetabek")    -> every city in the region
+* longest alias at a word boundary ("jakarta selatan" -> "jakarta")
+* unique prefix ("sura")         -> the one city it can complete to
+"""
+
+import bisect
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+_PREFIXES_RE = re.compile(r"^(kota|kab\.?|kabupaten|daerah khusus ibukota|provinsi)\s+")
+_NON_WORD_RE = re.compile(r"[^a-z0-9 ]+")
+_SPACES_RE = re.compile(r"\s+")
+
+LOAD_SQL = """
+SELECT c.name, r.name AS region, c.latitude, c.longitude
+FROM cities c LEFT JOIN regions r ON r.id = c.region_id
+"""
+ALIASES_SQL = """
+SELECT a.alias, c.name FROM city_aliases a JOIN cities c ON c.id = a.city_id
+"""
+
+
+def normalize_city(value: str) -> str:
+    value = _NON_WORD_RE.sub(" ", value.lower())
+    value = _SPACES_RE.sub(" ", value).strip()
+    return _PREFIXES_RE.sub("", value)
+
+
+def _distance_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(h))
+
+
+@dataclass
+class CityMatch:
+    query: str
+    cities: List[str]
+    match: str  # exact, alias, region, prefix
+    region: Optional[str] = None
+
+
+@dataclass
+class _City:
+    name: str
+    region: Optional[str]
+    location: Optional[Tuple[float, float]]
+
+
+@dataclass
+class _Index:
+    cities: Dict[str, _City] = field(default_factory=dict)
+    keys: List[str] = field(default_factory=list)  # sorted normalized names and aliases
+    targets: Dict[str, Tuple[str, List[str]]] = field(default_factory=dict)  # key -> (match kind, cities)
+
+
+class CityResolver:
+    """In-memory city dictionary, reloaded when the catalog version changes."""
+
+    def __init__(self, max_nearby_km: float = 250.0):
+        self.max_nearby_km = max_nearby_km
+        self._index = _Index()
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._index.cities)
+
+    def ensure_loaded(self, db, version) -> None:
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version != version:
+                self._index = self._build(db)
+                self._version = version
+
+    def _build(self, db) -> _Index:
+        index = _Index()
+        try:
+            city_rows = db.execute(text(LOAD_SQL)).all()
+            alias_rows = db.execute(text(ALIASES_SQL)).all()
+        except Exception:
+            # Dictionary tables missing (older database): resolve nothing and
+            # let callers fall back to substring matching.
+            db.rollback()
+            return index
+
+        regions: Dict[str, List[str]] = {}
+        for name, region, latitude, longitude in city_rows:
+            location = (float(latitude), float(longitude)) if latitude is not None and longitude is not None else None
+            index.cities[name] = _City(name, region, location)
+            index.targets[normalize_city(name)] = ("exact", [name])
+            if region:
+                regions.setdefault(region, []).append(name)
+
+        for region, names in regions.items():
+            index.targets.setdefault(normalize_city(region), ("region", sorted(names)))
+        for alias, name in alias_rows:
+            index.targets.setdefault(normalize_city(alias), ("alias", [name]))
+
+        index.keys = sorted(index.targets)
+        return index
+
+    def resolve(self, value: Optional[str]) -> Optional[CityMatch]:
+        """Map free-form input to canonical city names, or ``None`` if unknown."""
+        if not value:
+            return None
+        index = self._index
+        key = normalize_city(value)
+        if not key:
+            return None
+
+        target = index.targets.get(key)
+        if target is None:
+            target = self._longest_leading_alias(index, key) or self._unique_prefix(index, key)
+        if target is None:
+            return None
+
+        kind, cities = target
+        return CityMatch(query=value, cities=list(cities), match=kind, region=index.cities[cities[0]].region)
+
+    @staticmethod
+    def _longest_leading_alias(index: _Index, key: str) -> Optional[Tuple[str, List[str]]]:
+        # "jakarta selatan" -> "jakarta": drop trailing words until a known key remains
+        words = key.split(" ")
+        for end in range(len(words) - 1, 0, -1):
+            target = index.targets.get(" ".join(words[:end]))
+            if target is not None:
+                return target
+        return None
+
+    @staticmethod
+    def _unique_prefix(index: _Index, key: str) -> Optional[Tuple[str, List[str]]]:
+        if len(key) < 3:
+            return None
+        start = bisect.bisect_left(index.keys, key)
+        found: Optional[Tuple[str, List[str]]] = None
+        for candidate in index.keys[start:]:
+            if not candidate.startswith(key):
+                break
+            target = index.targets[candidate]
+            if found is not None and found[1] != target[1]:
+                return None  # ambiguous
+            found = target
+        return found
+
+    def nearby(self, cities: List[str], limit: int = 5) -> List[str]:
+        """Other cities near ``cities``: same region first, then by distance."""
+        index = self._index
+        origins = [index.cities[c] for c in cities if c in index.cities]
+        if not origins:
+            return []
+        regions = {o.region for o in origins if o.region}
+        candidates = []
+        for city in index.cities.values():
+            if city.name in cities:
+                continue
+            distances = [
+                _distance_km(o.location, city.location)
+                for o in origins if o.location and city.location
+            ]
+            distance = min(distances) if distances else None
+            same_region = city.region in regions
+            if not same_region and (distance is None or distance > self.max_nearby_km):
+                continue
+            candidates.append((not same_region, distance if distance is not None else float("inf"), city.name))
+        return [name for _, _, name in sorted(candidates)[:limit]]
@@ -0,0 +1,194 @@
+"""
+Read-replica routing for car_service.
+
+Read-only endpoints take their session from ``ReplicaRouter.acquire()``,
+which picks the healthy replica with the fewest outstanding requests in
+this worker. Writes, admin ingestion and the change feed stay on the
+primary engine.
+
+A background check measures each replica's replay lag and replayed WAL
+position; a replica that is unreachable or lags more than
+``max_lag_seconds`` stops receiving reads until it catches up, and when no
+replica qualifies reads go to the primary.
+
+Read results are cached under the catalog version, so ``acquire(min_lsn)``
+also skips replicas that have not yet replayed up to ``min_lsn``, the
+primary's WAL position when that version started. Otherwise a lagging
+replica could fill the new version's caches with rows from before the
+write. ``min_lsn=None`` (position unknown) sends the read to the primary.
+SQLite URLs are accepted as stand-ins for local testing (lag and WAL
+position are always 0).
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+# Replay lag in seconds (0 on a primary or a replica that has replayed all
+# WAL it received) and the WAL position replayed, as a byte offset
+LAG_SQL = """
+SELECT
+    CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag,
+    pg_wal_lsn_diff(
+        CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END,
+        '0/0'
+    ) AS replayed_lsn
+"""
+PRIMARY_LSN_SQL = "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')"
+
+
+def current_lsn(db) -> int:
+    """The primary's WAL position as a byte offset; 0 on databases without WAL."""
+    if db.get_bind().dialect.name != "postgresql":
+        return 0
+    return int(db.execute(text(PRIMARY_LSN_SQL)).scalar())
+
+
+def display_url(url: str) -> str:
+    """URL without credentials, for logs and metrics."""
+    parts = urlsplit(url)
+    if parts.scheme.startswith("sqlite"):
+        return url
+    host = parts.hostname or ""
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    return f"{parts.scheme}://{host}{parts.path}"
+
+
+def pool_metrics(engine) -> Dict[str, Any]:
+    pool = engine.pool
+    metrics: Dict[str, Any] = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            metrics[name] = method()
+    return metrics
+
+
+class Replica:
+    def __init__(self, url: str, engine_options: Dict[str, Any]):
+        self.url = url
+        self.name = display_url(url)
+        self.engine_options = engine_options
+        self.engine = None
+        self.in_flight = 0
+        self.routed = 0
+        self.lag_seconds: Optional[float] = None
+        self.replayed_lsn: Optional[int] = None
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def get_engine(self):
+        if self.engine is None:
+            self.engine = create_engine(self.url, **self.engine_options)
+        return self.engine
+
+
+class ReplicaRouter:
+    def __init__(
+        self,
+        urls: List[str],
+        engine_options: Callable[[str], Dict[str, Any]],
+        max_lag_seconds: float = 5.0,
+    ):
+        self.replicas = [Replica(url, engine_options(url)) for url in urls]
+        self.max_lag_seconds = max_lag_seconds
+        self.primary_fallbacks = 0
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def _after_fork(self) -> None:
+        # Same as the primary engine: the child builds its own pools
+        self._lock = threading.Lock()
+        for replica in self.replicas:
+            if replica.engine is not None:
+                replica.engine.dispose(close=False)
+            replica.engine = None
+            replica.in_flight = 0
+
+    def _eligible(self, replica: Replica) -> bool:
+        if not replica.healthy:
+            return False
+        return replica.lag_seconds is None or replica.lag_seconds <= self.max_lag_seconds
+
+    @staticmethod
+    def _replayed(replica: Replica, min_lsn: Optional[int]) -> bool:
+        return min_lsn is not None and replica.replayed_lsn is not None and replica.replayed_lsn >= min_lsn
+
+    def acquire(self, min_lsn: Optional[int] = None) -> Optional[Replica]:
+        """Replica with the fewest outstanding requests that has replayed ``min_lsn``, or ``None`` for the primary."""
+        if not self.replicas:
+            return None
+        with self._lock:
+            candidates = [r for r in self.replicas if self._eligible(r) and self._replayed(r, min_lsn)]
+            if not candidates:
+                self.primary_fallbacks += 1
+                return None
+            replica = min(candidates, key=lambda r: (r.in_flight, r.routed))
+            replica.in_flight += 1
+            replica.routed += 1
+            return replica
+
+    def release(self, replica: Optional[Replica]) -> None:
+        if replica is None:
+            return
+        with self._lock:
+            replica.in_flight -= 1
+
+    def check_lag(self) -> None:
+        """Measure every replica's lag; blocking, call from a thread."""
+        for replica in self.replicas:
+            try:
+                engine = replica.get_engine()
+                with engine.connect() as conn:
+                    if engine.dialect.name == "postgresql":
+                        row = conn.execute(text(LAG_SQL)).one()
+                        lag, replayed_lsn = float(row.lag or 0), int(row.replayed_lsn or 0)
+                    else:
+                        conn.execute(text("SELECT 1"))
+                        lag, replayed_lsn = 0.0, 0
+                replica.lag_seconds = lag
+                replica.replayed_lsn = replayed_lsn
+                replica.healthy = True
+                replica.last_error = None
+            except Exception as e:
+                if replica.healthy:
+                    logger.warning(f"Replica {replica.name} unavailable: {e}")
+                replica.healthy = False
+                replica.last_error = str(e)
+            replica.checked_at = time.time()
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        result = []
+        for replica in self.replicas:
+            entry = {
+                "name": replica.name,
+                "healthy": replica.healthy,
+                "eligible": self._eligible(replica),
+                "lag_seconds": replica.lag_seconds,
+                "replayed_lsn": replica.replayed_lsn,
+                "in_flight": replica.in_flight,
+                "routed": replica.routed,
+                "last_error": replica.last_error,
+                "checked_at": replica.checked_at,
+            }
+            if replica.engine is not None:
+                entry.update(pool_metrics(replica.engine))
+            result.append(entry)
+        return result
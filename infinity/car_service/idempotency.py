@@ -0,0 +1,116 @@
+"""
+Idempotent execution of expensive requests (chat turns).
+
+Retries and double-clicks send the same chat message more than once. Each
+request carries a key (the ``Idempotency-Key`` header, or a hash of session
+id and message); requests with the same key share one execution:
+
+* while the first one is running, duplicates await the same task;
+* once it finished, its result is replayed for ``ttl_seconds`` from a
+  bounded LRU of completed results. The window can be set per call, so
+  keys derived from the message get a shorter one than client keys.
+
+The running task is shielded from its caller, so a client that disconnects
+does not cancel the work other duplicates are waiting for. Results the
+caller marks as not cacheable (fallbacks after an upstream failure) are
+shared with in-flight duplicates but not replayed, so a later retry gets a
+fresh attempt.
+
+State is per process and per event loop; with several workers main.py
+routes each key to one owner worker.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+def fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Completed:
+    fingerprint: str
+    value: Any
+    expires_at: float
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float = 120.0, max_entries: int = 2048):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._completed: "OrderedDict[str, _Completed]" = OrderedDict()
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.executed = 0
+        self.joined = 0
+        self.replayed = 0
+
+    async def run(
+        self,
+        key: str,
+        request_fingerprint: str,
+        compute: Callable[[], Awaitable[Tuple[Any, bool]]],
+        ttl_seconds: Optional[float] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Result for ``key`` and how it was obtained: ``new``, ``joined`` or ``replayed``.
+
+        ``compute`` returns ``(value, cacheable)``. ``ttl_seconds`` overrides
+        the replay window for this key; 0 only joins in-flight duplicates.
+        """
+        entry = self._completed.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                if entry.fingerprint != request_fingerprint:
+                    raise IdempotencyConflict(key)
+                self._completed.move_to_end(key)
+                self.replayed += 1
+                return entry.value, "replayed"
+            del self._completed[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            if in_flight[0] != request_fingerprint:
+                raise IdempotencyConflict(key)
+            self.joined += 1
+            value, _ = await asyncio.shield(in_flight[1])
+            return value, "joined"
+
+        task = asyncio.ensure_future(compute())
+        self._in_flight[key] = (request_fingerprint, task)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        task.add_done_callback(lambda done: self._finish(key, request_fingerprint, ttl, done))
+        self.executed += 1
+        value, _ = await asyncio.shield(task)
+        return value, "new"
+
+    def _finish(self, key: str, request_fingerprint: str, ttl_seconds: float, task: asyncio.Future) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        value, cacheable = task.result()
+        if not cacheable or ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        self._completed[key] = _Completed(request_fingerprint, value, time.monotonic() + ttl_seconds)
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "completed": len(self._completed),
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "joined": self.joined,
+            "replayed": self.replayed,
+        }
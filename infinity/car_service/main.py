@@ -1,17 +1,24 @@
-from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field, ConfigDict
-from sqlalchemy import create_engine, Column, String, Integer, ForeignKey, Text, DateTime, func, Index, and_, JSON, DECIMAL, DATE, BOOLEAN
+from sqlalchemy import create_engine, Column, String, Integer, ForeignKey, Text, DateTime, func, Index, and_, case, JSON, DECIMAL, DATE, BOOLEAN
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
 import os
+import io
 import json
+import statistics
+import tempfile
 from typing import Optional, List, Dict, Any, Tuple
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 import uvicorn
 from contextlib import contextmanager
 import logging
+import threading
+import time
 import uuid
 from datetime import date, datetime
 from pytz import timezone as pytz_timezone
@@ -20,6 +27,16 @@ import httpx
 import asyncio
 from copy import deepcopy
 from urllib.parse import urlencode
+from tool_output import ToolResultCache, compact_payload, estimate_tokens, parse_fields
+from serving import current_worker_index, owner_worker_url, peer_worker_urls, run_workers
+from stock_loader import detect_format, load_stock
+from catalog_snapshot import SnapshotStore, choose_encoding, choose_media_type
+from catalog_feed import FEED_TABLES, current_version, feed_installed, fetch_changes, install_change_feed
+from city_resolver import CityResolver
+from db_routing import ReplicaRouter, current_lsn, display_url, pool_metrics
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+from query_profiler import QueryProfiler
+from tracing import TraceExporter, current_request_id, end_trace, propagation_headers, span, start_trace
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -41,10 +58,273 @@ CHATBOT_CONFIG = {
     "webhook_timeout": int(os.getenv("WEBHOOK_TIMEOUT", "30"))  # timeout dalam detik
 }
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Deduplication of repeated /chat requests (Idempotency-Key or session id + message)
+CHAT_IDEMPOTENCY_CONFIG = {
+    "ttl_seconds": float(os.getenv("CHAT_IDEMPOTENCY_TTL", "120")),  # lama jawaban disimpan untuk replay (detik)
+    "max_entries": int(os.getenv("CHAT_IDEMPOTENCY_MAX_ENTRIES", "2048")),  # per worker
+}
+# Keys derived from session id + message only catch double-clicks and retries;
+# a user may send the same message again on purpose ("ya") a little later.
+CHAT_AUTO_KEY_PREFIX = "auto:"
+CHAT_AUTO_KEY_TTL = float(os.getenv("CHAT_IDEMPOTENCY_AUTO_TTL", "5"))  # replay kunci otomatis (detik), 0 = hanya yang sedang berjalan
+
+# Read replicas for read-only endpoints (comma-separated URLs, empty = primary only)
+REPLICA_CONFIG = {
+    "urls": [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS_CAR", "").split(",") if u.strip()],
+    "max_lag_seconds": float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5")),  # di atas ini baca dari primary
+    "check_interval": float(os.getenv("REPLICA_CHECK_INTERVAL", "5")),
+}
+
+# Serving configuration
+SERVING_CONFIG = {
+    "host": os.getenv("CAR_SERVICE_HOST", "0.0.0.0"),
+    "port": int(os.getenv("CAR_SERVICE_PORT", "8007")),
+    "workers": int(os.getenv("CAR_SERVICE_WORKERS", "1")),  # jumlah proses worker
+    "worker_base_port": int(os.getenv("CAR_SERVICE_WORKER_BASE_PORT", "18007")),  # port internal per worker
+    "db_pool_size": int(os.getenv("DB_POOL_SIZE", "5")),  # koneksi per worker
+    "db_max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "cache_warmup": os.getenv("CACHE_WARMUP", "true").lower() == "true",
+}
+
+# Request tracing configuration
+TRACING_CONFIG = {
+    "server_timing": os.getenv("SERVER_TIMING", "true").lower() == "true",  # kirim header Server-Timing
+    "exporter": os.getenv("TRACE_EXPORTER", "none").lower(),  # none, file, atau otlp
+    "file": os.getenv("TRACE_FILE", "/tmp/car_service_traces.jsonl"),
+    "otlp_endpoint": os.getenv("OTLP_TRACES_ENDPOINT", "http://otel-collector:4318/v1/traces"),
+}
+
+# Slow-query profiler (exposed on /debug/queries)
+QUERY_PROFILER_CONFIG = {
+    "enabled": os.getenv("QUERY_PROFILER", "false").lower() == "true",
+    "sample_rate": float(os.getenv("QUERY_PROFILER_SAMPLE_RATE", "0.1")),  # fraksi query yang diagregasi
+    "slow_ms": float(os.getenv("QUERY_SLOW_MS", "100")),  # query di atas ambang ini selalu dicatat
+    "explain": os.getenv("QUERY_EXPLAIN", "true").lower() == "true",  # ambil EXPLAIN (ANALYZE, BUFFERS)
+    "explain_interval": float(os.getenv("QUERY_EXPLAIN_INTERVAL", "300")),  # detik antar EXPLAIN per query
+    "worst_size": int(os.getenv("QUERY_PROFILER_WORST", "50")),
+}
+
+# Catalog change feed (Postgres triggers -> /catalog/changes)
+CATALOG_FEED_CONFIG = {
+    "poll_interval": float(os.getenv("CATALOG_FEED_POLL_SECONDS", "5")),  # cek versi katalog, 0 = nonaktif
+    "max_page_size": int(os.getenv("CATALOG_FEED_MAX_PAGE", "5000")),
+}
+
+# Admin endpoints (bulk ingestion) are disabled unless a token is configured
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+
+# MCP tool output configuration
+TOOL_OUTPUT_CONFIG = {
+    "compact_mcp": os.getenv("MCP_COMPACT_OUTPUT", "true").lower() == "true",  # ringkas respons tool untuk LLM
+    "token_budget": int(os.getenv("MCP_TOOL_TOKEN_BUDGET", "800")),  # perkiraan token maksimum per respons tool
+    "max_cell_chars": int(os.getenv("MCP_TOOL_CELL_CHARS", "80")),  # panjang maksimum satu sel teks
+    "cache_size": int(os.getenv("MCP_TOOL_CACHE_SIZE", "256")),
+}
+
+# Headers used by the MCP client (and optionally by other callers) to ask for
+# compact tool output. They are headers rather than query parameters so they
+# do not show up in the tool schemas the LLM has to read.
+TOOL_CALLER_HEADER = "x-tool-caller"
+TOOL_FORMAT_HEADER = "x-tool-format"
+TOOL_FIELDS_HEADER = "x-tool-fields"
+TOOL_BUDGET_HEADER = "x-tool-token-budget"
+
+# Default column projection for compact tool output, keyed by endpoint name.
+# IDs are kept so the agent can chain follow-up calls (compare, stock).
+COMPACT_TOOL_FIELDS = {
+    "get_all_cars": ["id", "model_name", "segment", "variant_count"],
+    "get_car_variants": ["id", "variant_name", "price", "transmission", "fuel_type", "seating_capacity"],
+    "get_variant_detail": [
+        "id", "model_name", "variant_name", "segment", "price", "engine_spec", "transmission",
+        "fuel_type", "seating_capacity", "target_demographic", "use_case", "top_features", "benefits_summary",
+    ],
+    "get_car_recommendations": [
+        "id", "model_name", "variant_name", "price", "transmission", "fuel_type",
+        "seating_capacity", "target_demographic", "use_case",
+    ],
+    "compare_variants": [
+        "id", "model_name", "variant_name", "price", "engine_spec", "transmission",
+        "fuel_type", "seating_capacity", "top_features",
+    ],
+    "get_active_promotions": [
+        "variant_id", "model_name", "variant_name", "promo_title",
+        "original_price", "discounted_price", "end_date",
+    ],
+    "get_recommendation_facets": ["facet", "value", "count"],
+    "get_variant_accessories": ["id", "name", "price"],
+    "get_variant_quote": ["type", "item", "amount"],
+    "get_stock_info": ["variant_id", "model_name", "variant_name", "city", "stock_quantity", "indent_estimate_weeks"],
+    "get_stock_summary": [
+        "variant_id", "model_name", "variant_name", "total_units", "cities_with_stock",
+        "min_indent_weeks", "median_indent_weeks",
+    ],
+}
+
+# The engine is created lazily so that every worker process builds its own
+# connection pool after fork instead of sharing sockets with its parent.
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the SQLAlchemy engine owned by the current process."""
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != pid:
+                _engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+                _engine_pid = pid
+    return _engine
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=SERVING_CONFIG["db_pool_size"],
+            max_overflow=SERVING_CONFIG["db_max_overflow"],
+        )
+    return options
+
+
+def _discard_engine_after_fork():
+    # Drop the parent's pool without closing its connections; they still
+    # belong to the parent. The child creates a fresh engine on first use.
+    global _engine, _engine_pid
+    if _engine is not None:
+        _engine.dispose(close=False)
+    _engine = None
+    _engine_pid = None
+
+
+os.register_at_fork(after_in_child=_discard_engine_after_fork)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+replica_router = ReplicaRouter(
+    REPLICA_CONFIG["urls"],
+    engine_options,
+    max_lag_seconds=REPLICA_CONFIG["max_lag_seconds"],
+)
 Base = declarative_base()
 
+
+class CatalogVersion:
+    """
+    Monotonic version of the catalog data; bump it after every catalog write.
+
+    ``lsn`` is a primary WAL position that covers every catalog write this
+    process knows of. Reads (and so everything cached under ``value``) only
+    go to replicas that have replayed that far. It is ``None`` while
+    unknown (at startup, or when reading the position failed) and then all
+    reads go to the primary until ``settle()`` records a fresh position.
+    """
+
+    def __init__(self):
+        self._value = 1
+        self._feed_version = None
+        self._lsn = 0
+        self._lsn_known = False
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    @property
+    def lsn(self) -> Optional[int]:
+        return self._lsn if self._lsn_known else None
+
+    def _require(self, lsn: Optional[int]) -> None:
+        if lsn is None:
+            self._lsn_known = False
+        else:
+            self._lsn = max(self._lsn, lsn)
+
+    def bump(self, lsn: Optional[int] = None) -> int:
+        """``lsn``: the primary's WAL position read after the write committed."""
+        with self._lock:
+            self._value += 1
+            self._require(lsn)
+            return self._value
+
+    def observe(self, feed_version: int, lsn: Optional[int] = None) -> None:
+        """Bump when the shared change-feed version moved (a write in another worker or process)."""
+        with self._lock:
+            previous = self._feed_version
+            self._feed_version = feed_version
+            if previous is not None and previous != feed_version:
+                self._value += 1
+                self._require(lsn)
+
+    def settle(self, seen_value: int, lsn: int) -> bool:
+        """
+        Make the position known again. ``lsn`` must have been read after
+        ``value`` was ``seen_value``; a bump in between means it may not
+        cover that write, so nothing changes and the caller retries later.
+        """
+        with self._lock:
+            if self._value != seen_value:
+                return False
+            self._lsn = max(self._lsn, lsn)
+            self._lsn_known = True
+            return True
+
+
+catalog_version = CatalogVersion()
+tool_cache = ToolResultCache(maxsize=TOOL_OUTPUT_CONFIG["cache_size"])
+stock_summary_cache = ToolResultCache(maxsize=128)
+facets_cache = ToolResultCache(maxsize=128)
+chat_idempotency = IdempotencyStore(**CHAT_IDEMPOTENCY_CONFIG)
+city_resolver = CityResolver()
+catalog_snapshots = SnapshotStore()
+trace_exporter = TraceExporter(
+    TRACING_CONFIG["exporter"],
+    service_name="car_service",
+    file_path=TRACING_CONFIG["file"],
+    otlp_endpoint=TRACING_CONFIG["otlp_endpoint"],
+)
+
+query_profiler = QueryProfiler(**QUERY_PROFILER_CONFIG)
+query_profiler.install()
+
+
+def resolve_city(db: Session, city: str):
+    """Resolve user input to canonical city names; ``None`` when the dictionary does not know it."""
+    city_resolver.ensure_loaded(db, catalog_version.value)
+    return city_resolver.resolve(city)
+
+
+def city_filter(column, db: Session, city: str):
+    """
+    Equality / IN filter on canonical city names (uses the city indexes).
+
+    Input the dictionary cannot resolve falls back to the old substring
+    match so unknown spellings still find something.
+    """
+    match = resolve_city(db, city)
+    if match is None:
+        return column.ilike(f"%{city}%")
+    if len(match.cities) == 1:
+        return column == match.cities[0]
+    return column.in_(match.cities)
+
+
+def read_primary_lsn() -> Optional[int]:
+    try:
+        with SessionLocal(bind=get_engine()) as db:
+            return current_lsn(db)
+    except Exception as e:
+        logger.warning(f"Failed to read the primary WAL position: {e}")
+        return None
+
+
+def invalidate_stock_caches():
+    """Call after any write to stock_inventory (blocking: reads the primary's WAL position)."""
+    catalog_version.bump(read_primary_lsn() if replica_router.enabled else 0)
+    stock_summary_cache.clear()
+
 # =================================================================
 # SQLALCHEMY MODELS
 # =================================================================
@@ -138,6 +418,24 @@ class DressCode(Base):
     day_of_week = Column(String(20), nullable=False)
     attire_description = Column(Text, nullable=False)
 
+class Region(Base):
+    __tablename__ = "regions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), nullable=False, unique=True)
+
+class City(Base):
+    __tablename__ = "cities"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), nullable=False, unique=True)  # nama kanonik, sama dengan kolom city di tabel lain
+    region_id = Column(Integer, ForeignKey("regions.id"))
+    latitude = Column(DECIMAL(9, 6))
+    longitude = Column(DECIMAL(9, 6))
+
+class CityAlias(Base):
+    __tablename__ = "city_aliases"
+    alias = Column(String(100), primary_key=True)
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
+
 # =================================================================
 # PYDANTIC SCHEMAS
 # =================================================================
@@ -212,6 +510,16 @@ class StockInventorySchema(BaseModel):
     class Config:
         from_attributes = True
 
+class StockSummarySchema(BaseModel):
+    variant_id: uuid.UUID
+    model_name: str
+    variant_name: str
+    segment: Optional[str]
+    total_units: int
+    cities_with_stock: List[str]
+    min_indent_weeks: Optional[int]
+    median_indent_weeks: Optional[float]
+
 class WorkshopSchema(BaseModel):
     id: uuid.UUID
     name: str
@@ -232,6 +540,24 @@ class CommunitySchema(BaseModel):
     class Config:
         from_attributes = True
 
+class QuoteLineSchema(BaseModel):
+    type: str  # vehicle, accessory, discount, total
+    item: str
+    id: Optional[uuid.UUID] = None
+    amount: Decimal
+
+class QuoteSchema(BaseModel):
+    variant_id: uuid.UUID
+    model_name: str
+    variant_name: str
+    vehicle_price: Decimal
+    accessories_total: Decimal
+    promotion_id: Optional[uuid.UUID] = None
+    promo_title: Optional[str] = None
+    promo_end_date: Optional[date] = None
+    discount: Decimal
+    total_price: Decimal
+
 class DressCodeSchema(BaseModel):
     id: int
     role: str
@@ -287,19 +613,133 @@ app.add_middleware(
 
 jakarta_tz = pytz_timezone('Asia/Jakarta')
 
+
+def wants_compact_output(request: Request) -> bool:
+    """Decide whether a request should receive compact tool output."""
+    requested_format = (request.headers.get(TOOL_FORMAT_HEADER) or "").lower()
+    if requested_format in ("compact", "table"):
+        return True
+    if requested_format == "json":
+        return False
+    return (
+        TOOL_OUTPUT_CONFIG["compact_mcp"]
+        and (request.headers.get(TOOL_CALLER_HEADER) or "").lower() == "mcp"
+    )
+
+
+@app.middleware("http")
+async def compact_tool_output(request: Request, call_next):
+    """
+    Render GET responses as token-budgeted tables for MCP tool callers.
+
+    Rendered results are cached per catalog version (and day, since active
+    promotions depend on the date), so identical tool invocations skip the
+    database entirely until the catalog changes.
+    """
+    if request.method != "GET" or not wants_compact_output(request):
+        return await call_next(request)
+
+    fields_override = parse_fields(request.headers.get(TOOL_FIELDS_HEADER))
+    try:
+        token_budget = int(request.headers.get(TOOL_BUDGET_HEADER) or TOOL_OUTPUT_CONFIG["token_budget"])
+    except ValueError:
+        token_budget = TOOL_OUTPUT_CONFIG["token_budget"]
+
+    cache_key = (
+        request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+        tuple(fields_override or ()),
+        token_budget,
+        catalog_version.value,
+        date.today().isoformat(),
+    )
+    cached = tool_cache.get(cache_key)
+    if cached:
+        status_code, media_type, body = cached
+        return Response(
+            content=body,
+            status_code=status_code,
+            media_type=media_type,
+            headers={"X-Tool-Cache": "hit", "X-Tool-Tokens": str(estimate_tokens(body))},
+        )
+
+    response = await call_next(request)
+
+    endpoint = request.scope.get("endpoint")
+    fields = fields_override or COMPACT_TOOL_FIELDS.get(getattr(endpoint, "__name__", ""))
+    if response.status_code != 200 or not fields:
+        return response
+
+    raw_body = b"".join([chunk async for chunk in response.body_iterator])
+    passthrough = Response(
+        content=raw_body,
+        status_code=response.status_code,
+        headers=dict(response.headers),
+    )
+    try:
+        payload = json.loads(raw_body)
+    except ValueError:
+        return passthrough
+
+    with span("serialize", "compact tool table"):
+        table = compact_payload(
+            payload,
+            fields,
+            token_budget=token_budget,
+            max_cell_chars=TOOL_OUTPUT_CONFIG["max_cell_chars"],
+        )
+    if table is None:
+        return passthrough
+
+    media_type = "text/plain; charset=utf-8"
+    tool_cache.set(cache_key, (200, media_type, table))
+    return PlainTextResponse(
+        content=table,
+        headers={"X-Tool-Cache": "miss", "X-Tool-Tokens": str(estimate_tokens(table))},
+    )
+
+
 # Database dependency
 def get_db():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
     finally:
         db.close()
 
+@contextmanager
+def read_session():
+    """Session on the least busy in-sync replica, or the primary when none qualifies."""
+    # Only replicas that already show the current catalog version's writes
+    replica = replica_router.acquire(catalog_version.lsn)
+    db = SessionLocal(bind=replica.get_engine() if replica else get_engine())
+    try:
+        yield db
+    finally:
+        db.close()
+        replica_router.release(replica)
+
+def get_read_db():
+    """Dependency for read-only endpoints."""
+    with read_session() as db:
+        yield db
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_API_TOKEN")
+    if x_admin_token != ADMIN_API_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Car service starting up...")
-    # The database engine is created on module load.
-    # No need to initialize a separate pool.
+    logger.info("Car service starting up (worker=%s)...", current_worker_index())
+    # The database engine is created lazily per process on first use.
+    if SERVING_CONFIG["cache_warmup"]:
+        asyncio.create_task(warm_tool_cache())
+    if CATALOG_FEED_CONFIG["poll_interval"] > 0 and get_engine().dialect.name == "postgresql":
+        asyncio.create_task(follow_catalog_version())
+    if replica_router.enabled:
+        asyncio.create_task(monitor_replicas())
     try:
         for route in app.routes:
             methods = getattr(route, "methods", None)
@@ -308,6 +748,68 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"Failed to enumerate routes: {e}")
 
+def settle_catalog_lsn() -> None:
+    seen = catalog_version.value
+    lsn = read_primary_lsn()
+    if lsn is not None:
+        catalog_version.settle(seen, lsn)
+
+
+async def monitor_replicas():
+    """Keep replica lag current so lagging replicas stop receiving reads."""
+    while True:
+        if catalog_version.lsn is None:
+            await run_in_threadpool(settle_catalog_lsn)
+        await run_in_threadpool(replica_router.check_lag)
+        await asyncio.sleep(REPLICA_CONFIG["check_interval"])
+
+def catalog_feed_installed() -> bool:
+    with SessionLocal(bind=get_engine()) as db:
+        return feed_installed(db)
+
+def read_catalog_feed_version() -> Tuple[int, int]:
+    with SessionLocal(bind=get_engine()) as db:
+        version = current_version(db)
+        # Read after the version, so it covers every change counted in it
+        return version, current_lsn(db) if replica_router.enabled else 0
+
+
+async def follow_catalog_version():
+    """Invalidate this worker's caches when the catalog changes anywhere."""
+    while True:
+        try:
+            installed = await run_in_threadpool(catalog_feed_installed)
+            break
+        except Exception as e:
+            logger.warning(f"Failed to check for the catalog change feed: {e}")
+            await asyncio.sleep(CATALOG_FEED_CONFIG["poll_interval"])
+    if not installed:
+        # Checked once: without the feed there is nothing to poll
+        logger.info("Catalog change feed not installed, not polling it; run `python catalog_feed.py install` "
+                    "and restart to share cache invalidation between workers")
+        return
+
+    while True:
+        try:
+            catalog_version.observe(*await run_in_threadpool(read_catalog_feed_version))
+        except Exception as e:
+            logger.warning(f"Failed to read catalog feed version: {e}")
+        await asyncio.sleep(CATALOG_FEED_CONFIG["poll_interval"])
+
+# Tool calls the agent makes on almost every conversation. Warming them fills
+# this worker's compact tool cache before the first user arrives.
+WARMUP_TOOL_PATHS = ["/cars", "/promotions", "/recommendations", "/recommendations/facets", "/stock", "/stock/summary"]
+
+
+async def warm_tool_cache():
+    """Populate this worker's tool cache with the most common tool calls."""
+    for path in WARMUP_TOOL_PATHS:
+        try:
+            await mcp_http_client.get(path)
+        except Exception as e:
+            logger.warning(f"Cache warm-up for {path} failed: {e}")
+    logger.info("Tool cache warmed: %s", tool_cache.stats())
+
 @app.get("/debug/routes")
 async def list_routes():
     routes = []
@@ -319,6 +821,121 @@ async def list_routes():
         })
     return {"routes": routes}
 
+@app.get("/debug/queries")
+async def query_profile(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_ms", pattern="^(total_ms|mean_ms|max_ms|calls|slow_calls)$"),
+    _: None = Depends(require_admin),
+):
+    return {"worker": current_worker_index(), **query_profiler.report(limit=limit, order_by=order_by)}
+
+@app.delete("/debug/queries")
+async def reset_query_profile(_: None = Depends(require_admin)):
+    query_profiler.reset()
+    return {"status": "reset"}
+
+@app.get("/debug/db")
+async def database_stats(_: None = Depends(require_admin)):
+    return {
+        "worker": current_worker_index(),
+        "primary": {"name": display_url(DATABASE_URL), **pool_metrics(get_engine())},
+        "replicas": replica_router.metrics(),
+        "max_lag_seconds": replica_router.max_lag_seconds,
+        "primary_fallbacks": replica_router.primary_fallbacks,
+        "catalog_lsn": catalog_version.lsn,
+    }
+
+@app.get("/debug/tool-cache")
+async def tool_cache_stats(_: None = Depends(require_admin)):
+    return {"catalog_version": catalog_version.value, **tool_cache.stats()}
+
+@app.get("/debug/chat-idempotency")
+async def chat_idempotency_stats(_: None = Depends(require_admin)):
+    return {"worker": current_worker_index(), **chat_idempotency.stats()}
+
+MCP_FORWARDED_HEADER = "x-mcp-forwarded"
+
+
+@app.middleware("http")
+async def mcp_session_affinity(request: Request, call_next):
+    """
+    Route MCP messages to the worker that owns the SSE session.
+
+    With several workers the kernel may hand ``POST /mcp/messages/`` to a
+    worker that never saw the matching ``GET /mcp`` stream. That worker
+    answers 404, so the message is replayed against the other workers'
+    private ports until the owner accepts it.
+    """
+    if (
+        request.method != "POST"
+        or not request.url.path.startswith("/mcp/messages")
+        or request.headers.get(MCP_FORWARDED_HEADER)
+    ):
+        return await call_next(request)
+
+    peers = peer_worker_urls()
+    if not peers:
+        return await call_next(request)
+
+    body = await request.body()
+    response = await call_next(request)
+    if response.status_code != 404:
+        return response
+
+    headers = {
+        "content-type": request.headers.get("content-type", "application/json"),
+        MCP_FORWARDED_HEADER: "1",
+        **propagation_headers(),
+    }
+    target = request.url.path
+    if request.url.query:
+        target = f"{target}?{request.url.query}"
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        for peer in peers:
+            try:
+                with span("upstream", "mcp peer forward", peer=peer):
+                    peer_response = await client.post(f"{peer}{target}", content=body, headers=headers)
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to forward MCP message to {peer}: {e}")
+                continue
+            if peer_response.status_code != 404:
+                return Response(
+                    content=peer_response.content,
+                    status_code=peer_response.status_code,
+                    headers=dict(peer_response.headers),
+                )
+
+    return response
+
+
+@app.middleware("http")
+async def request_tracing(request: Request, call_next):
+    """
+    Bind a trace to every request and report its timing breakdown.
+
+    The request id from the gateway (``X-Request-ID``/``traceparent``) is
+    reused so one id follows a chat turn across services; spans recorded
+    while handling the request come back in ``Server-Timing``.
+    """
+    trace, token = start_trace(request.headers, f"{request.method} {request.url.path}")
+    trace.attributes.update({"http.method": request.method, "http.path": request.url.path})
+    try:
+        response = await call_next(request)
+    except Exception:
+        trace.attributes["error"] = True
+        raise
+    finally:
+        trace.end_ns = time.time_ns()
+        end_trace(token)
+        trace_exporter.submit(trace)
+
+    trace.attributes["http.status_code"] = response.status_code
+    response.headers["X-Request-ID"] = trace.request_id
+    if TRACING_CONFIG["server_timing"]:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
 @app.post("/mcp")
 async def mcp_post_bridge(request: Request) -> Response:
     """
@@ -329,7 +946,8 @@ async def mcp_post_bridge(request: Request) -> Response:
     try:
         raw_body = await request.body()
         headers = {
-            "content-type": request.headers.get("content-type", "application/json")
+            "content-type": request.headers.get("content-type", "application/json"),
+            **propagation_headers(),
         }
         query_params = dict(request.query_params)
 
@@ -384,14 +1002,15 @@ async def mcp_post_bridge(request: Request) -> Response:
             raw_body = json.dumps(fallback_payload).encode("utf-8")
 
         query_params["session_id"] = session_id
-        target_url = "http://localhost:8007/mcp/messages/"
+        target_url = f"http://localhost:{SERVING_CONFIG['port']}/mcp/messages/"
         if query_params:
             target_url = f"{target_url}?{urlencode(query_params)}"
 
         logger.info(f"Bridging POST /mcp request to {target_url}")
 
         async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(target_url, content=raw_body, headers=headers)
+            with span("upstream", "mcp bridge"):
+                resp = await client.post(target_url, content=raw_body, headers=headers)
 
         # Return the response from the message endpoint directly to the original caller (N8N)
         return Response(
@@ -416,7 +1035,7 @@ async def health_check():
 # =================================================================
 
 @app.get("/cars", response_model=Dict[str, Any], operation_id="list cars")
-async def get_all_cars(db: Session = Depends(get_db)):
+def get_all_cars(db: Session = Depends(get_read_db)):
     """Mendapatkan semua model mobil"""
     try:
         cars_with_counts = db.query(
@@ -438,7 +1057,7 @@ async def get_all_cars(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/cars/{car_id}/variants", response_model=Dict[str, Any], operation_id="list car variants")
-async def get_car_variants(car_id: uuid.UUID, db: Session = Depends(get_db)):
+def get_car_variants(car_id: uuid.UUID, db: Session = Depends(get_read_db)):
     """Mendapatkan semua varian dari model mobil tertentu"""
     try:
         variants = db.query(CarVariant)\
@@ -462,7 +1081,7 @@ async def get_car_variants(car_id: uuid.UUID, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/variants/{variant_id}", response_model=Dict[str, Any])
-async def get_variant_detail(variant_id: uuid.UUID, db: Session = Depends(get_db)):
+def get_variant_detail(variant_id: uuid.UUID, db: Session = Depends(get_read_db)):
     """Mendapatkan detail lengkap varian mobil"""
     try:
         variant = db.query(CarVariant).filter(CarVariant.id == variant_id).first()
@@ -488,8 +1107,35 @@ async def get_variant_detail(variant_id: uuid.UUID, db: Session = Depends(get_db
 # RECOMMENDATION ENDPOINTS
 # =================================================================
 
+def recommendation_filters(
+    budget_min: Optional[float] = None,
+    budget_max: Optional[float] = None,
+    use_case: Optional[str] = None,
+    target_demographic: Optional[str] = None,
+    seating_capacity: Optional[int] = None,
+    fuel_type: Optional[str] = None,
+    transmission: Optional[str] = None,
+) -> List[Any]:
+    """Filter conditions on CarVariant shared by /recommendations and its facets."""
+    conditions = []
+    if budget_min is not None:
+        conditions.append(CarVariant.price >= Decimal(budget_min))
+    if budget_max is not None:
+        conditions.append(CarVariant.price <= Decimal(budget_max))
+    if use_case:
+        conditions.append(CarVariant.use_case.ilike(f"%{use_case}%"))
+    if target_demographic:
+        conditions.append(CarVariant.target_demographic.ilike(f"%{target_demographic}%"))
+    if seating_capacity:
+        conditions.append(CarVariant.seating_capacity >= seating_capacity)
+    if fuel_type:
+        conditions.append(CarVariant.fuel_type.ilike(f"%{fuel_type}%"))
+    if transmission:
+        conditions.append(CarVariant.transmission.ilike(f"%{transmission}%"))
+    return conditions
+
 @app.get("/recommendations", response_model=Dict[str, Any], operation_id="get car recommendations")
-async def get_car_recommendations(
+def get_car_recommendations(
     budget_min: Optional[float] = Query(None, description="Budget minimum"),
     budget_max: Optional[float] = Query(None, description="Budget maximum"),
     use_case: Optional[str] = Query(None, description="Kegunaan mobil (daily, travel, business, off-road)"),
@@ -497,32 +1143,13 @@ async def get_car_recommendations(
     seating_capacity: Optional[int] = Query(None, description="Kapasitas tempat duduk minimum"),
     fuel_type: Optional[str] = Query(None, description="Jenis bahan bakar"),
     transmission: Optional[str] = Query(None, description="Jenis transmisi"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Mendapatkan rekomendasi mobil berdasarkan kriteria"""
     try:
-        query = db.query(CarVariant).join(Car)
-        
-        if budget_min is not None:
-            query = query.filter(CarVariant.price >= Decimal(budget_min))
-        
-        if budget_max is not None:
-            query = query.filter(CarVariant.price <= Decimal(budget_max))
-        
-        if use_case:
-            query = query.filter(CarVariant.use_case.ilike(f"%{use_case}%"))
-        
-        if target_demographic:
-            query = query.filter(CarVariant.target_demographic.ilike(f"%{target_demographic}%"))
-        
-        if seating_capacity:
-            query = query.filter(CarVariant.seating_capacity >= seating_capacity)
-        
-        if fuel_type:
-            query = query.filter(CarVariant.fuel_type.ilike(f"%{fuel_type}%"))
-        
-        if transmission:
-            query = query.filter(CarVariant.transmission.ilike(f"%{transmission}%"))
+        query = db.query(CarVariant).join(Car).filter(*recommendation_filters(
+            budget_min, budget_max, use_case, target_demographic, seating_capacity, fuel_type, transmission
+        ))
         
         recommendations = query.order_by(CarVariant.price).limit(10).all()
         
@@ -541,14 +1168,114 @@ async def get_car_recommendations(
         logger.error(f"Error getting recommendations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Price histogram bucket edges in Rupiah; labels are usable as budget_min-budget_max
+PRICE_HISTOGRAM_EDGES = [200_000_000, 300_000_000, 400_000_000, 500_000_000, 750_000_000, 1_000_000_000]
+FACET_COLUMNS = ("fuel_type", "transmission", "target_demographic", "use_case", "seating_capacity")
+# Columns holding comma-separated keywords ("Daily, Travel, Business"); the
+# use_case filter matches one keyword, so the facet counts keywords.
+KEYWORD_FACET_COLUMNS = ("use_case",)
+
+
+def price_bucket_label(index: int) -> str:
+    low = PRICE_HISTOGRAM_EDGES[index - 1] if index > 0 else 0
+    if index >= len(PRICE_HISTOGRAM_EDGES):
+        return f"{low}-"
+    return f"{low}-{PRICE_HISTOGRAM_EDGES[index]}"
+
+
+@app.get("/recommendations/facets", response_model=Dict[str, Any], operation_id="get recommendation facets")
+def get_recommendation_facets(
+    budget_min: Optional[float] = Query(None, description="Budget minimum"),
+    budget_max: Optional[float] = Query(None, description="Budget maximum"),
+    use_case: Optional[str] = Query(None, description="Kegunaan mobil"),
+    target_demographic: Optional[str] = Query(None, description="Target demografi"),
+    seating_capacity: Optional[int] = Query(None, description="Kapasitas tempat duduk minimum"),
+    fuel_type: Optional[str] = Query(None, description="Jenis bahan bakar"),
+    transmission: Optional[str] = Query(None, description="Jenis transmisi"),
+    db: Session = Depends(get_read_db)
+):
+    """Nilai filter yang tersedia untuk rekomendasi beserta jumlah varian, rentang kursi, dan histogram harga"""
+    try:
+        filters = (budget_min, budget_max, use_case, target_demographic, seating_capacity, fuel_type, transmission)
+        cache_key = ("facets", filters, catalog_version.value)
+        cached = facets_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        bucket = case(
+            *[(CarVariant.price < edge, i) for i, edge in enumerate(PRICE_HISTOGRAM_EDGES)],
+            else_=len(PRICE_HISTOGRAM_EDGES),
+        ).label("price_bucket")
+        # One pass: count every combination of facet values, then roll the
+        # combinations up into per-facet counts below.
+        cells = db.query(
+            *[getattr(CarVariant, c) for c in FACET_COLUMNS],
+            bucket,
+            func.count(CarVariant.id).label("variants"),
+            func.min(CarVariant.price).label("min_price"),
+            func.max(CarVariant.price).label("max_price"),
+        ).filter(*recommendation_filters(*filters))\
+         .group_by(*[getattr(CarVariant, c) for c in FACET_COLUMNS], bucket)\
+         .all()
+
+        counts: Dict[Tuple[str, Any], int] = {}
+        labels: Dict[Tuple[str, Any], str] = {}
+        total = 0
+        prices: List[Decimal] = []
+        seats: List[int] = []
+        for cell in cells:
+            total += cell.variants
+            prices += [cell.min_price, cell.max_price]
+            if cell.seating_capacity is not None:
+                seats.append(cell.seating_capacity)
+            for column in FACET_COLUMNS + ("price_bucket",):
+                value = getattr(cell, column)
+                if value is None:
+                    continue
+                if column not in KEYWORD_FACET_COLUMNS:
+                    counts[(column, value)] = counts.get((column, value), 0) + cell.variants
+                    continue
+                # Each keyword counts once per variant, whatever its case or spacing
+                keywords = {k.strip().casefold(): k.strip() for k in value.split(",") if k.strip()}
+                for key, keyword in keywords.items():
+                    counts[(column, key)] = counts.get((column, key), 0) + cell.variants
+                    labels[(column, key)] = min(labels.get((column, key), keyword), keyword)
+
+        rows = []
+        for column in FACET_COLUMNS:
+            values = sorted(
+                ((labels.get((c, v), v), n) for (c, v), n in counts.items() if c == column),
+                key=lambda x: (-x[1], str(x[0])),
+            )
+            rows += [{"facet": column, "value": v, "count": n} for v, n in values]
+        buckets = sorted((b, n) for (c, b), n in counts.items() if c == "price_bucket")
+        rows += [{"facet": "price", "value": price_bucket_label(b), "count": n} for b, n in buckets]
+
+        response = {
+            "status": "success",
+            "data": rows,
+            "summary": {
+                "total_variants": total,
+                "seating_min": min(seats) if seats else None,
+                "seating_max": max(seats) if seats else None,
+                "price_min": min(prices) if prices else None,
+                "price_max": max(prices) if prices else None,
+            }
+        }
+        facets_cache.set(cache_key, response)
+        return response
+    except Exception as e:
+        logger.error(f"Error getting recommendation facets: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # =================================================================
 # COMPARISON ENDPOINTS
 # =================================================================
 
 @app.get("/compare", response_model=Dict[str, Any], operation_id="compare variants")
-async def compare_variants(
+def compare_variants(
     variant_ids: str = Query(..., description="Comma-separated variant IDs"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Membandingkan beberapa varian mobil"""
     try:
@@ -590,8 +1317,8 @@ async def compare_variants(
 # ACCESSORIES ENDPOINTS
 # =================================================================
 
-@app.get("/variants/{variant_id}/accessories", response_model=Dict[str, Any])
-async def get_variant_accessories(variant_id: uuid.UUID, db: Session = Depends(get_db)):
+@app.get("/variants/{variant_id}/accessories", response_model=Dict[str, Any], operation_id="list variant accessories")
+def get_variant_accessories(variant_id: uuid.UUID, db: Session = Depends(get_read_db)):
     """Mendapatkan aksesoris yang tersedia untuk varian tertentu"""
     try:
         variant = db.query(CarVariant).filter(CarVariant.id == variant_id).first()
@@ -609,7 +1336,7 @@ async def get_variant_accessories(variant_id: uuid.UUID, db: Session = Depends(g
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/accessories", response_model=Dict[str, Any])
-async def get_all_accessories(db: Session = Depends(get_db)):
+def get_all_accessories(db: Session = Depends(get_read_db)):
     """Mendapatkan semua aksesoris"""
     try:
         accessories = db.query(Accessory).order_by(Accessory.name).all()
@@ -621,12 +1348,248 @@ async def get_all_accessories(db: Session = Depends(get_db)):
         logger.error(f"Error getting accessories: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# =================================================================
+# CATALOG SYNC ENDPOINTS
+# =================================================================
+
+@app.get("/catalog/changes", response_model=Dict[str, Any])
+def get_catalog_changes(
+    since: int = Query(0, ge=0, description="Versi katalog terakhir yang dimiliki klien"),
+    limit: int = Query(1000, ge=1, description="Jumlah perubahan maksimum per halaman"),
+    tables: Optional[str] = Query(None, description="Comma-separated table names"),
+    db: Session = Depends(get_db)
+):
+    """Perubahan katalog setelah versi tertentu, untuk sinkronisasi inkremental"""
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            raise HTTPException(status_code=501, detail="Catalog change feed requires PostgreSQL")
+
+        table_list = [t.strip() for t in (tables or "").split(',') if t.strip()] or None
+        unknown = [t for t in table_list or [] if t not in FEED_TABLES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+
+        feed = fetch_changes(db, since, min(limit, CATALOG_FEED_CONFIG["max_page_size"]), table_list)
+
+        return {
+            "status": "success",
+            "version": feed["version"],
+            "reset": feed["reset"],
+            "has_more": feed["has_more"],
+            "data": feed["changes"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting catalog changes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def build_catalog_snapshot(db: Session) -> Dict[str, Any]:
+    """Everything the frontend needs on first load, in one document."""
+    variants = db.query(CarVariant, Car.model_name)\
+        .join(Car, CarVariant.car_id == Car.id)\
+        .order_by(Car.model_name, CarVariant.price)\
+        .all()
+    variant_accessories = db.query(VariantAccessory.variant_id, VariantAccessory.accessory_id)\
+        .order_by(VariantAccessory.variant_id, VariantAccessory.accessory_id)\
+        .all()
+
+    stock: Dict[uuid.UUID, Dict[str, Any]] = {}
+    for s in db.query(StockInventory).order_by(StockInventory.city).all():
+        entry = stock.setdefault(s.variant_id, {
+            "variant_id": s.variant_id, "total_units": 0, "cities_with_stock": [], "min_indent_weeks": None,
+        })
+        entry["total_units"] += s.stock_quantity
+        if s.stock_quantity > 0:
+            entry["cities_with_stock"].append(s.city)
+        if s.indent_estimate_weeks is not None:
+            current = entry["min_indent_weeks"]
+            entry["min_indent_weeks"] = s.indent_estimate_weeks if current is None else min(current, s.indent_estimate_weeks)
+
+    variant_data = []
+    for v, model_name in variants:
+        v.model_name = model_name
+        variant_data.append(CarVariantSchema.model_validate(v))
+
+    return {
+        "date": date.today(),
+        "cars": get_all_cars(db)["data"],
+        "variants": variant_data,
+        "accessories": get_all_accessories(db)["data"],
+        "variant_accessories": [[va.variant_id, va.accessory_id] for va in variant_accessories],
+        "promotions": get_active_promotions(db)["data"],
+        "stock_summary": [stock[k] for k in sorted(stock, key=str)],
+    }
+
+
+def snapshot_response(request: Request, db: Session, cache_control: str, digest: Optional[str] = None) -> Response:
+    snapshot = catalog_snapshots.get(
+        (catalog_version.value, date.today().isoformat()),
+        lambda: build_catalog_snapshot(db),
+    )
+    if digest is not None and digest != snapshot.digest:
+        # An older build; the client should go back to /catalog/snapshot
+        raise HTTPException(status_code=404, detail="Snapshot is no longer current")
+
+    media_type = choose_media_type(request.headers.get("accept"))
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    etag = snapshot.etag(media_type, encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept, Accept-Encoding",
+        "X-Catalog-Snapshot": f"/catalog/snapshot/{snapshot.digest}",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    with span("serialize", "catalog snapshot"):
+        body = snapshot.body(media_type, encoding)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@app.get("/catalog/snapshot")
+def get_catalog_snapshot(request: Request, db: Session = Depends(get_read_db)):
+    """Snapshot katalog terkompresi untuk pemuatan awal frontend (revalidasi via ETag)"""
+    try:
+        return snapshot_response(request, db, "no-cache")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building catalog snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/catalog/snapshot/{digest}")
+def get_catalog_snapshot_immutable(digest: str, request: Request, db: Session = Depends(get_read_db)):
+    """Snapshot katalog pada URL berbasis konten; aman di-cache selamanya"""
+    try:
+        return snapshot_response(request, db, "public, max-age=31536000, immutable", digest)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building catalog snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# =================================================================
+# QUOTE ENDPOINTS
+# =================================================================
+
+CENT = Decimal("0.01")
+
+
+def promotion_discount(price: Decimal, promotion: Promotion) -> Decimal:
+    """Discount a promotion gives on ``price``, rounded half-up to the cent and capped at the price."""
+    if promotion.discount_percentage and promotion.discount_percentage > 0:
+        discount = price * promotion.discount_percentage / Decimal(100)
+    elif promotion.discount_amount and promotion.discount_amount > 0:
+        discount = promotion.discount_amount
+    else:
+        discount = Decimal(0)
+    return min(discount, price).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+@app.get("/variants/{variant_id}/quote", response_model=Dict[str, Any], operation_id="get variant quote")
+def get_variant_quote(
+    variant_id: uuid.UUID,
+    accessory_ids: Optional[str] = Query(None, description="Comma-separated accessory IDs"),
+    db: Session = Depends(get_read_db)
+):
+    """Hitung harga total varian plus aksesoris setelah promo aktif terbaik, dengan rincian per item"""
+    try:
+        try:
+            accessory_id_list = list(dict.fromkeys(
+                uuid.UUID(id.strip()) for id in (accessory_ids or "").split(',') if id.strip()
+            ))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid UUID format in accessory_ids")
+
+        # Variant, requested compatible accessories and active promotions in
+        # one round trip; the outer joins multiply rows, so dedupe below.
+        today = date.today()
+        rows = db.query(CarVariant, Car.model_name, Accessory, Promotion)\
+            .join(Car, CarVariant.car_id == Car.id)\
+            .outerjoin(VariantAccessory, and_(
+                VariantAccessory.variant_id == CarVariant.id,
+                VariantAccessory.accessory_id.in_(accessory_id_list),
+            ))\
+            .outerjoin(Accessory, Accessory.id == VariantAccessory.accessory_id)\
+            .outerjoin(Promotion, and_(
+                Promotion.variant_id == CarVariant.id,
+                Promotion.start_date <= today,
+                Promotion.end_date >= today,
+            ))\
+            .filter(CarVariant.id == variant_id)\
+            .all()
+
+        if not rows:
+            raise HTTPException(status_code=404, detail="Variant not found")
+
+        variant, model_name = rows[0][0], rows[0][1]
+        accessories = {a.id: a for _, _, a, _ in rows if a is not None}
+        promotions = {p.id: p for _, _, _, p in rows if p is not None}
+
+        missing_ids = [str(aid) for aid in accessory_id_list if aid not in accessories]
+        if missing_ids:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Accessories not available for this variant: {', '.join(missing_ids)}"
+            )
+
+        vehicle_price = variant.price.quantize(CENT, rounding=ROUND_HALF_UP)
+        best = max(
+            promotions.values(),
+            key=lambda p: (promotion_discount(vehicle_price, p), p.end_date),
+            default=None,
+        )
+        discount = promotion_discount(vehicle_price, best) if best else Decimal("0.00")
+        # A promotion that takes nothing off (e.g. 0% or a zero amount) is not applied
+        applied = best if best and discount > 0 else None
+
+        lines = [QuoteLineSchema(type="vehicle", item=f"{model_name} {variant.variant_name}",
+                                 id=variant.id, amount=vehicle_price)]
+        for aid in accessory_id_list:
+            accessory = accessories[aid]
+            lines.append(QuoteLineSchema(type="accessory", item=accessory.name, id=accessory.id,
+                                         amount=accessory.price.quantize(CENT, rounding=ROUND_HALF_UP)))
+        accessories_total = sum((line.amount for line in lines[1:]), Decimal("0.00"))
+        if applied:
+            lines.append(QuoteLineSchema(type="discount", item=applied.promo_title, id=applied.id, amount=-discount))
+        total_price = vehicle_price + accessories_total - discount
+        lines.append(QuoteLineSchema(type="total", item="Total", amount=total_price))
+
+        quote = QuoteSchema(
+            variant_id=variant.id,
+            model_name=model_name,
+            variant_name=variant.variant_name,
+            vehicle_price=vehicle_price,
+            accessories_total=accessories_total,
+            promotion_id=applied.id if applied else None,
+            promo_title=applied.promo_title if applied else None,
+            promo_end_date=applied.end_date if applied else None,
+            discount=discount,
+            total_price=total_price,
+        )
+
+        return {
+            "status": "success",
+            "data": lines,
+            "quote": quote
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building quote: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # =================================================================
 # PROMOTIONS ENDPOINTS
 # =================================================================
 
 @app.get("/promotions", response_model=Dict[str, Any], operation_id="list promotions")
-async def get_active_promotions(db: Session = Depends(get_db)):
+def get_active_promotions(db: Session = Depends(get_read_db)):
     """Mendapatkan semua promosi yang aktif"""
     try:
         today = date.today()
@@ -670,22 +1633,35 @@ async def get_active_promotions(db: Session = Depends(get_db)):
 # =================================================================
 
 @app.get("/stock", response_model=Dict[str, Any], operation_id="get stock info")
-async def get_stock_info(
+def get_stock_info(
     city: Optional[str] = Query(None, description="Nama kota"),
     variant_id: Optional[uuid.UUID] = Query(None, description="ID varian"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Mendapatkan informasi stok dan inden"""
     try:
         query = db.query(StockInventory).join(CarVariant).join(Car)
         
-        if city:
-            query = query.filter(StockInventory.city.ilike(f"%{city}%"))
-        
         if variant_id:
             query = query.filter(StockInventory.variant_id == variant_id)
-            
-        stock_info = query.order_by(StockInventory.city, Car.model_name, CarVariant.variant_name).all()
+
+        order = (StockInventory.city, Car.model_name, CarVariant.variant_name)
+        city_query = query.filter(city_filter(StockInventory.city, db, city)) if city else query
+        stock_info = city_query.order_by(*order).all()
+
+        # Nothing ready in the requested city: offer stock from nearby cities
+        match = resolve_city(db, city) if city else None
+        note = None
+        if match and not any(s.stock_quantity > 0 for s in stock_info):
+            nearby = city_resolver.nearby(match.cities)
+            if nearby:
+                nearby_stock = query.filter(
+                    StockInventory.city.in_(nearby), StockInventory.stock_quantity > 0
+                ).order_by(*order).all()
+                if nearby_stock:
+                    note = (f"Tidak ada stok ready di {', '.join(match.cities)}; "
+                            f"menampilkan stok di kota terdekat: {', '.join(sorted({s.city for s in nearby_stock}))}")
+                    stock_info = stock_info + nearby_stock
         
         result = []
         for s in stock_info:
@@ -696,28 +1672,180 @@ async def get_stock_info(
             }
             result.append(StockInventorySchema.model_validate(stock_data))
 
-        return {
+        response = {
             "status": "success",
             "data": result
         }
+        if match:
+            response["cities"] = match.cities
+        if note:
+            response["note"] = note
+        return response
     except Exception as e:
         logger.error(f"Error getting stock info: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def aggregate_stock_rows(rows) -> List[Dict[str, Any]]:
+    """Per-variant stock summary from raw stock rows, for databases without array_agg/percentile_cont."""
+    summaries: Dict[Any, Dict[str, Any]] = {}
+    indents: Dict[Any, List[int]] = {}
+    for r in rows:
+        summary = summaries.get(r.variant_id)
+        if summary is None:
+            summary = summaries[r.variant_id] = {
+                "variant_id": r.variant_id,
+                "model_name": r.model_name,
+                "variant_name": r.variant_name,
+                "segment": r.segment,
+                "total_units": 0,
+                "cities_with_stock": [],
+                "min_indent_weeks": None,
+                "median_indent_weeks": None,
+            }
+            indents[r.variant_id] = []
+        summary["total_units"] += r.stock_quantity
+        if r.stock_quantity > 0:
+            summary["cities_with_stock"].append(r.city)
+        if r.indent_estimate_weeks is not None:
+            indents[r.variant_id].append(r.indent_estimate_weeks)
+    for variant_id, values in indents.items():
+        if values:
+            summaries[variant_id]["min_indent_weeks"] = min(values)
+            # Same interpolation as percentile_cont(0.5)
+            summaries[variant_id]["median_indent_weeks"] = statistics.median(values)
+    return list(summaries.values())
+
+@app.get("/stock/summary", response_model=Dict[str, Any], operation_id="get stock summary")
+def get_stock_summary(
+    model: Optional[str] = Query(None, description="Nama model mobil"),
+    city: Optional[str] = Query(None, description="Nama kota"),
+    segment: Optional[str] = Query(None, description="Segmen mobil"),
+    db: Session = Depends(get_read_db)
+):
+    """Ringkasan ketersediaan stok per varian: total unit, kota yang punya stok, dan estimasi inden"""
+    try:
+        cache_key = (model, city, segment, catalog_version.value)
+        cached = stock_summary_cache.get(cache_key)
+        if cached is not None:
+            return {
+                "status": "success",
+                "data": cached
+            }
+
+        # Postgres aggregates per variant in SQL; other databases (the SQLite
+        # stand-in) have no array_agg/percentile_cont, so the rows are
+        # aggregated by aggregate_stock_rows() instead.
+        aggregate_in_sql = db.get_bind().dialect.name == "postgresql"
+        if aggregate_in_sql:
+            in_stock = StockInventory.stock_quantity > 0
+            columns = [
+                func.coalesce(func.sum(StockInventory.stock_quantity), 0).label("total_units"),
+                func.array_agg(StockInventory.city).filter(in_stock).label("cities_with_stock"),
+                func.min(StockInventory.indent_estimate_weeks).label("min_indent_weeks"),
+                func.percentile_cont(0.5).within_group(StockInventory.indent_estimate_weeks).label("median_indent_weeks"),
+            ]
+        else:
+            columns = [StockInventory.city, StockInventory.stock_quantity, StockInventory.indent_estimate_weeks]
+        query = db.query(
+            CarVariant.id.label("variant_id"),
+            Car.model_name,
+            CarVariant.variant_name,
+            Car.segment,
+            *columns,
+        ).join(CarVariant, StockInventory.variant_id == CarVariant.id)\
+         .join(Car, CarVariant.car_id == Car.id)
+
+        if model:
+            query = query.filter(Car.model_name.ilike(f"%{model}%"))
+
+        if city:
+            query = query.filter(city_filter(StockInventory.city, db, city))
+
+        if segment:
+            query = query.filter(Car.segment.ilike(f"%{segment}%"))
+
+        if aggregate_in_sql:
+            rows = query.group_by(CarVariant.id, Car.model_name, CarVariant.variant_name, Car.segment)\
+                .order_by(Car.model_name, CarVariant.variant_name)\
+                .all()
+            summaries = [r._asdict() for r in rows]
+        else:
+            summaries = aggregate_stock_rows(query.order_by(Car.model_name, CarVariant.variant_name).all())
+
+        result = []
+        for summary in summaries:
+            summary["cities_with_stock"] = sorted(set(summary["cities_with_stock"] or []))
+            result.append(StockSummarySchema.model_validate(summary))
+
+        stock_summary_cache.set(cache_key, result)
+
+        return {
+            "status": "success",
+            "data": result
+        }
+    except Exception as e:
+        logger.error(f"Error getting stock summary: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def run_stock_import(stream, fmt: str) -> Dict[str, Any]:
+    with SessionLocal(bind=get_engine()) as db:
+        city_resolver.ensure_loaded(db, catalog_version.value)
+    raw_connection = get_engine().raw_connection()
+    try:
+        return load_stock(raw_connection, stream, fmt, city_resolver)
+    finally:
+        raw_connection.close()
+
+@app.post("/admin/stock/import", response_model=Dict[str, Any])
+async def import_stock(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv atau ndjson (default dari Content-Type)"),
+    _: None = Depends(require_admin),
+):
+    """Impor stok dan inden dealer secara massal (CSV/NDJSON) via COPY + upsert"""
+    fmt = format or detect_format(None, request.headers.get("content-type"))
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    # Spool the upload so large files go to disk instead of memory
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            report = await run_in_threadpool(run_stock_import, stream, fmt)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error importing stock: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            stream.detach()
+
+    if report["inserted"] or report["updated"]:
+        await run_in_threadpool(invalidate_stock_caches)
+    logger.info(f"Stock import finished: {report}")
+
+    return {
+        "status": "success",
+        "data": report
+    }
+
 # =================================================================
 # SUPPORT ENDPOINTS
 # =================================================================
 
 @app.get("/workshops", response_model=Dict[str, Any])
-async def get_workshops(
+def get_workshops(
     city: Optional[str] = Query(None, description="Nama kota"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Mendapatkan daftar bengkel modifikasi"""
     try:
         query = db.query(Workshop)
         if city:
-            query = query.filter(Workshop.city.ilike(f"%{city}%"))
+            query = query.filter(city_filter(Workshop.city, db, city))
         
         workshops = query.order_by(Workshop.city, Workshop.name).all()
         
@@ -730,15 +1858,15 @@ async def get_workshops(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/communities", response_model=Dict[str, Any])
-async def get_communities(
+def get_communities(
     city: Optional[str] = Query(None, description="Nama kota"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Mendapatkan daftar komunitas mobil"""
     try:
         query = db.query(Community)
         if city:
-            query = query.filter(Community.base_city.ilike(f"%{city}%"))
+            query = query.filter(city_filter(Community.base_city, db, city))
             
         communities = query.order_by(Community.base_city, Community.name).all()
         
@@ -751,7 +1879,7 @@ async def get_communities(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dress-codes", response_model=Dict[str, Any])
-async def get_dress_codes(db: Session = Depends(get_db)):
+def get_dress_codes(db: Session = Depends(get_read_db)):
     """Mendapatkan panduan dress code untuk staf"""
     try:
         dress_codes = db.query(DressCode).order_by(DressCode.role, DressCode.day_of_week).all()
@@ -784,12 +1912,15 @@ async def call_n8n_webhook(message: str, context: dict = None) -> dict:
             "message": message,
             "context": context_data,
             "session_id": session_id,
+            "request_id": current_request_id(),
             "timestamp": datetime.now().isoformat()
         }
 
         timeout = CHATBOT_CONFIG["webhook_timeout"]
         async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(webhook_url, json=payload)
+            # n8n runs the LLM agent, so its round trip is reported as LLM time
+            with span("llm", "n8n webhook"):
+                response = await client.post(webhook_url, json=payload, headers=propagation_headers())
             response.raise_for_status()
 
             result = response.json()
@@ -866,20 +1997,22 @@ def get_welcome_response(session_id: str) -> ChatResponse:
         output=CHATBOT_CONFIG["welcome_message"]
     )
 
-async def get_fallback_response(message: str, db: Session, session_id: str) -> ChatResponse:
+async def get_fallback_response(message: str, session_id: str) -> ChatResponse:
     """Mendapatkan respons fallback dengan informasi dasar"""
     try:
         # Berikan beberapa informasi berguna berdasarkan kata kunci
         message_lower = message.lower()
 
         if any(word in message_lower for word in ["car", "mobil", "model", "available"]):
-            cars = db.query(Car).limit(5).all()
-            car_list = [f"- {car.model_name} ({car.segment})" for car in cars]
+            with read_session() as db:
+                cars = db.query(Car).limit(5).all()
+                car_list = [f"- {car.model_name} ({car.segment})" for car in cars]
             response_text = f"Here are some of our popular car models:\n\n" + "\n".join(car_list)
         elif any(word in message_lower for word in ["promo", "promotion", "discount"]):
-            promotions = db.query(Promotion).filter(
-                Promotion.end_date >= func.current_date()
-            ).limit(3).all()
+            with read_session() as db:
+                promotions = db.query(Promotion).filter(
+                    Promotion.end_date >= func.current_date()
+                ).limit(3).all()
             if promotions:
                 response_text = f"We have {len(promotions)} active promotions! Would you like to see the details?"
             else:
@@ -899,16 +2032,11 @@ async def get_fallback_response(message: str, db: Session, session_id: str) -> C
         )
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_with_assistant(request: ChatRequest, db: Session = Depends(get_db)):
-    """Chat dengan assistant untuk konsultasi mobil"""
-    session_id: str = f"session-{uuid.uuid4()}"
+async def answer_chat(message: str, context_data: Dict[str, Any], session_id: str) -> Tuple[ChatResponse, bool]:
+    """Answer one chat turn; the flag says whether the answer may be replayed to retries."""
     try:
-        message = request.message.strip()
-        context_data, session_id = prepare_chat_context(request.context)
-
         if any(word in message.lower() for word in ["hello", "hi", "halo", "hai", "start"]):
-            return get_welcome_response(session_id)
+            return get_welcome_response(session_id), True
 
         if CHATBOT_CONFIG["use_ai_processing"] and CHATBOT_CONFIG["n8n_webhook_url"]:
             logger.info(f"Sending message to N8N webhook: {message}")
@@ -925,27 +2053,119 @@ async def chat_with_assistant(request: ChatRequest, db: Session = Depends(get_db
                 return ChatResponse(
                     session_id=response_session_id,
                     output=output_text
-                )
+                ), True
 
+            # A retry should try n8n again, so fallbacks are not replayed
             logger.warning("N8N webhook failed, using fallback response")
-            return await get_fallback_response(message, db, session_id)
+            return await get_fallback_response(message, session_id), False
 
         logger.info(f"AI processing disabled or webhook missing, using fallback for: {message}")
-        return await get_fallback_response(message, db, session_id)
+        return await get_fallback_response(message, session_id), False
 
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         return ChatResponse(
             session_id=session_id,
             output=CHATBOT_CONFIG["error_message"],
-        )
+        ), False
+
+
+CHAT_FORWARDED_HEADER = "x-chat-forwarded"
+
+
+def chat_idempotency_key(request: ChatRequest, idempotency_key: Optional[str], message: str) -> Optional[str]:
+    """Client key, else a hash of the client's session id and message; ``None`` without either."""
+    if idempotency_key and idempotency_key.strip():
+        return idempotency_key.strip()
+    context = request.context if isinstance(request.context, dict) else {}
+    session_id = context.get("session_id") or context.get("session-id")
+    if not session_id:
+        return None
+    return f"{CHAT_AUTO_KEY_PREFIX}{fingerprint(str(session_id), message)}"
+
+
+async def forward_chat(owner_url: str, request: ChatRequest, key: str) -> Optional[Response]:
+    """Run the turn on the worker that owns ``key`` so duplicates meet in one store."""
+    headers = {"Idempotency-Key": key, CHAT_FORWARDED_HEADER: "1", **propagation_headers()}
+    try:
+        async with httpx.AsyncClient(timeout=CHATBOT_CONFIG["webhook_timeout"] + 5) as client:
+            with span("upstream", "chat owner forward", peer=owner_url):
+                owner_response = await client.post(
+                    f"{owner_url}/chat", json=request.model_dump(mode="json"), headers=headers
+                )
+    except httpx.HTTPError as e:
+        logger.warning(f"Failed to forward chat to {owner_url}, answering locally: {e}")
+        return None
+    forwarded_headers = {
+        name: value for name, value in owner_response.headers.items()
+        if name.lower() == "idempotent-replayed"
+    }
+    return Response(
+        content=owner_response.content,
+        status_code=owner_response.status_code,
+        media_type="application/json",
+        headers=forwarded_headers,
+    )
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_with_assistant(
+    request: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    x_chat_forwarded: Optional[str] = Header(None),
+):
+    """Chat dengan assistant untuk konsultasi mobil"""
+    message = request.message.strip()
+    context_data, session_id = prepare_chat_context(request.context)
 
+    key = chat_idempotency_key(request, idempotency_key, message)
+    if key is None:
+        chat_response, _ = await answer_chat(message, context_data, session_id)
+        return chat_response
+
+    if not x_chat_forwarded:
+        owner_url = owner_worker_url(key)
+        if owner_url:
+            forwarded = await forward_chat(owner_url, request, key)
+            if forwarded is not None:
+                return forwarded
+
+    try:
+        chat_response, outcome = await chat_idempotency.run(
+            key,
+            fingerprint(message),
+            lambda: answer_chat(message, context_data, session_id),
+            # Forwarded auto keys arrive as Idempotency-Key, so go by the prefix
+            ttl_seconds=CHAT_AUTO_KEY_TTL if key.startswith(CHAT_AUTO_KEY_PREFIX) else None,
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different message")
+
+    if outcome != "new":
+        logger.info(f"Chat request {outcome} from idempotency key {key}")
+        response.headers["Idempotent-Replayed"] = "true"
+    return chat_response
+
+
+# MCP tool calls are dispatched in-process through this client. It tags every
+# call so compact_tool_output can shrink the payload before it reaches the LLM.
+mcp_http_client = httpx.AsyncClient(
+    transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+    base_url="http://apiserver",
+    timeout=10.0,
+    headers={TOOL_CALLER_HEADER: "mcp"},
+)
 
 mcp = FastApiMCP(app, name="Car Service MCP",
     description="MCP untuk layanan data mobil, rekomendasi, dan promosi.",
+    http_client=mcp_http_client,
+    # Forward the caller's request id into the tool's HTTP call
+    headers=["authorization", "x-request-id", "traceparent"],
     include_operations=[
         "list cars", "list car variants", "get car recommendations",
-        "compare variants", "list promotions", "get stock info"
+        "compare variants", "list promotions", "get stock info",
+        "get recommendation facets", "get stock summary", "list variant accessories", "get variant quote"
     ]
 )
 mcp.mount(mount_path="/mcp", transport="sse")
@@ -953,9 +2173,21 @@ mcp.mount(mount_path="/mcp", transport="sse")
 if __name__ == "__main__":
     # Create tables if they don't exist (for local development)
     # In production, you might use Alembic for migrations
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
+    if install_change_feed(get_engine()):
+        logger.info("Catalog change feed installed")
     # Ensure MCP routes are registered before serving
     mcp.setup_server()
-    # Running without reloader for Docker healthcheck stability
-    uvicorn.run(app, host="0.0.0.0", port=8007)
+    if SERVING_CONFIG["workers"] > 1:
+        # Pre-fork workers; each one builds its own engine after fork
+        run_workers(
+            app,
+            host=SERVING_CONFIG["host"],
+            port=SERVING_CONFIG["port"],
+            workers=SERVING_CONFIG["workers"],
+            worker_base_port=SERVING_CONFIG["worker_base_port"],
+        )
+    else:
+        # Running without reloader for Docker healthcheck stability
+        uvicorn.run(app, host=SERVING_CONFIG["host"], port=SERVING_CONFIG["port"])
 
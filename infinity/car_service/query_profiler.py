@@ -0,0 +1,257 @@
+"""
+Slow-query profiler for car_service.
+
+Hooks SQLAlchemy cursor events on every engine and keeps, per process:
+
+* per-statement call counts and timings keyed by normalized SQL
+  (bound parameters and expanded IN lists collapsed to ``?``)
+* a ring buffer of the slowest recent statements, with an
+  ``EXPLAIN (ANALYZE, BUFFERS)`` plan captured for read-only statements
+
+Timing a statement is two ``perf_counter`` calls, so it is done for every
+statement; statements slower than ``slow_ms`` are always recorded. The
+per-statement aggregates (normalizing SQL, taking the lock) only happen for
+a random ``sample_rate`` fraction of the rest. Together that adds a few
+microseconds per statement; ``benchmarks/query_profiler_overhead.py``
+measures it against a given database and query. EXPLAIN runs on a
+background thread with its own connection, at most once per statement per
+``explain_interval`` seconds, so requests never wait on it.
+"""
+
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE|COPY|GRANT|LOCK)\b", re.I)
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Collapse literals, bound parameters and IN lists so equivalent statements share one key."""
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _WHITESPACE_RE.sub(" ", sql).strip()
+
+
+def is_read_only(statement: str) -> bool:
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return head in ("SELECT", "WITH") and not _WRITE_RE.search(statement)
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.1,
+        slow_ms: float = 100.0,
+        explain: bool = True,
+        explain_interval: float = 300.0,
+        explain_timeout_ms: int = 5000,
+        worst_size: int = 50,
+        max_statements: int = 500,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.explain_timeout_ms = explain_timeout_ms
+        self.max_statements = max_statements
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._worst: "deque[Dict[str, Any]]" = deque(maxlen=worst_size)
+        self._explained_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._explain_queue: "queue.Queue" = queue.Queue(maxsize=32)
+        self._explain_pid: Optional[int] = None
+        self._installed = False
+        self.started_at = time.time()
+        self.dropped_statements = 0
+
+    def install(self) -> None:
+        """Register the cursor listeners on all engines. No-op when disabled."""
+        if not self.enabled or self._installed:
+            return
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        self._installed = True
+
+    # -----------------------------------------------------------------
+    # Event hooks
+    # -----------------------------------------------------------------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("profiler_query_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        slow = elapsed_ms >= self.slow_ms
+        if not slow and random.random() >= self.sample_rate:
+            return
+
+        key = normalize_sql(statement)
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else 0
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_statements:
+                    self.dropped_statements += 1
+                    stats = None
+                else:
+                    stats = self._stats[key] = {
+                        "recorded_calls": 0, "sampled_calls": 0, "slow_calls": 0, "rows": 0,
+                        "total_ms": 0.0, "min_ms": elapsed_ms, "max_ms": 0.0, "explain": None,
+                    }
+            if stats is not None:
+                # Slow statements are recorded unconditionally; only the
+                # sampled ones are representative of the overall mix.
+                if not slow or random.random() < self.sample_rate:
+                    stats["sampled_calls"] += 1
+                    stats["total_ms"] += elapsed_ms
+                    stats["rows"] += rows
+                stats["recorded_calls"] += 1
+                stats["min_ms"] = min(stats["min_ms"], elapsed_ms)
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if slow:
+                if stats is not None:
+                    stats["slow_calls"] += 1
+                sample = {
+                    "query": key,
+                    "duration_ms": round(elapsed_ms, 2),
+                    "rows": rows,
+                    "at": time.time(),
+                    "explain": None,
+                }
+                self._worst.append(sample)
+                wants_explain = (
+                    self.explain
+                    and not executemany
+                    and conn.engine.dialect.name == "postgresql"
+                    and is_read_only(statement)
+                    and time.monotonic() - self._explained_at.get(key, float("-inf")) >= self.explain_interval
+                )
+                if wants_explain:
+                    self._explained_at[key] = time.monotonic()
+
+        if slow and wants_explain:
+            self._submit_explain(conn.engine, key, statement, parameters, sample)
+
+    # -----------------------------------------------------------------
+    # EXPLAIN capture
+    # -----------------------------------------------------------------
+
+    def _submit_explain(self, engine, key: str, statement: str, parameters, sample: Dict[str, Any]) -> None:
+        # Threads do not survive fork; start one lazily in each worker.
+        if self._explain_pid != os.getpid():
+            self._explain_pid = os.getpid()
+            threading.Thread(target=self._run_explains, name="query-explain", daemon=True).start()
+        try:
+            self._explain_queue.put_nowait((engine, key, statement, parameters, sample))
+        except queue.Full:
+            pass
+
+    def _run_explains(self) -> None:
+        while True:
+            engine, key, statement, parameters, sample = self._explain_queue.get()
+            try:
+                plan = self._explain(engine, statement, parameters)
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+                logger.warning(f"EXPLAIN for slow query failed: {e}")
+            with self._lock:
+                sample["explain"] = plan
+                if key in self._stats:
+                    self._stats[key]["explain"] = plan
+
+    def _explain(self, engine, statement: str, parameters) -> str:
+        # A raw DBAPI connection does not fire engine events, so the EXPLAIN
+        # itself is never profiled or traced. Read-only statements only:
+        # ANALYZE executes the statement.
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters or None)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.close()
+                raw.rollback()
+        finally:
+            raw.close()
+
+    # -----------------------------------------------------------------
+    # Reporting
+    # -----------------------------------------------------------------
+
+    def report(self, limit: int = 20, order_by: str = "total_ms") -> Dict[str, Any]:
+        with self._lock:
+            statements = []
+            for query, stats in self._stats.items():
+                sampled = stats["sampled_calls"]
+                mean_ms = stats["total_ms"] / sampled if sampled else None
+                statements.append({
+                    "query": query,
+                    "recorded_calls": stats["recorded_calls"],
+                    "sampled_calls": sampled,
+                    "estimated_calls": round(sampled / self.sample_rate) if self.sample_rate else sampled,
+                    "slow_calls": stats["slow_calls"],
+                    "mean_ms": round(mean_ms, 3) if mean_ms is not None else None,
+                    "min_ms": round(stats["min_ms"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                    "estimated_total_ms": round(stats["total_ms"] / self.sample_rate, 1) if self.sample_rate else None,
+                    "rows_per_call": round(stats["rows"] / sampled, 1) if sampled else None,
+                    "explain": stats["explain"],
+                })
+            worst = sorted(self._worst, key=lambda s: s["duration_ms"], reverse=True)
+            worst = [dict(s) for s in worst[:limit]]
+
+        sort_key = {
+            "total_ms": lambda s: s["estimated_total_ms"] or 0.0,
+            "mean_ms": lambda s: s["mean_ms"] or 0.0,
+            "max_ms": lambda s: s["max_ms"],
+            "calls": lambda s: s["estimated_calls"],
+            "slow_calls": lambda s: s["slow_calls"],
+        }.get(order_by, lambda s: s["estimated_total_ms"] or 0.0)
+        statements.sort(key=sort_key, reverse=True)
+
+        return {
+            "enabled": self.enabled,
+            "pid": os.getpid(),
+            "since": self.started_at,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "tracked_statements": len(statements),
+            "dropped_statements": self.dropped_statements,
+            "statements": statements[:limit],
+            "worst": worst,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._worst.clear()
+            self._explained_at.clear()
+            self.dropped_statements = 0
+            self.started_at = time.time()
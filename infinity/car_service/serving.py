@@ -0,0 +1,133 @@
+"""
+Pre-fork multi-worker launcher for car_service.
+
+The parent process imports the application once, binds the public socket
+and forks N workers that all accept on it. Each worker also listens on a
+private loopback port so that workers can reach each other: MCP SSE sessions
+live in the memory of the worker that accepted the ``GET /mcp`` stream, and
+a ``POST /mcp/messages/`` that the kernel hands to a different worker has to
+be forwarded to the owner (see ``mcp_session_affinity`` in main.py).
+
+Database engines must not be shared across the fork; main.py creates its
+engine lazily and discards any inherited pool in the child.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import List, Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Set in each forked worker; ``None`` in single-process mode.
+_worker_index: Optional[int] = None
+_worker_count: int = 1
+_worker_base_port: int = 0
+
+
+def current_worker_index() -> Optional[int]:
+    return _worker_index
+
+
+def peer_worker_urls() -> List[str]:
+    """Private base URLs of every other worker in this pool."""
+    if _worker_index is None or _worker_count <= 1:
+        return []
+    return [
+        f"http://127.0.0.1:{_worker_base_port + i}"
+        for i in range(_worker_count)
+        if i != _worker_index
+    ]
+
+
+def owner_worker_url(key: str) -> Optional[str]:
+    """Private base URL of the worker that owns ``key``, or ``None`` if it is this one."""
+    if _worker_index is None or _worker_count <= 1:
+        return None
+    owner = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) % _worker_count
+    if owner == _worker_index:
+        return None
+    return f"http://127.0.0.1:{_worker_base_port + owner}"
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, index: int, workers: int, base_port: int, shared_sock: socket.socket, log_level: str) -> None:
+    global _worker_index, _worker_count, _worker_base_port
+    _worker_index = index
+    _worker_count = workers
+    _worker_base_port = base_port
+
+    private_sock = _bind("127.0.0.1", base_port + index)
+    config = uvicorn.Config(app, log_level=log_level, timeout_keep_alive=30)
+    server = uvicorn.Server(config)
+    logger.info("Worker %s (pid %s) serving, private port %s", index, os.getpid(), base_port + index)
+    server.run(sockets=[shared_sock, private_sock])
+
+
+def run_workers(
+    app,
+    host: str,
+    port: int,
+    workers: int,
+    worker_base_port: int,
+    log_level: str = "info",
+) -> None:
+    """
+    Serve ``app`` with ``workers`` forked processes sharing one listening socket.
+
+    Workers that exit unexpectedly are restarted with the same index so their
+    private port, and therefore MCP session forwarding, stays stable.
+    """
+    ctx = multiprocessing.get_context("fork")
+    shared_sock = _bind(host, port)
+    processes = {}
+    stopping = False
+
+    def spawn(index: int):
+        process = ctx.Process(
+            target=_run_worker,
+            args=(app, index, workers, worker_base_port, shared_sock, log_level),
+            name=f"car_service-worker-{index}",
+        )
+        process.start()
+        processes[index] = process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Starting %s car_service workers on %s:%s", workers, host, port)
+    for index in range(workers):
+        spawn(index)
+
+    try:
+        while not stopping:
+            for index, process in list(processes.items()):
+                if not process.is_alive() and not stopping:
+                    logger.warning("Worker %s exited with code %s; restarting", index, process.exitcode)
+                    spawn(index)
+            time.sleep(1)
+    finally:
+        for process in processes.values():
+            process.join(timeout=10)
+        shared_sock.close()
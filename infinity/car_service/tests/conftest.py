@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The service modules import each other by name, as in the container
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# main.py reads its configuration on import: point it at a throwaway SQLite
+# file so the endpoint tests run without Postgres
+os.environ["DATABASE_URL_CAR"] = f"sqlite:///{tempfile.mkdtemp()}/car_service_test.db"
+os.environ.setdefault("QUERY_PROFILER", "false")
+os.environ.setdefault("CACHE_WARMUP", "false")
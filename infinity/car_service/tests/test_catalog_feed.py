@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from catalog_feed import fetch_changes
+
+# The feed tables as FEED_DDL creates them, minus the Postgres-only types;
+# fetch_changes itself is plain SQL.
+SCHEMA = [
+    "CREATE TABLE catalog_changes (version INTEGER PRIMARY KEY, table_name TEXT NOT NULL,"
+    " row_id TEXT NOT NULL, op TEXT NOT NULL, data TEXT, changed_at TEXT)",
+    "CREATE TABLE catalog_feed_state (id INTEGER PRIMARY KEY, min_since INTEGER NOT NULL)",
+    "INSERT INTO catalog_feed_state VALUES (1, 0)",
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        yield conn
+    engine.dispose()
+
+
+def record(db, *changes):
+    for table, row_id, op in changes:
+        db.execute(text("INSERT INTO catalog_changes (table_name, row_id, op, data) VALUES (:t, :r, :o, '{}')"),
+                   {"t": table, "r": row_id, "o": op})
+
+
+def summary(result):
+    return [(c["version"], c["table"], c["id"], c["op"]) for c in result["changes"]]
+
+
+def test_returns_the_latest_entry_per_row(db):
+    record(db, ("cars", "a", "upsert"), ("promotions", "p", "upsert"), ("cars", "a", "upsert"),
+           ("cars", "b", "upsert"), ("cars", "b", "delete"))
+    result = fetch_changes(db, since=0)
+    assert summary(result) == [(2, "promotions", "p", "upsert"), (3, "cars", "a", "upsert"),
+                               (5, "cars", "b", "delete")]
+    assert (result["version"], result["has_more"], result["reset"]) == (5, False, False)
+
+
+def test_since_only_returns_newer_changes(db):
+    record(db, ("cars", "a", "upsert"), ("cars", "b", "upsert"))
+    assert summary(fetch_changes(db, since=1)) == [(2, "cars", "b", "upsert")]
+    empty = fetch_changes(db, since=2)
+    assert (empty["changes"], empty["version"]) == ([], 2)
+
+
+def test_pages_through_a_full_feed(db):
+    record(db, *[("stock_inventory", str(i), "upsert") for i in range(5)])
+    first = fetch_changes(db, since=0, limit=2)
+    assert (summary(first), first["version"], first["has_more"]) == (
+        [(1, "stock_inventory", "0", "upsert"), (2, "stock_inventory", "1", "upsert")], 2, True)
+    second = fetch_changes(db, since=first["version"], limit=2)
+    third = fetch_changes(db, since=second["version"], limit=2)
+    assert [c["id"] for c in second["changes"] + third["changes"]] == ["2", "3", "4"]
+    assert (third["version"], third["has_more"]) == (5, False)
+
+
+def test_filters_by_table(db):
+    record(db, ("cars", "a", "upsert"), ("stock_inventory", "*", "reload"), ("promotions", "p", "upsert"))
+    result = fetch_changes(db, since=0, tables=["stock_inventory", "promotions"])
+    assert summary(result) == [(2, "stock_inventory", "*", "reload"), (3, "promotions", "p", "upsert")]
+    assert result["version"] == 3
+
+
+def test_compacted_cursors_are_reset(db):
+    record(db, ("cars", "a", "upsert"), ("cars", "b", "upsert"), ("cars", "c", "upsert"))
+    db.execute(text("UPDATE catalog_feed_state SET min_since = 2"))
+    result = fetch_changes(db, since=1)
+    assert (result["reset"], result["version"], result["min_since"], result["changes"]) == (True, 3, 2, [])
+    assert summary(fetch_changes(db, since=2)) == [(3, "cars", "c", "upsert")]
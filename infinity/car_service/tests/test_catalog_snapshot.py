@@ -0,0 +1,99 @@
+import gzip
+import json
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import catalog_snapshot
+import main
+from catalog_snapshot import JSON_MEDIA_TYPE, Snapshot, SnapshotStore, choose_encoding, choose_media_type
+
+
+@pytest.fixture
+def without_optional_codecs(monkeypatch):
+    monkeypatch.setattr(catalog_snapshot, "brotli", None)
+    monkeypatch.setattr(catalog_snapshot, "msgpack", None)
+
+
+def test_choose_encoding(without_optional_codecs):
+    assert choose_encoding("gzip, deflate, br") == "gzip"
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") == "identity"
+    assert choose_encoding(None) == "identity"
+
+
+def test_choose_encoding_prefers_brotli(monkeypatch):
+    monkeypatch.setattr(catalog_snapshot, "brotli", object())
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip") == "gzip"
+
+
+def test_choose_media_type_without_msgpack(without_optional_codecs):
+    assert choose_media_type("application/msgpack") == JSON_MEDIA_TYPE
+
+
+def test_snapshot_is_deterministic():
+    document = {"b": [1, 2], "a": {"price": Decimal("100.50"), "date": date(2025, 1, 2)}, "c": uuid.UUID(int=1)}
+    first, second = Snapshot(("v1",), document), Snapshot(("v1",), dict(reversed(list(document.items()))))
+    assert first.json_bytes == second.json_bytes
+    assert first.digest == second.digest
+    assert json.loads(first.json_bytes)["c"] == str(uuid.UUID(int=1))
+    assert Snapshot(("v1",), {**document, "b": [1]}).digest != first.digest
+
+
+def test_encoded_bodies_and_etags():
+    snapshot = Snapshot(("v1",), {"cars": ["Innova"] * 100})
+    body = snapshot.body(JSON_MEDIA_TYPE, "gzip")
+    assert gzip.decompress(body) == snapshot.json_bytes
+    # mtime=0: the same catalog gives the same bytes in every worker
+    assert Snapshot(("v1",), {"cars": ["Innova"] * 100}).body(JSON_MEDIA_TYPE, "gzip") == body
+    assert snapshot.body(JSON_MEDIA_TYPE, "gzip") is body
+    assert snapshot.etag(JSON_MEDIA_TYPE, "gzip") == f'"{snapshot.digest}-json-gzip"'
+    assert snapshot.etag(JSON_MEDIA_TYPE, "identity") != snapshot.etag(JSON_MEDIA_TYPE, "gzip")
+    assert snapshot.sizes() == {f"{JSON_MEDIA_TYPE}+gzip": len(body)}
+
+
+def test_store_rebuilds_only_for_a_new_key():
+    store, builds = SnapshotStore(), []
+
+    def build():
+        builds.append(1)
+        return {"n": len(builds)}
+
+    assert store.get(("v1",), build) is store.get(("v1",), build)
+    assert store.get(("v2",), build).document == {"n": 2}
+    assert len(builds) == 2
+
+
+@pytest.fixture(scope="module")
+def client():
+    engine = main.get_engine()
+    main.Base.metadata.create_all(engine)
+    with main.SessionLocal(bind=engine) as db:
+        car = main.Car(model_name=f"Rush {uuid.uuid4().hex[:6]}", segment="SUV")
+        db.add(car)
+        db.flush()
+        db.add(main.CarVariant(car_id=car.id, variant_name="GR Sport", price=Decimal("300000000.00")))
+        db.commit()
+    return TestClient(main.app)
+
+
+def test_snapshot_endpoint_revalidates_with_the_etag(client, without_optional_codecs):
+    main.catalog_version.bump()  # drop snapshots built before this module's rows
+    response = client.get("/catalog/snapshot", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == "no-cache"
+    assert any(v["variant_name"] == "GR Sport" for v in response.json()["variants"])
+
+    etag = response.headers["etag"]
+    again = client.get("/catalog/snapshot", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304
+
+    immutable = client.get(response.headers["x-catalog-snapshot"], headers={"Accept-Encoding": "gzip"})
+    assert immutable.headers["etag"] == etag
+    assert "immutable" in immutable.headers["cache-control"]
+    assert client.get("/catalog/snapshot/0000").status_code == 404
@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from city_resolver import CityResolver, normalize_city
+
+SCHEMA = [
+    "CREATE TABLE regions (id INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    "CREATE TABLE cities (id INTEGER PRIMARY KEY, name TEXT NOT NULL, region_id INTEGER,"
+    " latitude REAL, longitude REAL)",
+    "CREATE TABLE city_aliases (alias TEXT NOT NULL, city_id INTEGER NOT NULL)",
+    "INSERT INTO regions VALUES (1, 'Jabodetabek'), (2, 'Jawa Timur')",
+    "INSERT INTO cities VALUES"
+    " (1, 'Jakarta', 1, -6.2, 106.8), (2, 'Bekasi', 1, -6.24, 107.0), (3, 'Bogor', 1, -6.6, 106.8),"
+    " (4, 'Surabaya', 2, -7.25, 112.75), (5, 'Sidoarjo', 2, -7.45, 112.7), (6, 'Bandung', NULL, -6.9, 107.6),"
+    " (8, 'Surakarta', NULL, -7.57, 110.8)",
+    "INSERT INTO city_aliases VALUES ('DKI', 1), ('Jkt', 1), ('Sby', 4)",
+]
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+@pytest.fixture
+def resolver(connection):
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+    resolver = CityResolver()
+    resolver.ensure_loaded(connection, 1)
+    return resolver
+
+
+def test_normalize_city_strips_prefixes_and_punctuation():
+    assert normalize_city("  Kota  Bandung ") == "bandung"
+    assert normalize_city("Kab. Bogor") == "bogor"
+    assert normalize_city("DKI-Jakarta") == "dki jakarta"
+
+
+@pytest.mark.parametrize("query, cities, kind", [
+    ("jakarta", ["Jakarta"], "exact"),
+    ("Kota Surabaya", ["Surabaya"], "exact"),
+    ("Jkt", ["Jakarta"], "alias"),
+    ("DKI Jakarta", ["Jakarta"], "alias"),
+    ("Jakarta Selatan", ["Jakarta"], "exact"),
+    ("surab", ["Surabaya"], "exact"),
+    ("Jabodetabek", ["Bekasi", "Bogor", "Jakarta"], "region"),
+])
+def test_resolve(resolver, query, cities, kind):
+    match = resolver.resolve(query)
+    assert match.cities == cities
+    assert match.match == kind
+    assert match.query == query
+
+
+def test_resolve_reports_the_region(resolver):
+    assert resolver.resolve("Sby").region == "Jawa Timur"
+    assert resolver.resolve("Bandung").region is None
+
+
+@pytest.mark.parametrize("query", ["", "  ", "Medan", "bo"])
+def test_resolve_unknown(resolver, query):
+    # Prefixes shorter than three characters are not completed
+    assert resolver.resolve(query) is None
+
+
+def test_ambiguous_prefix_resolves_nothing(resolver):
+    assert resolver.resolve("sura") is None
+    assert resolver.resolve("surak").cities == ["Surakarta"]
+
+
+def test_nearby_prefers_the_same_region(resolver):
+    assert resolver.nearby(["Jakarta"], limit=3) == ["Bekasi", "Bogor", "Bandung"]
+    assert resolver.nearby(["Medan"]) == []
+
+
+def test_missing_tables_fall_back_to_no_dictionary(connection):
+    resolver = CityResolver()
+    resolver.ensure_loaded(connection, 1)
+    assert not resolver.loaded
+    assert resolver.resolve("Jakarta") is None
+    # The failed load was rolled back, so the connection is still usable
+    assert connection.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_reloads_only_when_the_version_changes(connection, resolver):
+    connection.execute(text("INSERT INTO cities VALUES (7, 'Medan', NULL, 3.6, 98.7)"))
+    resolver.ensure_loaded(connection, 1)
+    assert resolver.resolve("Medan") is None
+    resolver.ensure_loaded(connection, 2)
+    assert resolver.resolve("Medan").cities == ["Medan"]
@@ -0,0 +1,78 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import price_bucket_label
+
+VARIANTS = [
+    # price, seats, fuel, use_case
+    ("250000000.00", 7, "Bensin", "Daily, Travel"),
+    ("280000000.00", 7, "Bensin", "daily,  Business"),
+    ("450000000.00", 5, "Hybrid", "Daily"),
+    ("800000000.00", 7, "Diesel", "Off-road, travel"),
+]
+
+
+def test_price_bucket_label():
+    assert price_bucket_label(0) == "0-200000000"
+    assert price_bucket_label(2) == "300000000-400000000"
+    assert price_bucket_label(len(main.PRICE_HISTOGRAM_EDGES)) == "1000000000-"
+
+
+@pytest.fixture(scope="module")
+def facets():
+    engine = main.get_engine()
+    main.Base.metadata.create_all(engine)
+    # A demographic of its own keeps other test modules' variants out of the counts
+    demographic = f"Facet {uuid.uuid4().hex[:6]}"
+    with main.SessionLocal(bind=engine) as db:
+        car = main.Car(model_name=f"Veloz {uuid.uuid4().hex[:6]}", segment="MPV")
+        db.add(car)
+        db.flush()
+        for i, (price, seats, fuel, use_case) in enumerate(VARIANTS):
+            db.add(main.CarVariant(car_id=car.id, variant_name=f"V{i}", price=Decimal(price),
+                                   seating_capacity=seats, fuel_type=fuel, transmission="AT",
+                                   target_demographic=demographic, use_case=use_case))
+        db.commit()
+    return TestClient(main.app), demographic
+
+
+def counts(rows, facet):
+    return {row["value"]: row["count"] for row in rows if row["facet"] == facet}
+
+
+def test_facet_counts(facets):
+    client, demographic = facets
+    body = client.get("/recommendations/facets", params={"target_demographic": demographic}).json()
+    rows = body["data"]
+    assert counts(rows, "fuel_type") == {"Bensin": 2, "Hybrid": 1, "Diesel": 1}
+    assert counts(rows, "seating_capacity") == {7: 3, 5: 1}
+    # Keywords count once per variant, whatever their case or spacing
+    assert counts(rows, "use_case") == {"Daily": 3, "Travel": 2, "Business": 1, "Off-road": 1}
+    assert counts(rows, "price") == {"200000000-300000000": 2, "400000000-500000000": 1,
+                                     "750000000-1000000000": 1}
+    assert [r["value"] for r in rows if r["facet"] == "fuel_type"] == ["Bensin", "Diesel", "Hybrid"]
+    summary = body["summary"]
+    assert (summary["total_variants"], summary["seating_min"], summary["seating_max"]) == (4, 5, 7)
+    assert (Decimal(summary["price_min"]), Decimal(summary["price_max"])) == (Decimal("250000000"), Decimal("800000000"))
+
+
+def test_facet_filters_narrow_the_counts(facets):
+    client, demographic = facets
+    body = client.get("/recommendations/facets",
+                      params={"target_demographic": demographic, "use_case": "travel"}).json()
+    assert counts(body["data"], "use_case") == {"Travel": 2, "Daily": 1, "Off-road": 1}
+    assert body["summary"]["total_variants"] == 2
+
+
+def test_compact_facets_keep_the_summary(facets):
+    client, demographic = facets
+    response = client.get("/recommendations/facets", params={"target_demographic": demographic},
+                          headers={"X-Tool-Format": "compact"})
+    lines = response.text.splitlines()
+    assert lines[0].startswith("# summary: total_variants=4, seating_min=5, seating_max=7, price_min=250000000")
+    assert lines[1] == "facet|value|count"
+    assert "use_case|Daily|3" in lines
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+
+
+def counting(value="answer", cacheable=True, delay=0.0):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return value, cacheable
+
+    return compute, calls
+
+
+def test_duplicates_in_flight_share_one_execution():
+    store = IdempotencyStore()
+    compute, calls = counting(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(store.run("k", "fp", compute) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert results == [("answer", "new"), ("answer", "joined"), ("answer", "joined")]
+    assert len(calls) == 1
+
+
+def test_completed_result_is_replayed():
+    store = IdempotencyStore()
+    compute, calls = counting()
+
+    async def scenario():
+        return [await store.run("k", "fp", compute), await store.run("k", "fp", compute)]
+
+    assert asyncio.run(scenario()) == [("answer", "new"), ("answer", "replayed")]
+    assert len(calls) == 1
+    assert store.stats()["replayed"] == 1
+
+
+def test_same_key_with_another_request_conflicts():
+    store = IdempotencyStore()
+    compute, _ = counting()
+
+    async def scenario():
+        await store.run("k", fingerprint("s1", "hi"), compute)
+        await store.run("k", fingerprint("s1", "bye"), compute)
+
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(scenario())
+
+
+def test_uncacheable_results_are_not_replayed():
+    store = IdempotencyStore()
+    compute, calls = counting(value="fallback", cacheable=False)
+
+    async def scenario():
+        return [await store.run("k", "fp", compute), await store.run("k", "fp", compute)]
+
+    assert asyncio.run(scenario()) == [("fallback", "new"), ("fallback", "new")]
+    assert len(calls) == 2
+
+
+def test_per_call_ttl_zero_only_joins_in_flight():
+    store = IdempotencyStore(ttl_seconds=120)
+    compute, calls = counting(delay=0.02)
+
+    async def scenario():
+        first = await asyncio.gather(store.run("k", "fp", compute, ttl_seconds=0),
+                                     store.run("k", "fp", compute, ttl_seconds=0))
+        return list(first) + [await store.run("k", "fp", compute, ttl_seconds=0)]
+
+    assert [how for _, how in asyncio.run(scenario())] == ["new", "joined", "new"]
+    assert len(calls) == 2
+
+
+def test_expired_results_run_again():
+    store = IdempotencyStore(ttl_seconds=0.01)
+    compute, calls = counting()
+
+    async def scenario():
+        await store.run("k", "fp", compute)
+        await asyncio.sleep(0.02)
+        return await store.run("k", "fp", compute)
+
+    assert asyncio.run(scenario()) == ("answer", "new")
+    assert len(calls) == 2
+
+
+def test_failures_are_not_cached():
+    store = IdempotencyStore()
+    attempts = []
+
+    async def compute():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream down")
+        return "answer", True
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run("k", "fp", compute)
+        return await store.run("k", "fp", compute)
+
+    assert asyncio.run(scenario()) == ("answer", "new")
+    assert store.stats()["in_flight"] == 0
+
+
+def test_completed_results_are_bounded():
+    store = IdempotencyStore(max_entries=2)
+    compute, _ = counting()
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await store.run(key, "fp", compute)
+        return await store.run("a", "fp", compute)
+
+    assert asyncio.run(scenario())[1] == "new"
+    assert store.stats()["completed"] == 2
+
+
+@pytest.fixture
+def chat_client(monkeypatch):
+    answers = []
+
+    async def answer_chat(message, context_data, session_id):
+        answers.append(message)
+        return main.ChatResponse(session_id=session_id or "", output=f"answer {len(answers)}"), True
+
+    monkeypatch.setattr(main, "answer_chat", answer_chat)
+    monkeypatch.setattr(main, "chat_idempotency", IdempotencyStore())
+    monkeypatch.setattr(main, "owner_worker_url", lambda key: None)
+    return TestClient(main.app), answers
+
+
+def test_chat_replays_a_repeated_idempotency_key(chat_client):
+    client, answers = chat_client
+    first = client.post("/chat", json={"message": "Harga Innova?"}, headers={"Idempotency-Key": "k1"})
+    second = client.post("/chat", json={"message": "Harga Innova?"}, headers={"Idempotency-Key": "k1"})
+    assert first.json() == second.json()
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+    assert answers == ["Harga Innova?"]
+    conflict = client.post("/chat", json={"message": "Harga Avanza?"}, headers={"Idempotency-Key": "k1"})
+    assert conflict.status_code == 422
+
+
+def test_chat_auto_keys_use_the_short_window(chat_client, monkeypatch):
+    client, answers = chat_client
+    request = {"message": "Halo", "context": {"session_id": "s1"}}
+    monkeypatch.setattr(main, "CHAT_AUTO_KEY_TTL", 0)
+    client.post("/chat", json=request)
+    client.post("/chat", json=request)
+    assert len(answers) == 2
+    monkeypatch.setattr(main, "CHAT_AUTO_KEY_TTL", 60)
+    client.post("/chat", json=request)
+    assert client.post("/chat", json=request).headers["idempotent-replayed"] == "true"
+    assert len(answers) == 3
+    # Without a key or a session id nothing is deduplicated
+    client.post("/chat", json={"message": "Halo"})
+    client.post("/chat", json={"message": "Halo"})
+    assert len(answers) == 5
+
+
+def test_chat_idempotency_stats_require_the_admin_token(chat_client, monkeypatch):
+    client, _ = chat_client
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "secret")
+    assert client.get("/debug/chat-idempotency").status_code == 401
+    assert client.get("/debug/chat-idempotency", headers={"X-Admin-Token": "secret"}).json()["executed"] == 0
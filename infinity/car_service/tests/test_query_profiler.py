@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+
+import main
+from query_profiler import QueryProfiler, is_read_only, normalize_sql
+
+
+def test_normalize_sql_collapses_literals_and_in_lists():
+    assert normalize_sql("SELECT * FROM cars WHERE  id IN (%(id_1)s, %(id_2)s) AND name = 'Innova' LIMIT 10") == \
+        "SELECT * FROM cars WHERE id IN (?...) AND name = ? LIMIT ?"
+    assert normalize_sql("SELECT :a, $1, ?") == "SELECT ?, ?, ?"
+
+
+def test_is_read_only():
+    assert is_read_only("  SELECT 1")
+    assert is_read_only("WITH x AS (SELECT 1) SELECT * FROM x")
+    assert not is_read_only("WITH x AS (DELETE FROM cars RETURNING id) SELECT * FROM x")
+    assert not is_read_only("UPDATE cars SET segment = 'MPV'")
+    assert not is_read_only("")
+
+
+def test_profiler_records_statements():
+    engine = create_engine("sqlite://")
+    profiler = QueryProfiler(enabled=True, sample_rate=1.0, slow_ms=0.0, explain=True)
+    event.listen(engine, "before_cursor_execute", profiler._before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", profiler._after_cursor_execute)
+    with engine.connect() as conn:
+        for value in (1, 2, 3):
+            conn.execute(text("SELECT :value"), {"value": value}).all()
+    report = profiler.report()
+    [statement] = report["statements"]
+    assert statement["query"] == "SELECT ?"
+    assert (statement["recorded_calls"], statement["slow_calls"]) == (3, 3)
+    # EXPLAIN ANALYZE is Postgres only
+    assert [sample["explain"] for sample in report["worst"]] == [None, None, None]
+    profiler.reset()
+    assert profiler.report()["statements"] == []
+
+
+def test_debug_queries_requires_the_admin_token(monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "")
+    assert client.get("/debug/queries").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "secret")
+    assert client.get("/debug/queries").status_code == 401
+    assert client.get("/debug/queries", headers={"X-Admin-Token": "secret"}).status_code == 200
+    assert client.delete("/debug/queries", headers={"X-Admin-Token": "secret"}).status_code == 200
@@ -0,0 +1,81 @@
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import Promotion, promotion_discount
+
+
+@pytest.mark.parametrize("percentage, amount, expected", [
+    (Decimal("7.5"), None, Decimal("25481.25")),       # 339750.00 * 7.5% exactly
+    (Decimal("2.25"), None, Decimal("7644.38")),       # 7644.375 rounds half up
+    (Decimal("0.01"), None, Decimal("33.98")),         # 33.975 rounds half up
+    (None, Decimal("15000.00"), Decimal("15000.00")),
+    (Decimal("0"), Decimal("5000.00"), Decimal("5000.00")),
+    (Decimal("150"), None, Decimal("339750.00")),      # capped at the price
+    (None, Decimal("999999999.00"), Decimal("339750.00")),
+    (None, None, Decimal("0.00")),
+    (Decimal("0"), Decimal("0"), Decimal("0.00")),
+])
+def test_promotion_discount(percentage, amount, expected):
+    promotion = Promotion(discount_percentage=percentage, discount_amount=amount)
+    discount = promotion_discount(Decimal("339750.00"), promotion)
+    assert discount == expected
+    assert discount.as_tuple().exponent == -2
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    engine = main.get_engine()
+    main.Base.metadata.create_all(engine)
+    today = date.today()
+    with main.SessionLocal(bind=engine) as db:
+        car = main.Car(model_name=f"Avanza {uuid.uuid4().hex[:6]}", segment="MPV")
+        db.add(car)
+        db.flush()
+        plain = main.CarVariant(car_id=car.id, variant_name="E", price=Decimal("250000000.00"))
+        promoted = main.CarVariant(car_id=car.id, variant_name="G", price=Decimal("280000000.00"))
+        db.add_all([plain, promoted])
+        db.flush()
+        db.add_all([
+            Promotion(variant_id=plain.id, promo_title="Zero promo", discount_percentage=Decimal("0"),
+                      start_date=today - timedelta(days=1), end_date=today + timedelta(days=10)),
+            Promotion(variant_id=promoted.id, promo_title="Cashback", discount_amount=Decimal("5000000.00"),
+                      start_date=today - timedelta(days=1), end_date=today + timedelta(days=10)),
+            Promotion(variant_id=promoted.id, promo_title="Diskon 2.5%", discount_percentage=Decimal("2.5"),
+                      start_date=today - timedelta(days=1), end_date=today + timedelta(days=5)),
+            Promotion(variant_id=promoted.id, promo_title="Expired", discount_percentage=Decimal("50"),
+                      start_date=today - timedelta(days=30), end_date=today - timedelta(days=1)),
+        ])
+        db.commit()
+        ids = {"plain": plain.id, "promoted": promoted.id}
+    # No context manager: the startup hooks (replica monitor, cache warm-up) stay off
+    return TestClient(main.app), ids
+
+
+def test_quote_applies_the_best_active_promotion(catalog):
+    client, ids = catalog
+    response = client.get(f"/variants/{ids['promoted']}/quote")
+    assert response.status_code == 200
+    quote = response.json()["quote"]
+    assert quote["promo_title"] == "Diskon 2.5%"
+    assert Decimal(quote["discount"]) == Decimal("7000000.00")
+    assert Decimal(quote["total_price"]) == Decimal("273000000.00")
+    assert [line["type"] for line in response.json()["data"]] == ["vehicle", "discount", "total"]
+
+
+def test_quote_ignores_promotions_without_a_discount(catalog):
+    client, ids = catalog
+    body = client.get(f"/variants/{ids['plain']}/quote").json()
+    assert body["quote"]["promotion_id"] is None
+    assert body["quote"]["promo_title"] is None
+    assert Decimal(body["quote"]["discount"]) == 0
+    assert [line["type"] for line in body["data"]] == ["vehicle", "total"]
+
+
+def test_quote_for_unknown_variant(catalog):
+    client, _ = catalog
+    assert client.get(f"/variants/{uuid.uuid4()}/quote").status_code == 404
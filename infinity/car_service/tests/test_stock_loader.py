@@ -0,0 +1,91 @@
+import io
+import uuid
+
+import pytest
+
+from city_resolver import CityMatch
+from stock_loader import StockRowError, iter_csv_records, iter_ndjson_records, validate_row
+
+VARIANT_ID = str(uuid.uuid4())
+
+
+def row(**overrides):
+    values = {"variant_id": VARIANT_ID, "city": "Jakarta", "stock_quantity": "3", "indent_estimate_weeks": "2"}
+    values.update(overrides)
+    return values
+
+
+class FakeResolver:
+    """Stands in for a loaded CityResolver."""
+
+    loaded = True
+    matches = {
+        "jkt": CityMatch("Jkt", ["Jakarta"], "alias", "Jabodetabek"),
+        "jakarta": CityMatch("Jakarta", ["Jakarta"], "exact", "Jabodetabek"),
+        "jabodetabek": CityMatch("Jabodetabek", ["Bekasi", "Jakarta"], "region", "Jabodetabek"),
+    }
+
+    def resolve(self, value):
+        return self.matches.get(value.lower())
+
+
+def test_valid_row():
+    assert validate_row(row()) == (VARIANT_ID, "Jakarta", 3, 2)
+
+
+def test_normalizes_whitespace_and_empty_indent():
+    result = validate_row(row(variant_id=f"  {VARIANT_ID.upper()} ", city="  Kota   Bandung ",
+                              stock_quantity=0, indent_estimate_weeks=""))
+    assert result == (VARIANT_ID, "Kota Bandung", 0, None)
+    assert validate_row(row(indent_estimate_weeks=None))[3] is None
+
+
+@pytest.mark.parametrize("overrides, error", [
+    ({"variant_id": "not-a-uuid"}, "invalid variant_id"),
+    ({"variant_id": None}, "invalid variant_id"),
+    ({"city": "  "}, "city is required"),
+    ({"city": "x" * 101}, "city longer than 100 characters"),
+    ({"stock_quantity": ""}, "stock_quantity is required"),
+    ({"stock_quantity": "-1"}, "stock_quantity must not be negative"),
+    ({"stock_quantity": "2.5"}, "stock_quantity must be an integer"),
+    ({"stock_quantity": True}, "stock_quantity must be an integer"),
+    ({"indent_estimate_weeks": "-3"}, "indent_estimate_weeks must not be negative"),
+])
+def test_invalid_rows(overrides, error):
+    with pytest.raises(StockRowError, match=error):
+        validate_row(row(**overrides))
+
+
+def test_cities_are_canonicalized_through_the_resolver():
+    assert validate_row(row(city="Jkt"), FakeResolver())[1] == "Jakarta"
+
+
+def test_unknown_cities_and_regions_are_rejected():
+    with pytest.raises(StockRowError, match="unknown city 'Atlantis'"):
+        validate_row(row(city="Atlantis"), FakeResolver())
+    with pytest.raises(StockRowError, match=r"'Jabodetabek' is a region \(Bekasi, Jakarta\), not a city"):
+        validate_row(row(city="Jabodetabek"), FakeResolver())
+
+
+def test_cities_are_kept_without_a_loaded_dictionary():
+    resolver = FakeResolver()
+    resolver.loaded = False
+    assert validate_row(row(city="Atlantis"), resolver)[1] == "Atlantis"
+
+
+def test_csv_header_is_checked_eagerly():
+    with pytest.raises(ValueError, match="missing columns: stock_quantity"):
+        iter_csv_records(io.StringIO("variant_id,city\n"))
+
+
+def test_csv_records_carry_their_line_number():
+    stream = io.StringIO(f" variant_id , city ,stock_quantity\n{VARIANT_ID},Jakarta,1\n{VARIANT_ID},Bogor,2\n")
+    assert [(n, r["city"]) for n, r in iter_csv_records(stream)] == [(2, "Jakarta"), (3, "Bogor")]
+
+
+def test_ndjson_bad_lines_become_row_errors():
+    stream = io.StringIO('{"city": "Jakarta"}\n\n[1]\n{oops\n')
+    records = list(iter_ndjson_records(stream))
+    assert records[0] == (1, {"city": "Jakarta"})
+    assert records[1] == (3, {"__error__": "expected a JSON object"})
+    assert records[2][0] == 4 and records[2][1]["__error__"].startswith("invalid JSON")
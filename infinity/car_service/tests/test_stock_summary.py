@@ -0,0 +1,63 @@
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import aggregate_stock_rows
+
+
+def stock_row(variant_id, city, quantity, indent):
+    return SimpleNamespace(variant_id=variant_id, model_name="Innova", variant_name="G", segment="MPV",
+                           city=city, stock_quantity=quantity, indent_estimate_weeks=indent)
+
+
+def test_aggregate_stock_rows():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    rows = [
+        stock_row(a, "Jakarta", 3, 2), stock_row(a, "Bandung", 0, 4), stock_row(a, "Surabaya", 2, None),
+        stock_row(a, "Medan", 1, 5), stock_row(b, "Bogor", 0, None),
+    ]
+    summaries = {s["variant_id"]: s for s in aggregate_stock_rows(rows)}
+    assert summaries[a]["total_units"] == 6
+    assert summaries[a]["cities_with_stock"] == ["Jakarta", "Surabaya", "Medan"]
+    assert (summaries[a]["min_indent_weeks"], summaries[a]["median_indent_weeks"]) == (2, 4)
+    assert summaries[b]["cities_with_stock"] == []
+    assert (summaries[b]["min_indent_weeks"], summaries[b]["median_indent_weeks"]) == (None, None)
+
+
+def test_median_interpolates_like_percentile_cont():
+    v = uuid.uuid4()
+    [summary] = aggregate_stock_rows([stock_row(v, "Jakarta", 1, 2), stock_row(v, "Bogor", 1, 5)])
+    assert summary["median_indent_weeks"] == 3.5
+
+
+@pytest.fixture(scope="module")
+def client():
+    engine = main.get_engine()
+    main.Base.metadata.create_all(engine)
+    model_name = f"Fortuner {uuid.uuid4().hex[:6]}"
+    with main.SessionLocal(bind=engine) as db:
+        car = main.Car(model_name=model_name, segment="SUV")
+        db.add(car)
+        db.flush()
+        variant = main.CarVariant(car_id=car.id, variant_name="VRZ", price=Decimal("600000000.00"))
+        db.add(variant)
+        db.flush()
+        for city, quantity, indent in [("Jakarta", 3, 2), ("Bandung", 0, 4), ("Surabaya", 2, None), ("Medan", 1, 6)]:
+            db.add(main.StockInventory(variant_id=variant.id, city=city, stock_quantity=quantity,
+                                       indent_estimate_weeks=indent))
+        db.commit()
+    return TestClient(main.app), model_name
+
+
+def test_stock_summary_endpoint_without_postgres(client):
+    client, model_name = client
+    body = client.get("/stock/summary", params={"model": model_name}).json()
+    [summary] = body["data"]
+    assert summary["model_name"] == model_name
+    assert summary["total_units"] == 6
+    assert sorted(summary["cities_with_stock"]) == ["Jakarta", "Medan", "Surabaya"]
+    assert (summary["min_indent_weeks"], summary["median_indent_weeks"]) == (2, 4)
@@ -0,0 +1,105 @@
+from fastapi.testclient import TestClient
+
+import main
+from tool_output import ToolResultCache, compact_payload, render_table
+
+FIELDS = ["model_name", "variant_name", "price"]
+
+
+def variant(i):
+    return {"model_name": f"Model {i}", "variant_name": "G", "price": f"{200000000 + i}.00", "image_url": "x"}
+
+
+def test_render_table_orders_columns_and_formats_cells():
+    rows = [{"price": "230000000.00", "variant_name": "G | AT", "model_name": "Innova",
+             "features": ["AC", None, "ABS"], "new": True}]
+    text, included, total = render_table(rows, FIELDS + ["features", "new"], 800, 80)
+    assert text.splitlines() == [
+        "model_name|variant_name|price|features|new",
+        "Innova|G / AT|230000000|AC; ABS|yes",
+    ]
+    assert (included, total) == (1, 1)
+
+
+def test_render_table_truncates_long_cells():
+    text, _, _ = render_table([{"model_name": "x" * 50}], ["model_name"], 800, 10)
+    cell = text.splitlines()[1]
+    assert cell == "x" * 9 + "…"
+
+
+def test_render_table_drops_rows_over_the_budget():
+    rows = [variant(i) for i in range(50)]
+    text, included, total = render_table(rows, FIELDS, 60, 80)
+    lines = text.splitlines()
+    assert total == 50
+    assert 0 < included < 50
+    assert lines[1:1 + included] == [f"Model {i}|G|{200000000 + i}" for i in range(included)]
+    assert lines[-1] == f"# {50 - included} more rows omitted; narrow the filters to see them"
+
+
+def test_render_table_always_emits_one_row():
+    text, included, total = render_table([variant(0), variant(1)], FIELDS, 1, 80)
+    assert (included, total) == (1, 2)
+    assert text.splitlines()[1] == "Model 0|G|200000000"
+
+
+def test_render_table_without_rows():
+    text, included, total = render_table([], FIELDS, 800, 80)
+    assert text == "model_name|variant_name|price\n# no rows"
+    assert (included, total) == (0, 0)
+
+
+def test_compact_payload_renders_list_and_single_object():
+    payload = {"status": "success", "data": [variant(0), variant(1)]}
+    assert compact_payload(payload, FIELDS, 800, 80) == (
+        "model_name|variant_name|price\nModel 0|G|200000000\nModel 1|G|200000001"
+    )
+    single = {"status": "success", "data": variant(2)}
+    assert compact_payload(single, FIELDS, 800, 80).splitlines()[1] == "Model 2|G|200000002"
+
+
+def test_compact_payload_prefixes_the_note():
+    payload = {"status": "success", "data": [], "note": "No stock in Bandung; showing nearby cities"}
+    assert compact_payload(payload, FIELDS, 800, 80).splitlines() == [
+        "# No stock in Bandung; showing nearby cities",
+        "model_name|variant_name|price",
+        "# no rows",
+    ]
+
+
+def test_compact_payload_rejects_other_shapes():
+    assert compact_payload([variant(0)], FIELDS, 800, 80) is None
+    assert compact_payload({"status": "success"}, FIELDS, 800, 80) is None
+    assert compact_payload({"data": "text"}, FIELDS, 800, 80) is None
+    assert compact_payload({"data": [variant(0), 1]}, FIELDS, 800, 80) is None
+
+
+def test_tool_result_cache_evicts_least_recently_used():
+    cache = ToolResultCache(maxsize=2)
+    cache.set(("a", 1), "A")
+    cache.set(("b", 1), "B")
+    assert cache.get(("a", 1)) == "A"
+    cache.set(("c", 1), "C")
+    assert cache.get(("b", 1)) is None
+    assert cache.get(("a", 1)) == "A"
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1}
+
+
+def test_compact_payload_renders_the_summary():
+    payload = {
+        "status": "success",
+        "data": [{"facet": "fuel_type", "value": "Bensin", "count": 3}],
+        "summary": {"total_variants": 3, "seating_min": None, "price_min": "250000000.00"},
+    }
+    assert compact_payload(payload, ["facet", "value", "count"], 800, 80).splitlines() == [
+        "# summary: total_variants=3, price_min=250000000",
+        "facet|value|count",
+        "fuel_type|Bensin|3",
+    ]
+
+
+def test_tool_cache_stats_require_the_admin_token(monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "secret")
+    assert client.get("/debug/tool-cache").status_code == 401
+    assert "catalog_version" in client.get("/debug/tool-cache", headers={"X-Admin-Token": "secret"}).json()
@@ -0,0 +1,184 @@
+"""
+Compact rendering and caching for MCP tool responses.
+
+The MCP tools exposed by car_service are plain FastAPI endpoints, so their
+JSON payloads are written for the frontend: every variant carries long
+marketing text, image URLs and nested feature maps. When an agent calls
+those tools, the whole payload is pasted into the LLM prompt. This module
+turns such payloads into a small, stable pipe-separated table that fits a
+token budget, and keeps a bounded cache of rendered tool results keyed by
+catalog version.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Approximate characters per token for Qwen/Llama style BPE tokenizers on
+# mixed Indonesian/English text. Good enough for budgeting, not for billing.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in ``text``."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def parse_fields(raw: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated field list, returning ``None`` when empty."""
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    return fields or None
+
+
+def _format_cell(value: Any, max_chars: int) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        value = "; ".join(str(v) for v in value.values() if v is not None)
+    elif isinstance(value, (list, tuple)):
+        value = "; ".join(str(v) for v in value if v is not None)
+    elif isinstance(value, bool):
+        value = "yes" if value else "no"
+
+    text = str(value)
+
+    # Prices arrive as Decimal strings ("230000000.00"); drop zero cents.
+    if text.endswith(".00"):
+        try:
+            Decimal(text)
+            text = text[:-3]
+        except InvalidOperation:
+            pass
+
+    text = " ".join(text.replace("|", "/").split())
+    if max_chars and len(text) > max_chars:
+        text = text[: max(max_chars - 1, 1)].rstrip() + "…"
+    return text
+
+
+def render_table(
+    rows: Iterable[Dict[str, Any]],
+    fields: List[str],
+    token_budget: int,
+    max_cell_chars: int,
+) -> Tuple[str, int, int]:
+    """
+    Render ``rows`` as a pipe-separated table limited to ``token_budget``.
+
+    Columns follow the order of ``fields`` so identical inputs always produce
+    identical output. Rows that do not fit the budget are dropped from the
+    end and summarised in a trailing note.
+
+    Returns the rendered text, the number of rows included and the total
+    number of rows.
+    """
+    rows = list(rows)
+    lines = ["|".join(fields)]
+    used = estimate_tokens(lines[0]) + 1
+    included = 0
+
+    for row in rows:
+        line = "|".join(_format_cell(row.get(f), max_cell_chars) for f in fields)
+        cost = estimate_tokens(line) + 1
+        # Always emit at least one row so the tool never answers with a bare header.
+        if included and token_budget and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+        included += 1
+
+    if included < len(rows):
+        lines.append(f"# {len(rows) - included} more rows omitted; narrow the filters to see them")
+    elif not rows:
+        lines.append("# no rows")
+
+    return "\n".join(lines), included, len(rows)
+
+
+def compact_payload(
+    payload: Any,
+    fields: List[str],
+    token_budget: int,
+    max_cell_chars: int,
+) -> Optional[str]:
+    """
+    Convert a standard ``{"status": ..., "data": ...}`` response into a table.
+
+    A string ``note`` and a flat ``summary`` object (totals and ranges next to
+    the rows) become comment lines above the table.
+
+    Returns ``None`` when the payload does not have the expected shape so the
+    caller can fall back to the original JSON.
+    """
+    if not isinstance(payload, dict) or "data" not in payload:
+        return None
+
+    data = payload["data"]
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(r, dict) for r in data):
+        return None
+
+    table, _, _ = render_table(data, fields, token_budget, max_cell_chars)
+    summary = payload.get("summary")
+    if isinstance(summary, dict):
+        values = ", ".join(f"{k}={_format_cell(v, max_cell_chars)}" for k, v in summary.items() if v is not None)
+        if values:
+            table = f"# summary: {values}\n{table}"
+    if isinstance(payload.get("note"), str):
+        table = f"# {payload['note']}\n{table}"
+    return table
+
+
+class ToolResultCache:
+    """
+    Thread-safe LRU cache for rendered tool responses and derived results.
+
+    Keys must include the catalog version; entries from older versions are
+    never read again and simply age out of the LRU.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: Tuple, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
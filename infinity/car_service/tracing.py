@@ -0,0 +1,295 @@
+"""
+Lightweight request tracing for car_service.
+
+Every request gets a ``Trace`` bound to a context variable. Code records
+spans into it (database statements are captured automatically through
+SQLAlchemy engine events), the HTTP middleware in main.py turns the spans
+into a ``Server-Timing`` header, and finished traces are handed to an
+exporter running on a background thread:
+
+* ``file`` - one JSON object per line in ``TRACE_FILE``
+* ``otlp`` - OTLP/HTTP JSON batches posted to ``OTLP_TRACES_ENDPOINT``
+
+The request id is the trace id. It is generated by the gateway and arrives
+as ``X-Request-ID`` (and ``traceparent``); car_service only generates one
+when it is called directly.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACEPARENT_HEADER = "traceparent"
+
+# Server-Timing metric per span kind, in the order they are reported
+SPAN_KINDS = ("db", "serialize", "upstream", "llm")
+
+_TRACEPARENT_RE = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+def new_span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str, parent_span_id: Optional[str] = None):
+        self.request_id = request_id
+        self.trace_id = request_id if re.fullmatch(r"[0-9a-f]{32}", request_id) else uuid.uuid5(
+            uuid.NAMESPACE_URL, request_id).hex
+        self.span_id = new_span_id()
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.attributes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, kind: str, name: str, start_ns: int, end_ns: int, **attributes) -> None:
+        with self._lock:
+            self.spans.append({
+                "span_id": new_span_id(),
+                "kind": kind,
+                "name": name,
+                "start_ns": start_ns,
+                "end_ns": end_ns,
+                "attributes": attributes,
+            })
+
+    def totals(self) -> Dict[str, Tuple[float, int]]:
+        """Total milliseconds and span count per kind."""
+        totals: Dict[str, Tuple[float, int]] = {}
+        with self._lock:
+            for span in self.spans:
+                ms, count = totals.get(span["kind"], (0.0, 0))
+                totals[span["kind"]] = (ms + (span["end_ns"] - span["start_ns"]) / 1e6, count + 1)
+        return totals
+
+    def server_timing(self) -> str:
+        end_ns = self.end_ns or time.time_ns()
+        total_ms = (end_ns - self.start_ns) / 1e6
+        totals = self.totals()
+        entries = []
+        accounted = 0.0
+        for kind in SPAN_KINDS:
+            if kind in totals:
+                ms, count = totals[kind]
+                accounted += ms
+                entries.append(f'{kind};dur={ms:.1f};desc="{count}x"')
+        entries.append(f"app;dur={max(total_ms - accounted, 0.0):.1f}")
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "spans": self.spans,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+def start_trace(headers, name: str) -> Tuple[Trace, contextvars.Token]:
+    """Start a trace for an incoming request, continuing the caller's ids when present."""
+    request_id = headers.get(REQUEST_ID_HEADER)
+    parent_span_id = None
+    match = _TRACEPARENT_RE.match(headers.get(TRACEPARENT_HEADER) or "")
+    if match:
+        request_id = request_id or match.group(1)
+        parent_span_id = match.group(2)
+    if not request_id or not _REQUEST_ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    trace = Trace(request_id, name, parent_span_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token) -> None:
+    _current_trace.reset(token)
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes):
+    """Record a span of ``kind`` (db, serialize, upstream, llm) in the current trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start_ns = time.time_ns()
+    try:
+        yield
+    finally:
+        trace.add_span(kind, name, start_ns, time.time_ns(), **attributes)
+
+
+def propagation_headers() -> Dict[str, str]:
+    """Headers that carry the current request id to the next hop."""
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    return {
+        "X-Request-ID": trace.request_id,
+        "traceparent": f"00-{trace.trace_id}-{trace.span_id}-01",
+    }
+
+
+# -----------------------------------------------------------------
+# SQLAlchemy instrumentation
+# -----------------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_trace.get() is not None:
+        conn.info.setdefault("trace_query_start", []).append(time.time_ns())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    starts = conn.info.get("trace_query_start")
+    if trace is None or not starts:
+        return
+    start_ns = starts.pop()
+    trace.add_span("db", statement.split(None, 1)[0].upper() if statement else "SQL", start_ns, time.time_ns(),
+                   statement=statement[:500])
+
+
+# -----------------------------------------------------------------
+# Exporters
+# -----------------------------------------------------------------
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+def to_otlp_spans(trace: Trace) -> List[Dict[str, Any]]:
+    root = {
+        "traceId": trace.trace_id,
+        "spanId": trace.span_id,
+        "name": trace.name,
+        "kind": 2,  # SERVER
+        "startTimeUnixNano": str(trace.start_ns),
+        "endTimeUnixNano": str(trace.end_ns or time.time_ns()),
+        "attributes": _otlp_attributes({"request.id": trace.request_id, **trace.attributes}),
+    }
+    if trace.parent_span_id:
+        root["parentSpanId"] = trace.parent_span_id
+    spans = [root]
+    for child in trace.spans:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": child["span_id"],
+            "parentSpanId": trace.span_id,
+            "name": f"{child['kind']} {child['name']}",
+            "kind": 3 if child["kind"] in ("upstream", "llm") else 1,  # CLIENT / INTERNAL
+            "startTimeUnixNano": str(child["start_ns"]),
+            "endTimeUnixNano": str(child["end_ns"]),
+            "attributes": _otlp_attributes({"span.kind": child["kind"], **child["attributes"]}),
+        })
+    return spans
+
+
+class TraceExporter:
+    """Ships finished traces from a background thread so requests never wait on I/O."""
+
+    def __init__(self, mode: str, service_name: str, file_path: str = "", otlp_endpoint: str = "",
+                 max_queue: int = 10000, batch_size: int = 100):
+        self.mode = mode
+        self.service_name = service_name
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("file", "otlp")
+
+    def submit(self, trace: Trace) -> None:
+        if not self.enabled:
+            return
+        # Threads do not survive fork; start one lazily in each worker.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        client = httpx.Client(timeout=5.0) if self.mode == "otlp" else None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            try:
+                if self.mode == "file":
+                    with open(self.file_path, "a", encoding="utf-8") as f:
+                        for trace in batch:
+                            f.write(json.dumps({"service": self.service_name, **trace.to_dict()}) + "\n")
+                else:
+                    client.post(self.otlp_endpoint, json=self._otlp_payload(batch))
+            except Exception as e:
+                logger.warning(f"Failed to export {len(batch)} traces: {e}")
+
+    def _otlp_payload(self, batch: List[Trace]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "car_service.tracing"},
+                    "spans": [s for trace in batch for s in to_otlp_spans(trace)],
+                }],
+            }]
+        }
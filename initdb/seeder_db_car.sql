@@ -116,6 +116,36 @@ CREATE TABLE public.dress_codes (
 );
 COMMENT ON TABLE public.dress_codes IS 'Panduan standar pakaian untuk staf berdasarkan peran dan hari.';
 
+-- =================================================================
+-- TABEL DIMENSI KOTA
+-- =================================================================
+
+-- 10. Wilayah (kelompok kota yang berdekatan)
+CREATE TABLE public.regions (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE -- 'Jabodetabek', 'Jawa Timur'
+);
+COMMENT ON TABLE public.regions IS 'Wilayah untuk mengelompokkan kota yang berdekatan.';
+
+-- 11. Kota Kanonik
+-- name harus sama persis dengan nilai kolom city di stock_inventory, workshops dan communities.
+CREATE TABLE public.cities (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    region_id INT REFERENCES public.regions(id),
+    latitude DECIMAL(9, 6),
+    longitude DECIMAL(9, 6)
+);
+COMMENT ON TABLE public.cities IS 'Daftar kota kanonik beserta wilayah dan koordinat.';
+
+-- 12. Alias Kota
+-- Ejaan lain yang dipakai pengguna (singkatan, nama wilayah administratif).
+CREATE TABLE public.city_aliases (
+    alias VARCHAR(100) PRIMARY KEY, -- disimpan dalam huruf kecil
+    city_id INT NOT NULL REFERENCES public.cities(id) ON DELETE CASCADE
+);
+COMMENT ON TABLE public.city_aliases IS 'Alias dan singkatan nama kota untuk pencarian lokasi.';
+
 -- =================================================================
 -- DATA SEED - CARS
 -- =================================================================
@@ -289,6 +319,52 @@ INSERT INTO public.dress_codes (role, day_of_week, attire_description) VALUES
     ('Kasir', 'Jumat', 'Seragam kasir dengan kemeja batik atau warna khusus hari Jumat sesuai kebijakan'),
     ('Kasir', 'Sabtu', 'Seragam kasir casual: polo shirt dengan logo, celana hitam, sepatu hitam casual');
 
+-- =================================================================
+-- DATA SEED - REGIONS, CITIES & ALIASES
+-- =================================================================
+
+INSERT INTO public.regions (id, name) VALUES
+    (1, 'Jabodetabek'),
+    (2, 'Jawa Barat'),
+    (3, 'Jawa Tengah'),
+    (4, 'DI Yogyakarta'),
+    (5, 'Jawa Timur'),
+    (6, 'Sumatera Utara'),
+    (7, 'Bali'),
+    (8, 'Sulawesi Selatan');
+
+INSERT INTO public.cities (id, name, region_id, latitude, longitude) VALUES
+    (1, 'Jakarta', 1, -6.208800, 106.845600),
+    (2, 'Bekasi', 1, -6.238300, 106.975600),
+    (3, 'Depok', 1, -6.402500, 106.794200),
+    (4, 'Tangerang', 1, -6.178300, 106.631900),
+    (5, 'Bogor', 1, -6.597100, 106.806000),
+    (6, 'Bandung', 2, -6.917500, 107.619100),
+    (7, 'Cimahi', 2, -6.872200, 107.542500),
+    (8, 'Cirebon', 2, -6.732000, 108.552300),
+    (9, 'Semarang', 3, -6.966700, 110.416700),
+    (10, 'Solo', 3, -7.575500, 110.824300),
+    (11, 'Yogyakarta', 4, -7.795600, 110.369500),
+    (12, 'Surabaya', 5, -7.257500, 112.752100),
+    (13, 'Sidoarjo', 5, -7.447800, 112.718300),
+    (14, 'Malang', 5, -7.966600, 112.632600),
+    (15, 'Medan', 6, 3.595200, 98.672200),
+    (16, 'Binjai', 6, 3.600100, 98.485400),
+    (17, 'Denpasar', 7, -8.650000, 115.216700),
+    (18, 'Makassar', 8, -5.147700, 119.432700);
+
+SELECT setval('public.regions_id_seq', (SELECT MAX(id) FROM public.regions));
+SELECT setval('public.cities_id_seq', (SELECT MAX(id) FROM public.cities));
+
+INSERT INTO public.city_aliases (alias, city_id) VALUES
+    ('dki', 1), ('dki jakarta', 1), ('jkt', 1), ('jakarta raya', 1),
+    ('jakarta pusat', 1), ('jakarta selatan', 1), ('jakarta utara', 1), ('jakarta barat', 1), ('jakarta timur', 1),
+    ('jakpus', 1), ('jaksel', 1), ('jakut', 1), ('jakbar', 1), ('jaktim', 1),
+    ('bks', 2), ('tangsel', 4), ('tangerang selatan', 4), ('bgr', 5),
+    ('bdg', 6), ('bandung raya', 6), ('crb', 8), ('smg', 9), ('surakarta', 10),
+    ('jogja', 11), ('jogjakarta', 11), ('yogya', 11), ('diy', 11), ('yk', 11),
+    ('sby', 12), ('suroboyo', 12), ('mlg', 14), ('mdn', 15), ('dps', 17), ('mks', 18), ('ujung pandang', 18);
+
 -- =================================================================
 -- INDEXES FOR PERFORMANCE
 -- =================================================================
@@ -299,4 +375,6 @@ CREATE INDEX idx_car_variants_target_demographic ON public.car_variants(target_d
 CREATE INDEX idx_car_variants_use_case ON public.car_variants USING gin(to_tsvector('english', use_case));
 CREATE INDEX idx_promotions_dates ON public.promotions(start_date, end_date);
 CREATE INDEX idx_stock_inventory_city ON public.stock_inventory(city);
-CREATE INDEX idx_stock_inventory_variant_city ON public.stock_inventory(variant_id, city);
\ No newline at end of file
+CREATE INDEX idx_stock_inventory_variant_city ON public.stock_inventory(variant_id, city);
+CREATE INDEX idx_workshops_city ON public.workshops(city);
+CREATE INDEX idx_communities_base_city ON public.communities(base_city);
@@ -0,0 +1,95 @@
+"""
+Pool of pre-initialized qwen_agent ``Assistant`` instances.
+
+One ``Assistant`` must not run two conversations at once, and building one
+(LLM client, MCP tool discovery) is too slow to do per request. The pool
+builds ``size`` agents up front and lends each to one request at a time.
+
+Requests that find every agent busy wait in a bounded queue. When
+``max_waiting`` requests are already waiting, or an agent does not free up
+within ``wait_timeout`` seconds, ``PoolBusy`` is raised and the API answers
+429 so clients back off instead of piling up behind the LLM.
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class PoolBusy(Exception):
+    """No agent became available; the caller should retry later."""
+
+
+class AgentPool:
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        size: int = 4,
+        max_waiting: int = 16,
+        wait_timeout: float = 30.0,
+    ):
+        self.size = size
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.served = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.agents: List[Any] = [factory() for _ in range(size)]
+        for agent in self.agents:
+            self._idle.put(agent)
+
+    def acquire(self) -> Any:
+        with self._lock:
+            if self._idle.empty() and self._waiting >= self.max_waiting:
+                self.rejected += 1
+                raise PoolBusy(f"{self._waiting} requests already waiting for an agent")
+            self._waiting += 1
+        started = time.monotonic()
+        try:
+            agent = self._idle.get(timeout=self.wait_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy(f"no agent free after {self.wait_timeout}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self.served += 1
+            self.wait_seconds_total += time.monotonic() - started
+        return agent
+
+    def try_acquire(self) -> Optional[Any]:
+        """An idle agent without waiting, or None; for background upkeep, not requests."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return None
+
+    def release(self, agent: Any) -> None:
+        self._idle.put(agent)
+
+    @contextmanager
+    def lease(self) -> Iterator[Any]:
+        agent = self.acquire()
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "waiting": self._waiting,
+                "max_waiting": self.max_waiting,
+                "served": self.served,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds_total / self.served * 1000, 1) if self.served else 0.0,
+            }
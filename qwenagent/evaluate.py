@@ -0,0 +1,238 @@
+"""
+Batch evaluation of the agent over a fixed set of questions.
+
+Reads a JSONL file, one question per line::
+
+    {"id": "family-7-seater", "question": "Rekomendasi mobil 7 kursi 300 juta", "expect": ["Innova"]}
+
+(``question`` may also be ``message``; ``id`` defaults to the line number;
+``expect`` is optional and lists substrings the answer must contain, case
+insensitive). Every question runs through ``init_agent_service()`` - the
+same agent class, tools and LLM backend pool as the API - on a pool of
+``--concurrency`` agents, so it can compare models, prompts or tool
+changes against the same queries.
+
+Each result line records the answer, the tool trace (calls, arguments,
+shortened results, durations), the latency and its stages and the
+estimated tokens, as in ``/api/metrics``. The summary reports throughput,
+latency percentiles, token totals, tool errors and failures.
+
+The LLM call cache is off unless ``--use-cache`` is given, so repeated runs
+measure the model and not the cache. Set ``LLM_MODEL_SERVER`` (or
+``LLM_BACKENDS``) to ``benchmarks/stub_llm.py`` to run without a GPU.
+
+Usage:
+    python evaluate.py questions.jsonl --concurrency 4 --output results.jsonl --summary summary.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_cache import as_dict
+from metrics import RunMetrics
+
+MAX_TOOL_RESULT_CHARS = 500
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            question = item.get("question") or item.get("message")
+            if not question:
+                raise ValueError(f"{path}:{number}: 'question' is required")
+            questions.append({
+                "id": str(item.get("id", number)),
+                "question": question,
+                "expect": item.get("expect") or [],
+            })
+    return questions
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(item.get("text") or "" for item in content if isinstance(item, dict))
+    return content or ""
+
+
+def tool_trace(messages: List[Dict[str, Any]], tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tool calls of a turn with their results, matched with the durations ``RunMetrics`` recorded."""
+    trace = []
+    for message in messages:
+        if message.get("function_call"):
+            call = message["function_call"]
+            trace.append({"name": call.get("name"), "arguments": call.get("arguments"), "result": None})
+        elif message.get("role") == "function":
+            pending = [step for step in trace if step["result"] is None]
+            if pending:
+                result = _text(message.get("content"))
+                pending[0]["result"] = result if len(result) <= MAX_TOOL_RESULT_CHARS else result[:MAX_TOOL_RESULT_CHARS] + "…"
+    # Parallel calls are recorded in completion order, so match on name and
+    # arguments. Identical calls of one round run once and share the record.
+    recorded: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+    for call in tool_calls:
+        recorded.setdefault((call["name"], call.get("arguments")), []).append(call)
+    for step in trace:
+        calls = recorded.get((step["name"], step["arguments"]))
+        if calls:
+            call = calls.pop(0) if len(calls) > 1 else calls[0]
+            step["duration_ms"] = call["duration_ms"]
+            step["ok"] = call["ok"]
+    return trace
+
+
+def final_answer(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "assistant" and not message.get("function_call"):
+            return _text(message.get("content"))
+    return ""
+
+
+def evaluate_one(pool, item: Dict[str, Any]) -> Dict[str, Any]:
+    run = RunMetrics()
+    result: Dict[str, Any] = {"id": item["id"], "question": item["question"]}
+    response = None
+    try:
+        with pool.lease() as bot:
+            run.queue_ms = (time.monotonic() - run.started) * 1000
+            bot.run_metrics = run
+            try:
+                for response in bot.run(messages=[{"role": "user", "content": item["question"]}]):
+                    pass
+            finally:
+                bot.run_metrics = None
+        result["ok"] = True
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    summary = run.summary()
+    messages = [as_dict(message) for message in response or []]
+    result["answer"] = final_answer(messages)
+    if item["expect"]:
+        answer = result["answer"].lower()
+        result["passed"] = result["ok"] and all(expected.lower() in answer for expected in item["expect"])
+    result["latency_ms"] = summary["total_ms"]
+    result["stages_ms"] = summary["stages_ms"]
+    result["llm_calls"] = summary["llm_call_count"]
+    result["fallback_calls"] = summary["fallback_calls"]
+    result["tokens"] = {"prompt": summary["prompt_tokens"], "completion": summary["completion_tokens"]}
+    result["tool_trace"] = tool_trace(messages, summary["tool_calls"])
+    result["tool_timeouts"] = summary["tool_timeouts"]
+    return result
+
+
+def summarize(results: List[Dict[str, Any]], wall_seconds: float, concurrency: int) -> Dict[str, Any]:
+    completed = [r for r in results if r["ok"]]
+    latencies = [r["latency_ms"] for r in completed]
+    checked = [r for r in results if "passed" in r]
+    tool_steps = [step for r in results for step in r["tool_trace"]]
+    tool_counts: Dict[str, int] = {}
+    for step in tool_steps:
+        tool_counts[step["name"]] = tool_counts.get(step["name"], 0) + 1
+    completion_tokens = sum(r["tokens"]["completion"] for r in completed)
+    return {
+        "questions": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "failure_rate": round((len(results) - len(completed)) / len(results), 4) if results else 0.0,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_qps": round(len(completed) / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 1) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+        "llm_calls_per_question": round(statistics.mean(r["llm_calls"] for r in completed), 2) if completed else None,
+        "fallback_calls": sum(r["fallback_calls"] for r in results),
+        "prompt_tokens": sum(r["tokens"]["prompt"] for r in completed),
+        "completion_tokens": completion_tokens,
+        "completion_tokens_per_second": round(completion_tokens / wall_seconds, 1) if wall_seconds else None,
+        "tokens_estimated": True,
+        "tool_calls": tool_counts,
+        "tool_errors": sum(1 for step in tool_steps if step.get("ok") is False),
+        "tool_timeouts": sum(len(r["tool_timeouts"]) for r in results),
+        "passed": sum(1 for r in checked if r["passed"]) if checked else None,
+        "checked": len(checked),
+        "failures": [{"id": r["id"], "error": r["error"]} for r in results if not r["ok"]][:20],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL file with one question per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight (one agent each)")
+    parser.add_argument("--repeat", type=int, default=1, help="Run the question set this many times")
+    parser.add_argument("--limit", type=int, help="Only the first N questions")
+    parser.add_argument("--use-cache", action="store_true", help="Keep the LLM call cache on")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip priming the LLM backends before timing")
+    parser.add_argument("--output", help="Write one result per line to this JSONL file")
+    parser.add_argument("--summary", help="Write the summary JSON to this file")
+    args = parser.parse_args()
+
+    if not args.use_cache:
+        os.environ["LLM_CACHE"] = "false"
+    # After the environment is final: main reads its config on import
+    from agent_pool import AgentPool
+    from main import CAR_TOOLS_MODE, get_llm_pool, init_agent_service, prime_llm
+
+    questions = load_questions(args.questions)[: args.limit] * args.repeat
+    started = time.monotonic()
+    pool = AgentPool(init_agent_service, size=args.concurrency, max_waiting=len(questions), wait_timeout=3600)
+    setup_seconds = time.monotonic() - started
+    if not args.no_warmup:
+        prime_llm(pool.agents[0])
+    print(f"{len(questions)} questions, {args.concurrency} agents ready in {setup_seconds:.1f}s", file=sys.stderr)
+
+    results = []
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for result in executor.map(lambda item: evaluate_one(pool, item), questions):
+            results.append(result)
+            if output:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            status = "ok" if result["ok"] else "FAILED"
+            print(f"[{len(results)}/{len(questions)}] {result['id']}: {status} {result['latency_ms']:.0f} ms", file=sys.stderr)
+    wall_seconds = time.monotonic() - started
+    if output:
+        output.close()
+
+    summary = summarize(results, wall_seconds, args.concurrency)
+    summary["setup_seconds"] = round(setup_seconds, 2)
+    summary["tools_mode"] = CAR_TOOLS_MODE
+    summary["llm_backends"] = [
+        {"url": b["url"], "model": b["model"], "fallback": b["fallback"], "served": b["served"], "errors": b["errors"]}
+        for b in get_llm_pool().stats()["backends"]
+    ]
+    text = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 0 if summary["completed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
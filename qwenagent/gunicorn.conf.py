@@ -0,0 +1,25 @@
+# Production serving for the qwenagent HTTP API:
+#   gunicorn -c gunicorn.conf.py "main:create_api()"
+#
+# Every worker process builds its own AgentPool (AGENT_POOL_SIZE agents) after
+# fork, so the app is not preloaded. Threads cover the agents, the pool's
+# waiting room and a few spare threads that answer 429 for requests beyond
+# that, so overload is rejected quickly instead of queueing invisibly inside
+# gunicorn. The LLM server sees up to QWEN_WORKERS * AGENT_POOL_SIZE
+# concurrent generations.
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('QWEN_PORT', '9000')}"
+workers = int(os.getenv("QWEN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("AGENT_POOL_SIZE", "4")) + int(os.getenv("AGENT_QUEUE_SIZE", "16")) + 4
+preload_app = False
+
+# A chat turn with several tool rounds can take minutes on a local model
+timeout = int(os.getenv("QWEN_WORKER_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+loglevel = os.getenv("QWEN_LOG_LEVEL", "info")
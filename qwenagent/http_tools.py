@@ -0,0 +1,165 @@
+"""
+car_service operations as native qwen_agent tools over plain HTTP.
+
+With MCP every tool call travels over the SSE transport into car_service's
+``/mcp`` mount, which then calls the FastAPI endpoint. The operations are
+plain GETs, so here each one becomes a ``BaseTool`` that calls the gateway
+directly through one pooled ``httpx.Client`` per process (keep-alive
+connections, no session handshake or message framing).
+
+The tool schemas are generated from car_service's OpenAPI document and kept
+compact: parameter name, JSON type, enum and a shortened description only,
+with no titles, defaults or ``anyOf`` null unions. This keeps the function
+list the model reads on every call small. The endpoints are asked for the
+same compact table output (``X-Tool-Format``) the MCP path gets.
+"""
+
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from qwen_agent.tools.base import BaseTool
+
+# Same operations car_service exposes over MCP
+DEFAULT_OPERATIONS = [
+    "list cars", "list car variants", "get car recommendations",
+    "compare variants", "list promotions", "get stock info",
+    "get recommendation facets", "get stock summary", "list variant accessories", "get variant quote",
+]
+
+MAX_DESCRIPTION_CHARS = 120
+MAX_PARAM_DESCRIPTION_CHARS = 80
+
+_client: Optional[httpx.Client] = None
+_schemas: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def _shorten(text: Optional[str], limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def tool_name(operation_id: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", operation_id.lower()).strip("_")
+
+
+def _compact_type(schema: Dict[str, Any]) -> Dict[str, Any]:
+    # FastAPI renders Optional[X] as anyOf [X, null]; the model only needs X
+    options = [s for s in schema.get("anyOf", [schema]) if s.get("type") != "null"]
+    chosen = options[0] if options else {}
+    compact = {"type": {"number": "number", "integer": "integer", "boolean": "boolean"}.get(chosen.get("type"), "string")}
+    if chosen.get("enum"):
+        compact["enum"] = chosen["enum"]
+    return compact
+
+
+def compact_operations(openapi: Dict[str, Any], operation_ids: List[str]) -> List[Dict[str, Any]]:
+    """Tool specs (path, method, compact function schema) for ``operation_ids``."""
+    wanted = set(operation_ids)
+    operations = []
+    for path, methods in openapi.get("paths", {}).items():
+        for method, operation in methods.items():
+            if operation.get("operationId") not in wanted:
+                continue
+            properties = {}
+            required = []
+            path_params = []
+            for param in operation.get("parameters", []):
+                if param.get("in") not in ("path", "query"):
+                    continue
+                schema = param.get("schema", {})
+                prop = _compact_type(schema)
+                description = param.get("description") or schema.get("description")
+                if schema.get("format") == "uuid" or any(s.get("format") == "uuid" for s in schema.get("anyOf", [])):
+                    description = f"{description} (UUID)" if description else "UUID"
+                if description:
+                    prop["description"] = _shorten(description, MAX_PARAM_DESCRIPTION_CHARS)
+                properties[param["name"]] = prop
+                if param.get("required"):
+                    required.append(param["name"])
+                if param.get("in") == "path":
+                    path_params.append(param["name"])
+            operations.append({
+                "operation_id": operation["operationId"],
+                "method": method.upper(),
+                "path": path,
+                "path_params": path_params,
+                "function": {
+                    "name": tool_name(operation["operationId"]),
+                    "description": _shorten(operation.get("description") or operation.get("summary"), MAX_DESCRIPTION_CHARS),
+                    "parameters": {"type": "object", "properties": properties, "required": required},
+                },
+            })
+    # Keep the configured order so the function list is stable
+    order = {operation_id: i for i, operation_id in enumerate(operation_ids)}
+    return sorted(operations, key=lambda op: order[op["operation_id"]])
+
+
+def get_client(timeout: float = 30.0, max_connections: int = 32) -> httpx.Client:
+    """The process-wide pooled client every HTTP tool shares."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            )
+        return _client
+
+
+class HttpTool(BaseTool):
+    """One car_service operation, called with a GET through the gateway."""
+
+    def __init__(self, spec: Dict[str, Any], base_url: str, client: httpx.Client, headers: Dict[str, str]):
+        self.name = spec["function"]["name"]
+        self.description = spec["function"]["description"]
+        self.parameters = spec["function"]["parameters"]
+        super().__init__()
+        self.spec = spec
+        self.base_url = base_url.rstrip("/")
+        self.client = client
+        self.headers = headers
+
+    def call(self, params, **kwargs) -> str:
+        args = self._verify_json_format_args(params)
+        path = self.spec["path"]
+        for name in self.spec["path_params"]:
+            path = path.replace("{" + name + "}", str(args.pop(name)))
+        query = {k: v for k, v in args.items() if v is not None}
+        response = self.client.request(self.spec["method"], f"{self.base_url}{path}", params=query, headers=self.headers)
+        if response.status_code >= 400:
+            return f"Error {response.status_code}: {_shorten(response.text, 300)}"
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return json.dumps(response.json(), ensure_ascii=False)
+        return response.text
+
+
+def build_http_tools(
+    base_url: str,
+    openapi_url: str,
+    operation_ids: Optional[List[str]] = None,
+    timeout: float = 30.0,
+    max_connections: int = 32,
+    tool_format: str = "compact",
+) -> List[HttpTool]:
+    """Native tools for ``operation_ids``; the OpenAPI document is fetched once per process."""
+    operation_ids = operation_ids or DEFAULT_OPERATIONS
+    client = get_client(timeout, max_connections)
+    key = (openapi_url, tuple(operation_ids))
+    with _lock:
+        specs = _schemas.get(key)
+    if specs is None:
+        response = client.get(openapi_url)
+        response.raise_for_status()
+        specs = compact_operations(response.json(), operation_ids)
+        missing = set(operation_ids) - {spec["operation_id"] for spec in specs}
+        if missing:
+            raise ValueError(f"Operations not found in {openapi_url}: {', '.join(sorted(missing))}")
+        with _lock:
+            _schemas[key] = specs
+    headers = {"X-Tool-Format": tool_format} if tool_format else {}
+    return [HttpTool(spec, base_url, client, headers) for spec in specs]
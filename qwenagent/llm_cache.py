@@ -0,0 +1,184 @@
+"""
+Disk-backed cache for deterministic LLM output.
+
+The agent runs with ``temperature: 0`` and a fixed generate config, so the
+same messages produce the same output. Two kinds of entries are stored in
+one SQLite file shared by every gunicorn worker:
+
+* ``call``   - one LLM call inside the tool loop, keyed on model, generate
+  config, the function schemas offered to the model and the messages sent.
+  Tool results are part of the messages, so a call whose tools returned
+  new data misses by construction; these entries can live long.
+* ``answer`` - the final response of a whole turn, keyed on model, generate
+  config, tool-set fingerprint and the user's messages. The tool results
+  behind it are not part of the key, so catalog changes (prices, stock) are
+  only picked up when the entry expires; keep this TTL short.
+
+Every entry records the fingerprint of the MCP tool list it was produced
+with; ``invalidate_tools()`` drops entries from any other tool list when
+the agents (re)load their tools. Size is bounded by entry count and total
+bytes, evicting least recently used entries first.
+
+The agents discover their tools once, when the worker's agent pool is built
+during warm-up, and that is also when the fingerprint is taken; re-warming
+reuses both. A car_service deploy that changes tool schemas is therefore
+only picked up, by the agents and by this cache, when qwenagent restarts:
+restart it after such a deploy (or clear the cache file) rather than wait
+for the entries to expire.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    tools_hash TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_tools ON llm_cache (tools_hash);
+"""
+
+def as_dict(message: Any) -> Dict[str, Any]:
+    if isinstance(message, dict):
+        return message
+    if hasattr(message, "model_dump"):
+        return message.model_dump()
+    return dict(vars(message))
+
+
+def _text(content: Any) -> Any:
+    if isinstance(content, list):
+        items = [as_dict(item) for item in content]
+        if all(set(k for k, v in item.items() if v is not None) <= {"text"} for item in items):
+            return "".join(item.get("text") or "" for item in items).strip()
+        return [{k: v for k, v in item.items() if v is not None} for item in items]
+    return content.strip() if isinstance(content, str) else content
+
+
+def normalize_messages(messages: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Keep only what the model sees: role, text, name and function call."""
+    normalized = []
+    for message in messages:
+        data = as_dict(message)
+        entry = {"role": data.get("role"), "content": _text(data.get("content"))}
+        if data.get("name"):
+            entry["name"] = data["name"]
+        function_call = data.get("function_call")
+        if function_call:
+            function_call = as_dict(function_call)
+            entry["function_call"] = {"name": function_call.get("name"), "arguments": function_call.get("arguments")}
+        normalized.append(entry)
+    return normalized
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def tools_fingerprint(function_map: Dict[str, Any]) -> str:
+    """Hash of the schemas of every tool the agent can call."""
+    schemas = [getattr(tool, "function", {"name": name}) for name, tool in sorted(function_map.items())]
+    return fingerprint(schemas)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 5000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[Dict[str, float]] = None,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds or {"answer": 600.0, "call": 86400.0}
+        self.hits = {kind: 0 for kind in self.ttl_seconds}
+        self.misses = {kind: 0 for kind in self.ttl_seconds}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by the threads of this process; WAL lets the other workers read meanwhile
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (f"{kind}:{key}",)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (f"{kind}:{key}",))
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return None
+            self._db.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, f"{kind}:{key}"))
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+        return json.loads(row[0])
+
+    def set(self, kind: str, key: str, tools_hash: str, value: Any) -> None:
+        ttl = self.ttl_seconds.get(kind, 0)
+        if ttl <= 0:
+            return
+        body = json.dumps(value, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, kind, tools_hash, value, size, created_at, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (f"{kind}:{key}", kind, tools_hash, body, len(body), now, now + ttl, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        # Least recently used first, in small batches, until both limits hold
+        while count > self.max_entries or total > self.max_bytes:
+            oldest = self._db.execute("SELECT key, size FROM llm_cache ORDER BY last_used LIMIT 64").fetchall()
+            if not oldest:
+                return
+            for key, size in oldest:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    return
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                count -= 1
+                total -= size
+
+    def invalidate_tools(self, tools_hash: str) -> int:
+        """Drop entries produced with any other tool list; returns how many."""
+        with self._lock:
+            return self._db.execute("DELETE FROM llm_cache WHERE tools_hash != ?", (tools_hash,)).rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache GROUP BY kind"
+            ).fetchall()
+        return {
+            "path": self.path,
+            "entries": {kind: count for kind, count, _ in rows},
+            "bytes": sum(size for _, _, size in rows),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
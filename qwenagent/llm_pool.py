@@ -0,0 +1,207 @@
+"""
+Load-balanced pool of OpenAI-compatible LLM backends.
+
+Every LLM call of the agent loop leases one backend for its duration:
+
+* Routing is least outstanding requests, relative to each backend's
+  ``max_concurrency``; a backend at its cap takes no new calls.
+* When every primary backend is full for ``fallback_after`` seconds (or
+  all of them are ejected), the call goes to a fallback backend, normally
+  a smaller model, instead of waiting longer. After ``wait_timeout``
+  seconds without any free backend ``LLMUnavailable`` is raised.
+* ``eject_failures`` consecutive failed calls or probes eject a backend.
+  A background thread probes every backend's ``/models`` endpoint each
+  ``probe_interval`` seconds; an ejected backend is re-admitted after
+  ``readmit_successes`` consecutive good probes. If every backend is
+  ejected, all of them are tried anyway rather than failing every call.
+
+Caps and counters are per process: with several gunicorn workers, set the
+caps to the backend's capacity divided by the number of workers.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(Exception):
+    """No LLM backend had capacity within the wait timeout."""
+
+
+def parse_backends(spec: str, default_model: str, default_max_concurrency: int) -> List[Tuple[str, str, int]]:
+    """Parse ``url|model|max_concurrency`` entries separated by commas; model and cap are optional."""
+    backends = []
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        parts = [part.strip() for part in entry.split("|")]
+        url = parts[0]
+        model = parts[1] if len(parts) > 1 and parts[1] else default_model
+        max_concurrency = int(parts[2]) if len(parts) > 2 and parts[2] else default_max_concurrency
+        backends.append((url, model, max_concurrency))
+    return backends
+
+
+class Backend:
+    def __init__(self, url: str, model: str, max_concurrency: int, fallback: bool, llm: Any):
+        self.url = url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.fallback = fallback
+        self.llm = llm
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.probe_successes = 0
+        self.served = 0
+        self.errors = 0
+        self.ejections = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}@{self.url}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "model": self.model,
+            "fallback": self.fallback,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "served": self.served,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+def probe_models_endpoint(backend: Backend, timeout: float = 5.0) -> None:
+    response = httpx.get(f"{backend.url.rstrip('/')}/models", timeout=timeout)
+    response.raise_for_status()
+
+
+class LLMPool:
+    def __init__(
+        self,
+        backends: List[Tuple[str, str, int]],
+        fallbacks: List[Tuple[str, str, int]],
+        make_llm: Callable[[str, str], Any],
+        wait_timeout: float = 60.0,
+        fallback_after: float = 2.0,
+        eject_failures: int = 3,
+        readmit_successes: int = 2,
+        probe_interval: float = 10.0,
+        probe: Callable[[Backend], None] = probe_models_endpoint,
+    ):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = [Backend(url, model, cap, False, make_llm(url, model)) for url, model, cap in backends]
+        self.backends += [Backend(url, model, cap, True, make_llm(url, model)) for url, model, cap in fallbacks]
+        self.wait_timeout = wait_timeout
+        self.fallback_after = fallback_after
+        self.eject_failures = eject_failures
+        self.readmit_successes = readmit_successes
+        self.probe_interval = probe_interval
+        self._probe = probe
+        self._cond = threading.Condition()
+        self.fallback_calls = 0
+        self.timeouts = 0
+        if probe_interval > 0:
+            threading.Thread(target=self._probe_loop, name="llm-probe", daemon=True).start()
+
+    def _pick(self, fallback: bool, exclude: Set[Backend], any_health: bool) -> Optional[Backend]:
+        free = [
+            b for b in self.backends
+            if b.fallback == fallback and b not in exclude and (b.healthy or any_health) and b.outstanding < b.max_concurrency
+        ]
+        return min(free, key=lambda b: (b.outstanding / b.max_concurrency, b.outstanding), default=None)
+
+    def acquire(self, exclude: Optional[Set[Backend]] = None) -> Backend:
+        exclude = exclude or set()
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                candidates = [b for b in self.backends if b not in exclude]
+                if not candidates:
+                    raise LLMUnavailable("no other LLM backend to try")
+                # Every backend ejected: try them anyway instead of failing every call
+                any_health = not any(b.healthy for b in candidates)
+                primary_up = any_health or any(b.healthy and not b.fallback for b in candidates)
+                backend = self._pick(False, exclude, any_health)
+                if backend is None and (now - started >= self.fallback_after or not primary_up):
+                    backend = self._pick(True, exclude, any_health)
+                    if backend is not None:
+                        self.fallback_calls += 1
+                if backend is not None:
+                    backend.outstanding += 1
+                    return backend
+                remaining = self.wait_timeout - (now - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise LLMUnavailable(f"no LLM backend free after {self.wait_timeout}s")
+                until_fallback = self.fallback_after - (now - started)
+                self._cond.wait(min(remaining, until_fallback) if until_fallback > 0 else remaining)
+
+    def release(self, backend: Backend, ok: bool) -> None:
+        with self._cond:
+            backend.outstanding -= 1
+            backend.served += 1
+            if ok:
+                backend.failures = 0
+            else:
+                backend.errors += 1
+                self._record_failure(backend)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self) -> Iterator[Backend]:
+        backend = self.acquire()
+        ok = False
+        try:
+            yield backend
+            ok = True
+        finally:
+            self.release(backend, ok)
+
+    def _record_failure(self, backend: Backend) -> None:
+        backend.failures += 1
+        backend.probe_successes = 0
+        if backend.healthy and backend.failures >= self.eject_failures:
+            backend.healthy = False
+            backend.ejections += 1
+            logger.warning(f"LLM backend {backend.name} ejected after {backend.failures} failures")
+
+    def _probe_loop(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            for backend in self.backends:
+                try:
+                    self._probe(backend)
+                    ok = True
+                except Exception:
+                    ok = False
+                with self._cond:
+                    if not ok:
+                        self._record_failure(backend)
+                    elif not backend.healthy:
+                        backend.probe_successes += 1
+                        if backend.probe_successes >= self.readmit_successes:
+                            backend.healthy = True
+                            backend.failures = 0
+                            logger.info(f"LLM backend {backend.name} re-admitted")
+                            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "backends": [b.stats() for b in self.backends],
+                "fallback_calls": self.fallback_calls,
+                "timeouts": self.timeouts,
+            }
@@ -15,18 +15,106 @@
 
 
 import os
+import json
+import logging
+import threading
+import urllib.request
 from qwen_agent.agents import Assistant
 from qwen_agent.gui import WebUI
-from flask import Flask, request, jsonify
+from qwen_agent.llm import get_chat_model
+from qwen_agent.llm.schema import Message
+from qwen_agent.utils.utils import merge_generate_cfgs
+from flask import Flask, Response, request, jsonify
 import time  # ⬅️ Tambahkan ini
+from agent_pool import AgentPool, PoolBusy
+from metrics import MetricsRegistry, RunMetrics, completion_tokens, prompt_tokens
+from llm_pool import LLMPool, LLMUnavailable, parse_backends
+from llm_cache import ResponseCache, as_dict, fingerprint, normalize_messages, tools_fingerprint
+from sessions import SessionStore, llm_summarizer
+from http_tools import build_http_tools
+from parallel_tools import ParallelToolCalls
+from streaming import EventStream
+from warmup import Warmup
 
-# Define the agent with Qwen 3 and MCP configuration
-def init_agent_service():
-	llm_cfg = {
-		'model': "qwen3:latest",
+logger = logging.getLogger(__name__)
+
+# Interval komentar keep-alive SSE saat agent belum menghasilkan token (detik)
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+
+# Endpoint LLM dan MCP (default sama dengan docker-compose)
+LLM_MODEL = os.getenv("LLM_MODEL", "qwen3:latest")
+LLM_MODEL_SERVER = os.getenv("LLM_MODEL_SERVER", "http://ollama:11434/v1")
+CAR_SERVICE_MCP_URL = os.getenv("CAR_SERVICE_MCP_URL", "http://car_service:8007/mcp")
+
+# Cara agent memanggil tool car_service: "mcp" (MCP over SSE) atau "http" (tool native lewat gateway)
+CAR_TOOLS_MODE = os.getenv("CAR_TOOLS_MODE", "mcp").lower()
+CAR_TOOLS_BASE_URL = os.getenv("CAR_TOOLS_BASE_URL", "http://toyota-gateway:2323")
+CAR_SERVICE_OPENAPI_URL = os.getenv("CAR_SERVICE_OPENAPI_URL", "http://car_service:8007/openapi.json")  # sumber skema tool
+CAR_TOOLS_MAX_CONNECTIONS = int(os.getenv("CAR_TOOLS_MAX_CONNECTIONS", "32"))  # koneksi HTTP keep-alive per worker
+
+# Pool agent per worker: jumlah Assistant, antrean maksimum, dan lama menunggu agent (detik)
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "4"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "16"))
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "30"))
+
+# Backend LLM (OpenAI-compatible) yang dibagi rata: "url|model|maks_paralel" dipisah koma; kosong = LLM_MODEL_SERVER + LLM_MODEL
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+# Backend cadangan (model lebih kecil) dipakai saat semua backend utama penuh atau mati; format sama
+LLM_FALLBACK_BACKENDS = os.getenv("LLM_FALLBACK_BACKENDS", "")
+# Maksimum panggilan paralel per backend per worker bila tidak ditulis di entri
+LLM_BACKEND_MAX_CONCURRENCY = int(os.getenv("LLM_BACKEND_MAX_CONCURRENCY", str(AGENT_POOL_SIZE)))
+LLM_POOL_CONFIG = {
+	'wait_timeout': float(os.getenv("LLM_QUEUE_TIMEOUT", "60")),  # lama menunggu backend kosong (detik)
+	'fallback_after': float(os.getenv("LLM_FALLBACK_AFTER", "2")),  # menunggu sekian detik sebelum pindah ke cadangan
+	'eject_failures': int(os.getenv("LLM_EJECT_FAILURES", "3")),  # gagal berturut-turut sebelum backend dikeluarkan
+	'readmit_successes': int(os.getenv("LLM_READMIT_SUCCESSES", "2")),  # probe sukses sebelum backend dipakai lagi
+	'probe_interval': float(os.getenv("LLM_HEALTH_INTERVAL", "10")),  # interval cek GET /models (detik)
+}
+
+# Warm-up saat start: re-warm bila tidak ada request selama sekian detik (di bawah keep-alive default Ollama 5 menit)
+WARMUP_IDLE_SECONDS = float(os.getenv("WARMUP_IDLE_SECONDS", "240"))
+# keep_alive model di Ollama saat warm-up (kosongkan untuk server non-Ollama)
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+# Tool MCP ringan yang dipanggil saat warm-up untuk memanaskan koneksi ke car_service
+WARMUP_TOOL = os.getenv("WARMUP_TOOL", "list cars")
+WARMUP_TOOL_ARGS = os.getenv("WARMUP_TOOL_ARGS", "{}")
+
+# Tool call dalam satu jawaban LLM dijalankan paralel: maksimum paralel per agent dan batas waktu per panggilan (detik)
+TOOL_PARALLELISM = int(os.getenv("TOOL_PARALLELISM", "4"))
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))
+
+# Cache respons LLM di disk (hanya dipakai bila temperature 0)
+LLM_CACHE_CONFIG = {
+	'enabled': os.getenv("LLM_CACHE", "true").lower() == "true",
+	'path': os.getenv("LLM_CACHE_PATH", "/tmp/qwenagent/llm_cache.sqlite3"),
+	'max_entries': int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+	'max_bytes': int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024,
+	'ttl_seconds': {
+		'answer': float(os.getenv("LLM_CACHE_ANSWER_TTL", "600")),  # jawaban akhir; data katalog bisa berubah
+		'call': float(os.getenv("LLM_CACHE_CALL_TTL", "86400")),  # satu panggilan LLM; hasil tool ikut jadi key
+	},
+}
+
+# Riwayat percakapan per session_id (estimasi token = karakter / 4)
+SESSION_CONFIG = {
+	'path': os.getenv("SESSION_STORE_PATH", "/tmp/qwenagent/sessions.sqlite3"),  # dipakai bersama semua worker
+	'history_budget': int(os.getenv("HISTORY_TOKEN_BUDGET", "3000")),  # giliran terakhir yang dikirim utuh
+	'pinned_budget': int(os.getenv("HISTORY_PINNED_TOKENS", "1200")),  # hasil tool terakhir yang tetap disertakan
+	'summary_budget': int(os.getenv("HISTORY_SUMMARY_TOKENS", "300")),  # ringkasan giliran yang lebih lama
+	'max_in_memory': int(os.getenv("SESSION_MAX_IN_MEMORY", "1000")),
+	'max_stored': int(os.getenv("SESSION_MAX_STORED", "10000")),
+	'idle_ttl': float(os.getenv("SESSION_IDLE_TTL", "86400")),
+}
+# Ringkasan dibuat oleh LLM; bila false (atau gagal) dipakai ringkasan ekstraktif
+HISTORY_SUMMARY_LLM = os.getenv("HISTORY_SUMMARY_LLM", "true").lower() == "true"
+
+def llm_config(model=LLM_MODEL, model_server=LLM_MODEL_SERVER):
+	"""qwen_agent LLM config of the agent, for one model on one server."""
+	return {
+		'model': model,
 		# 'model': "qwen3:1.7b",
 		# 'model': "infinity-cafe",
-		'model_server': "http://ollama:11434/v1",
+		'model_server': model_server,
 		'api_key': 'empty',
 		"chat_template_kwargs": {"enable_thinking": False},
         "temperature": 0,
@@ -47,16 +135,259 @@ def init_agent_service():
 			"max_tokens": 5000,
     	}
 	}
-	tools = [{
-		'mcpServers': {
-			'car_service': {
-				'description': 'MCP server for car information, recommendations, and sales.',
-				'url': 'http://car_service:8007/mcp'
+
+_llm_pool = None
+_llm_pool_lock = threading.Lock()
+
+def get_llm_pool():
+	"""LLM backends for this process, created on first use (after gunicorn forks)."""
+	global _llm_pool
+	with _llm_pool_lock:
+		if _llm_pool is None:
+			default = f"{LLM_MODEL_SERVER}|{LLM_MODEL}"
+			_llm_pool = LLMPool(
+				parse_backends(LLM_BACKENDS or default, LLM_MODEL, LLM_BACKEND_MAX_CONCURRENCY),
+				parse_backends(LLM_FALLBACK_BACKENDS, LLM_MODEL, LLM_BACKEND_MAX_CONCURRENCY),
+				lambda model_server, model: get_chat_model(llm_config(model, model_server)),
+				**LLM_POOL_CONFIG,
+			)
+		return _llm_pool
+
+_llm_cache = None
+
+def get_llm_cache():
+	"""Cache for this process, opened on first use (after gunicorn forks)."""
+	global _llm_cache
+	if _llm_cache is None and LLM_CACHE_CONFIG['enabled']:
+		config = {k: v for k, v in LLM_CACHE_CONFIG.items() if k != 'enabled'}
+		_llm_cache = ResponseCache(**config)
+	return _llm_cache
+
+def is_deterministic(generate_cfg):
+	# Sampled output differs per call, so it must not be replayed
+	return generate_cfg.get('temperature', 0) == 0
+
+class RoutedAssistant(Assistant):
+	"""Assistant whose LLM calls go to the least-loaded backend of the LLM pool (see llm_pool.py)."""
+
+	last_backend = None
+
+	def _call_llm(self, messages, functions=None, stream=True, extra_generate_cfg=None):
+		llm_pool = get_llm_pool()
+		generate_cfg = merge_generate_cfgs(base_generate_cfg=self.extra_generate_cfg, new_generate_cfg=extra_generate_cfg)
+		tried = set()
+		while True:
+			backend = llm_pool.acquire(exclude=tried)
+			self.last_backend = backend
+			ok = True
+			output_sent = False
+			try:
+				for output in backend.llm.chat(messages=messages, functions=functions, stream=stream, extra_generate_cfg=generate_cfg):
+					output_sent = True
+					yield output
+				return
+			except Exception as e:
+				ok = False
+				# Retry once on another backend, unless the caller already saw part of this output
+				if output_sent or tried or len(llm_pool.backends) == 1:
+					raise
+				logger.warning(f"LLM backend {backend.name} failed, retrying on another backend: {e}")
+				tried.add(backend)
+			finally:
+				llm_pool.release(backend, ok)
+
+class CachingAssistant(RoutedAssistant):
+	"""Assistant that answers repeated LLM calls of its tool loop from the disk cache."""
+
+	def _call_llm(self, messages, functions=None, stream=True, extra_generate_cfg=None):
+		cache = get_llm_cache()
+		generate_cfg = {**self.llm.generate_cfg, **(extra_generate_cfg or {})}
+		self.last_call_cached = False
+		if cache is None or not is_deterministic(generate_cfg):
+			yield from super()._call_llm(messages, functions=functions, stream=stream, extra_generate_cfg=extra_generate_cfg)
+			return
+
+		key = fingerprint({
+			'model': self.llm.model,
+			'generate_cfg': generate_cfg,
+			'functions': functions or [],
+			'messages': normalize_messages(messages),
+		})
+		cached = cache.get('call', key)
+		self.last_call_cached = cached is not None
+		if cached is not None:
+			yield [Message(**message) for message in cached]
+			return
+
+		output = None
+		for output in super()._call_llm(messages, functions=functions, stream=stream, extra_generate_cfg=extra_generate_cfg):
+			yield output
+		# Reached only when the call ran to the end (not cancelled); the
+		# fallback model's output must not be replayed as the main model's
+		if output and not self.last_backend.fallback:
+			cache.set('call', key, tools_fingerprint(self.function_map), [as_dict(message) for message in output])
+
+class PooledChat:
+	"""Non-streaming chat model whose calls go to a backend leased from the LLM pool."""
+
+	def __init__(self, generate_cfg):
+		self.generate_cfg = generate_cfg
+
+	def chat(self, messages, stream=False, **kwargs):
+		# A stream would outlive the lease, so the whole response is read inside it
+		with get_llm_pool().lease() as backend:
+			return backend.llm.chat(messages=messages, stream=False, extra_generate_cfg=self.generate_cfg, **kwargs)
+
+def init_session_store():
+	summarize = None
+	if HISTORY_SUMMARY_LLM:
+		summarizer_llm = PooledChat({
+			'temperature': 0,
+			'max_tokens': SESSION_CONFIG['summary_budget'] * 2,
+		})
+		summarize = llm_summarizer(summarizer_llm, SESSION_CONFIG['summary_budget'])
+	return SessionStore(summarize=summarize, **SESSION_CONFIG)
+
+def keep_model_loaded():
+	"""Load the model of every LLM backend in Ollama and keep it resident for LLM_KEEP_ALIVE."""
+	if not LLM_KEEP_ALIVE:
+		return
+	for backend in get_llm_pool().backends:
+		# Ollama's native API lives next to its OpenAI-compatible /v1
+		base_url = backend.url.rstrip('/')
+		if base_url.endswith('/v1'):
+			base_url = base_url[:-3]
+		body = json.dumps({'model': backend.model, 'keep_alive': LLM_KEEP_ALIVE}).encode('utf-8')
+		req = urllib.request.Request(f"{base_url}/api/generate", data=body, headers={'Content-Type': 'application/json'})
+		with urllib.request.urlopen(req, timeout=300) as response:
+			response.read()
+
+def prime_llm(bot):
+	"""One-token generation with the agent's real system prompt and tool schemas on
+	every LLM backend, so each has the model loaded and the shared prompt prefix cached."""
+	functions = [tool.function for tool in bot.function_map.values()]
+	messages = [Message(role='system', content=bot.system_message), Message(role='user', content='ping')]
+	for backend in get_llm_pool().backends:
+		backend.llm.chat(messages=messages, functions=functions, stream=False, extra_generate_cfg={'max_tokens': 1})
+
+def call_warmup_tool(bot):
+	"""Call a cheap MCP tool so the connection to car_service (and its DB pool) is warm."""
+	# MCP names the tool "car_service-list cars", the HTTP tools "list_cars"
+	names = [name for name in bot.function_map if name.replace('_', ' ').endswith(WARMUP_TOOL.replace('_', ' '))]
+	if WARMUP_TOOL and names:
+		bot.function_map[names[0]].call(WARMUP_TOOL_ARGS)
+
+# Prefix of the text qwen_agent returns instead of raising when a tool fails
+TOOL_ERROR_PREFIX = 'An error occurred when calling tool'
+
+class InstrumentedAssistant(CachingAssistant):
+	"""Reports every LLM and tool call of a turn into ``run_metrics`` (see metrics.py)."""
+
+	run_metrics = None
+
+	def _call_llm(self, messages, functions=None, stream=True, extra_generate_cfg=None):
+		run = self.run_metrics
+		if run is None:
+			yield from super()._call_llm(messages, functions=functions, stream=stream, extra_generate_cfg=extra_generate_cfg)
+			return
+		started = time.monotonic()
+		first_chunk = None
+		chunks = 0
+		output = None
+		for output in super()._call_llm(messages, functions=functions, stream=stream, extra_generate_cfg=extra_generate_cfg):
+			if first_chunk is None and output:
+				first_chunk = time.monotonic()
+			chunks += 1
+			yield output
+		output = output or []
+		run.record_llm_call(
+			started,
+			# A single chunk (not streamed, or cached) has no separate generation phase
+			first_chunk if chunks > 1 else None,
+			time.monotonic(),
+			prompt=prompt_tokens(messages, functions),
+			completion=completion_tokens(output),
+			asked_for_tools=any(as_dict(message).get('function_call') for message in output),
+			cached=self.last_call_cached,
+			backend=None if self.last_call_cached else self.last_backend.name,
+			fallback=not self.last_call_cached and self.last_backend.fallback,
+		)
+
+	def _call_tool(self, tool_name, tool_args='{}', **kwargs):
+		run = self.run_metrics
+		if run is None:
+			return super()._call_tool(tool_name, tool_args, **kwargs)
+		started = time.monotonic()
+		ok = False
+		try:
+			result = super()._call_tool(tool_name, tool_args, **kwargs)
+			ok = not (isinstance(result, str) and result.startswith(TOOL_ERROR_PREFIX))
+			return result
+		finally:
+			run.record_tool_call(tool_name, started, time.monotonic(), ok, tool_args)
+
+class ParallelToolAssistant(InstrumentedAssistant):
+	"""Runs the tool calls of one LLM output concurrently, each with a timeout (see parallel_tools.py)."""
+
+	_tool_calls = None
+
+	@property
+	def tool_calls(self):
+		# Per agent, so the parallelism bound applies per turn
+		if self._tool_calls is None:
+			self._tool_calls = ParallelToolCalls(super()._call_tool, max_workers=TOOL_PARALLELISM, timeout=TOOL_CALL_TIMEOUT)
+		return self._tool_calls
+
+	def _parallel_safe(self, tool_name, tool_args):
+		# Tools that read files from the conversation need the caller's messages
+		tool = self.function_map.get(tool_name)
+		return tool is not None and not getattr(tool, 'file_access', False) and isinstance(tool_args, str)
+
+	def _call_llm(self, messages, functions=None, stream=True, extra_generate_cfg=None):
+		output = None
+		for output in super()._call_llm(messages, functions=functions, stream=stream, extra_generate_cfg=extra_generate_cfg):
+			yield output
+		# The output is complete: start its tool calls before the agent loop asks for them
+		calls = []
+		for message in output or []:
+			function_call = as_dict(message).get('function_call')
+			if function_call:
+				function_call = as_dict(function_call)
+				if self._parallel_safe(function_call.get('name'), function_call.get('arguments')):
+					calls.append((function_call['name'], function_call['arguments']))
+		if calls:
+			self.tool_calls.start(calls)
+
+	def _call_tool(self, tool_name, tool_args='{}', **kwargs):
+		if not self._parallel_safe(tool_name, tool_args):
+			return super()._call_tool(tool_name, tool_args, **kwargs)
+		result, in_time = self.tool_calls.result(tool_name, tool_args)
+		if not in_time and self.run_metrics is not None:
+			self.run_metrics.record_tool_timeout(tool_name)
+		return result
+
+# Define the agent with Qwen 3 and MCP configuration
+def init_agent_service():
+	llm_cfg = llm_config()
+	if CAR_TOOLS_MODE == 'http':
+		# Same operations as the MCP server, as plain GETs through the gateway; see http_tools.py
+		tools = build_http_tools(
+			CAR_TOOLS_BASE_URL,
+			CAR_SERVICE_OPENAPI_URL,
+			timeout=TOOL_CALL_TIMEOUT,
+			max_connections=CAR_TOOLS_MAX_CONNECTIONS,
+		)
+	else:
+		tools = [{
+			'mcpServers': {
+				'car_service': {
+					'description': 'MCP server for car information, recommendations, and sales.',
+					'url': CAR_SERVICE_MCP_URL
+				}
 			}
-		}
-	}]
+		}]
 
-	bot = Assistant(
+	bot = ParallelToolAssistant(
 		llm=llm_cfg,
 		function_list=tools,
 		system_message='/nothink',
@@ -84,10 +415,124 @@ def app_gui():
     }
 	WebUI(bot,chatbot_config).run()
 
+def setup_logging():
+	"""Send module loggers to gunicorn's error log, or to stderr when run directly."""
+	root = logging.getLogger()
+	if root.handlers:
+		return
+	gunicorn_error = logging.getLogger('gunicorn.error')
+	if gunicorn_error.handlers:
+		root.handlers = list(gunicorn_error.handlers)
+		root.setLevel(gunicorn_error.level)
+	else:
+		logging.basicConfig(level=logging.INFO)
+	# qwen_agent already writes its own log lines
+	logging.getLogger('qwen_agent_logger').propagate = False
+
 # Create Flask app for HTTP API
 def create_api():
+    setup_logging()
     app = Flask(__name__)
-    bot = init_agent_service()
+    cache = get_llm_cache()
+    
+    # Set by the warm-up thread; chat requests get 503 until it is ready
+    pool = None
+    probe = None
+    tools_hash = None
+    
+    def start(warmup):
+        nonlocal pool, probe, tools_hash
+        # Each Assistant serves one request at a time (see agent_pool.py);
+        # building one connects to MCP and discovers the tool list once.
+        pool = warmup.step('agent_pool', lambda: AgentPool(
+            init_agent_service,
+            size=AGENT_POOL_SIZE,
+            max_waiting=AGENT_QUEUE_SIZE,
+            wait_timeout=AGENT_QUEUE_TIMEOUT,
+        ))
+        probe = pool.agents[0]
+        # Tool lists are fixed for the life of the worker (see llm_cache.py)
+        tools_hash = tools_fingerprint(probe.function_map)
+        warmup.steps['agent_pool']['tools'] = sorted(probe.function_map)
+        if cache is not None:
+            removed = cache.invalidate_tools(tools_hash)
+            if removed:
+                logger.info(f"LLM cache: dropped {removed} entries from a previous tool list")
+        warmup.step('keep_alive', keep_model_loaded)
+        warmup.step('prime_llm', lambda: prime_llm(probe))
+        warmup.step('mcp_tool', lambda: call_warmup_tool(probe))
+    
+    def rewarm(warmup):
+        agents = []
+        try:
+            # Only idle agents, so no request waits behind the re-warm for long
+            while (agent := pool.try_acquire()) is not None:
+                agents.append(agent)
+            if agents:
+                prime_llm(agents[0])
+            for agent in agents:
+                call_warmup_tool(agent)
+        finally:
+            for agent in agents:
+                pool.release(agent)
+    
+    warmup = Warmup(start, rewarm, idle_seconds=WARMUP_IDLE_SECONDS)
+    
+    def answer_key(messages):
+        if cache is None or not is_deterministic(probe.llm.generate_cfg):
+            return None
+        return fingerprint({
+            'model': probe.llm.model,
+            'generate_cfg': probe.llm.generate_cfg,
+            'system_message': probe.system_message,
+            'tools': tools_hash,
+            'messages': normalize_messages(messages),
+        })
+    
+    def store_answer(key, response, run):
+        # An answer that used the fallback model is not kept for later requests
+        if key is not None and response and not any(call['fallback'] for call in run.llm_calls):
+            cache.set('answer', key, tools_hash, response)
+    
+    sessions = init_session_store()
+    registry = MetricsRegistry()
+    
+    def instrumented_run(bot, messages, run):
+        """``bot.run()`` with its LLM and tool calls recorded into ``run``."""
+        bot.run_metrics = run
+        ok = False
+        try:
+            yield from bot.run(messages=messages)
+            ok = True
+        finally:
+            bot.run_metrics = None
+            registry.record_turn(run.summary(), ok=ok)
+    
+    def wants_metrics(data):
+        return bool(data.get('metrics')) or request.args.get('metrics', '').lower() in ('1', 'true')
+    
+    def build_messages(data):
+        """Prompt for this turn: history of ``session_id`` (if given) plus the new message."""
+        session_id = str(data['session_id']) if data.get('session_id') else None
+        session = sessions.get(session_id) if session_id else None
+        messages, report = sessions.build_prompt(session, data['message'])
+        return session_id, messages, report
+    
+    def record_turn(session_id, message, response):
+        if session_id and response:
+            sessions.record_turn(session_id, message, [as_dict(m) for m in response])
+    
+    def warming_response():
+        response = jsonify({'error': 'Agent is warming up, please retry', 'warmup': warmup.stats()})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    def busy_response(error):
+        response = jsonify({'error': 'Server busy, please retry', 'detail': str(error)})
+        response.status_code = 429
+        response.headers['Retry-After'] = '5'
+        return response
     
     @app.route('/api/chat', methods=['POST'])
     def chat():
@@ -96,31 +541,165 @@ def create_api():
         data = request.json
         if not data or 'message' not in data:
             return jsonify({'error': 'Message is required'}), 400
+        if not warmup.ready:
+            return warming_response()
+        warmup.touch()
         
         query = data['message']
-        messages = [{'role': 'user', 'content': query}]
+        session_id, messages, prompt = build_messages(data)
+        
+        key = answer_key(messages)
+        cached = cache.get('answer', key) if key is not None else None
+        if cached is not None:
+            record_turn(session_id, query, cached)
+            processing_time_ms = round((time.time() - start_time) * 1000)
+            registry.record_cached_turn(processing_time_ms)
+            return jsonify({
+                'response': cached,
+                'processing_time_ms': processing_time_ms,
+                'cached': True,
+                'session_id': session_id,
+                'prompt': prompt,
+            })
         
-        # Collect all responses
-        responses = []
-        for response in bot.run(messages=messages):
-            responses.append(response)
+        run = RunMetrics()
+        try:
+            with pool.lease() as bot:
+                run.queue_ms = (time.monotonic() - run.started) * 1000
+                # Every yield repeats the whole turn so far; only the last one is needed
+                response = None
+                for response in instrumented_run(bot, messages, run):
+                    pass
+        except (PoolBusy, LLMUnavailable) as e:
+            return busy_response(e)
+        store_answer(key, response, run)
+        record_turn(session_id, query, response)
         
         # Calculate processing time in milliseconds
         processing_time_ms = round((time.time() - start_time) * 1000)
         
         # Return the final response with timing information
+        result = {
+            'response': response or '',
+            'processing_time_ms': processing_time_ms,
+            'cached': False,
+            'session_id': session_id,
+            'prompt': prompt,
+        }
+        if wants_metrics(data):
+            result['metrics'] = run.summary()
+        return jsonify(result)
+    
+    @app.route('/api/chat/stream', methods=['POST'])
+    def chat_stream():
+        data = request.json
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Message is required'}), 400
+        if not warmup.ready:
+            return warming_response()
+        warmup.touch()
+        
+        query = data['message']
+        session_id, messages, prompt = build_messages(data)
+        include_metrics = wants_metrics(data)
+        run = RunMetrics()
+        
+        def done_fields():
+            fields = {'session_id': session_id, 'prompt': prompt}
+            if include_metrics:
+                fields['metrics'] = run.summary()
+            return fields
+        
+        key = answer_key(messages)
+        cached = cache.get('answer', key) if key is not None else None
+        if cached is not None:
+            # Replayed through the same event stream, without taking an agent
+            registry.record_cached_turn(0)
+            return Response(
+                EventStream(
+                    lambda: iter([cached]),
+                    heartbeat_seconds=STREAM_HEARTBEAT_SECONDS,
+                    on_complete=lambda response: record_turn(session_id, query, response),
+                    done_fields=lambda: {'session_id': session_id, 'prompt': prompt},
+                ),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-LLM-Cache': 'hit'},
+            )
+        try:
+            bot = pool.acquire()
+        except PoolBusy as e:
+            return busy_response(e)
+        run.queue_ms = (time.monotonic() - run.started) * 1000
+        # The agent goes back to the pool when the run thread ends, not
+        # when the response closes: a cancelled run stops at its next step.
+        events = EventStream(
+            lambda: instrumented_run(bot, messages, run),
+            heartbeat_seconds=STREAM_HEARTBEAT_SECONDS,
+            on_exit=lambda: pool.release(bot),
+            on_complete=lambda response: (store_answer(key, response, run), record_turn(session_id, query, response)),
+            done_fields=done_fields,
+        )
+        return Response(
+            events,
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+    
+    @app.route('/api/cache', methods=['GET'])
+    def cache_stats():
+        if cache is None:
+            return jsonify({'enabled': False})
+        return jsonify({'enabled': True, 'tools_hash': tools_hash, **cache.stats()})
+    
+    @app.route('/api/cache', methods=['DELETE'])
+    def cache_clear():
+        if cache is not None:
+            cache.clear()
+        return jsonify({'status': 'cleared'})
+    
+    @app.route('/api/sessions/<session_id>', methods=['GET'])
+    def session_detail(session_id):
+        session = sessions.find(session_id)
+        if session is None:
+            return jsonify({'error': 'Session not found'}), 404
+        _, report = sessions.build_prompt(session, '')
         return jsonify({
-            'response': responses[-1] if responses else '',
-            'processing_time_ms': processing_time_ms
+            'session_id': session_id,
+            'turns': len(session.turns),
+            'turns_summarized': session.summarized_turns,
+            'summary': session.summary,
+            'pinned': [result.name for result in session.pinned],
+            'next_prompt': report,
         })
     
+    @app.route('/api/sessions/<session_id>', methods=['DELETE'])
+    def session_delete(session_id):
+        sessions.delete(session_id)
+        return jsonify({'status': 'deleted'})
+    
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        # Per gunicorn worker; token counts are estimates
+        return jsonify(registry.snapshot())
+    
     @app.route('/api/health', methods=['GET'])
     def health_check():
-        return jsonify({'status': 'ok'})
+        return jsonify({
+            'status': 'ok',
+            'ready': warmup.ready,
+            'pool': pool.stats() if pool is not None else None,
+            'llm': get_llm_pool().stats(),
+            'sessions': sessions.stats(),
+        })
+    
+    @app.route('/api/ready', methods=['GET'])
+    def ready_check():
+        # Liveness is /api/health; this turns 200 only once warm-up finished
+        return jsonify(warmup.stats()), 200 if warmup.ready else 503
     
     return app
 
-# Run the HTTP API server
+# Run the HTTP API server (development; production uses gunicorn.conf.py)
 def run_api(host='0.0.0.0', port=9000):
     app = create_api()
     print(f"Starting HTTP API server on {host}:{port}")
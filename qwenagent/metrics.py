@@ -0,0 +1,247 @@
+"""
+Per-turn instrumentation of agent runs and per-worker aggregates.
+
+``RunMetrics`` is attached to a leased agent for the length of one
+``bot.run()``; the agent's ``_call_llm`` and ``_call_tool`` overrides report
+every LLM call and tool call into it. An LLM call is timed as prompt eval
+(until the first streamed chunk) plus generation (the rest), so its
+tokens/sec is completion tokens over generation time (not reported for
+output that arrived in one chunk). A tool round is an
+LLM call that asked for tools.
+
+qwen_agent does not pass the server's usage numbers through, so token
+counts are estimated from the text (see ``sessions.estimate_tokens``),
+including the function schemas sent with each call.
+
+``MetricsRegistry`` folds finished turns into fixed-bucket histograms for
+``/api/metrics``. Each gunicorn worker keeps its own registry.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llm_cache import normalize_messages
+from sessions import estimate_tokens, message_tokens
+
+MS_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 12)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160)
+
+
+def prompt_tokens(messages: Sequence[Any], functions: Optional[List[Dict[str, Any]]] = None) -> int:
+    tokens = sum(message_tokens(m) for m in normalize_messages(messages))
+    if functions:
+        tokens += estimate_tokens(json.dumps(functions, ensure_ascii=False))
+    return tokens
+
+
+def completion_tokens(output: Sequence[Any]) -> int:
+    return sum(message_tokens(m) for m in normalize_messages(output))
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.queue_ms = 0.0
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.tool_timeouts: List[str] = []
+        self._tool_spans: List[Tuple[float, float]] = []
+
+    def record_llm_call(
+        self,
+        started: float,
+        first_chunk: Optional[float],
+        ended: float,
+        prompt: int,
+        completion: int,
+        asked_for_tools: bool,
+        cached: bool,
+        backend: Optional[str] = None,
+        fallback: bool = False,
+    ) -> None:
+        first_chunk = first_chunk or ended
+        generation_s = ended - first_chunk
+        self.llm_calls.append({
+            "duration_ms": round((ended - started) * 1000, 1),
+            "prompt_eval_ms": round((first_chunk - started) * 1000, 1),
+            "generation_ms": round(generation_s * 1000, 1),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "tokens_per_second": round(completion / generation_s, 1) if generation_s > 0 and not cached else None,
+            "tool_round": asked_for_tools,
+            "cached": cached,
+            "backend": backend,
+            "fallback": fallback,
+        })
+
+    def record_tool_call(self, name: str, started: float, ended: float, ok: bool, arguments: Any = None) -> None:
+        # Parallel calls finish in any order; name + arguments identify the call
+        self.tool_calls.append({
+            "name": name,
+            "arguments": arguments,
+            "duration_ms": round((ended - started) * 1000, 1),
+            "ok": ok,
+        })
+        self._tool_spans.append((started, ended))
+
+    def record_tool_timeout(self, name: str) -> None:
+        self.tool_timeouts.append(name)
+
+    def _tools_wall_ms(self) -> float:
+        # Tool calls may overlap (parallel_tools.py); count the time any was running
+        total = 0.0
+        covered_until = float("-inf")
+        for started, ended in sorted(self._tool_spans):
+            if ended > covered_until:
+                total += ended - max(started, covered_until)
+                covered_until = ended
+        return total * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        total_ms = (time.monotonic() - self.started) * 1000
+        prompt_eval_ms = sum(c["prompt_eval_ms"] for c in self.llm_calls)
+        generation_ms = sum(c["generation_ms"] for c in self.llm_calls)
+        tools_ms = self._tools_wall_ms()
+        generated = [c for c in self.llm_calls if c["tokens_per_second"] is not None]
+        generation_s = sum(c["generation_ms"] for c in generated) / 1000
+        return {
+            "total_ms": round(total_ms, 1),
+            "stages_ms": {
+                "queue": round(self.queue_ms, 1),
+                "prompt_eval": round(prompt_eval_ms, 1),
+                "generation": round(generation_ms, 1),
+                "tools": round(tools_ms, 1),
+                "other": round(max(0.0, total_ms - self.queue_ms - prompt_eval_ms - generation_ms - tools_ms), 1),
+            },
+            "llm_call_count": len(self.llm_calls),
+            "tool_rounds": sum(1 for c in self.llm_calls if c["tool_round"]),
+            "fallback_calls": sum(1 for c in self.llm_calls if c["fallback"]),
+            "tool_timeouts": list(self.tool_timeouts),
+            "prompt_tokens": sum(c["prompt_tokens"] for c in self.llm_calls),
+            "completion_tokens": sum(c["completion_tokens"] for c in self.llm_calls),
+            "tokens_per_second": round(sum(c["completion_tokens"] for c in generated) / generation_s, 1) if generation_s > 0 else None,
+            "tokens_estimated": True,
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+        }
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None past the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        # [upper bound, cumulative count] pairs, Prometheus style
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 1),
+            "avg": round(self.sum / self.count, 1) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.cached_turns = 0
+        self.incomplete_turns = 0
+        self.tool_errors = 0
+        self.tool_timeouts = 0
+        self.fallback_llm_calls = 0
+        self.histograms = {
+            "turn_ms": Histogram(MS_BUCKETS),
+            "queue_ms": Histogram(MS_BUCKETS),
+            "llm_call_ms": Histogram(MS_BUCKETS),
+            "prompt_eval_ms": Histogram(MS_BUCKETS),
+            "generation_ms": Histogram(MS_BUCKETS),
+            "llm_calls_per_turn": Histogram(COUNT_BUCKETS),
+            "tool_rounds_per_turn": Histogram(COUNT_BUCKETS),
+            "prompt_tokens_per_call": Histogram(TOKEN_BUCKETS),
+            "completion_tokens_per_call": Histogram(TOKEN_BUCKETS),
+            "tokens_per_second": Histogram(RATE_BUCKETS),
+        }
+        self.tool_histograms: Dict[str, Histogram] = {}
+
+    def record_turn(self, summary: Dict[str, Any], ok: bool = True) -> None:
+        with self._lock:
+            self.turns += 1
+            # Raised, or a stream the client abandoned
+            if not ok:
+                self.incomplete_turns += 1
+            h = self.histograms
+            h["turn_ms"].observe(summary["total_ms"])
+            h["queue_ms"].observe(summary["stages_ms"]["queue"])
+            h["llm_calls_per_turn"].observe(summary["llm_call_count"])
+            h["tool_rounds_per_turn"].observe(summary["tool_rounds"])
+            for call in summary["llm_calls"]:
+                h["llm_call_ms"].observe(call["duration_ms"])
+                h["prompt_tokens_per_call"].observe(call["prompt_tokens"])
+                h["completion_tokens_per_call"].observe(call["completion_tokens"])
+                if call["cached"]:
+                    continue
+                h["prompt_eval_ms"].observe(call["prompt_eval_ms"])
+                h["generation_ms"].observe(call["generation_ms"])
+                if call["tokens_per_second"] is not None:
+                    h["tokens_per_second"].observe(call["tokens_per_second"])
+            self.tool_timeouts += len(summary["tool_timeouts"])
+            self.fallback_llm_calls += summary["fallback_calls"]
+            for call in summary["tool_calls"]:
+                self.tool_histograms.setdefault(call["name"], Histogram(MS_BUCKETS)).observe(call["duration_ms"])
+                if not call["ok"]:
+                    self.tool_errors += 1
+
+    def record_cached_turn(self, total_ms: float) -> None:
+        with self._lock:
+            self.turns += 1
+            self.cached_turns += 1
+            self.histograms["turn_ms"].observe(total_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "turns": self.turns,
+                "cached_turns": self.cached_turns,
+                "incomplete_turns": self.incomplete_turns,
+                "tool_errors": self.tool_errors,
+                "tool_timeouts": self.tool_timeouts,
+                "fallback_llm_calls": self.fallback_llm_calls,
+                "tokens_estimated": True,
+                "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+                "tool_ms": {name: h.snapshot() for name, h in sorted(self.tool_histograms.items())},
+            }
@@ -0,0 +1,64 @@
+"""
+Concurrent execution of the tool calls of one assistant turn.
+
+qwen_agent's function-calling loop runs the tool calls of one LLM output one
+after another. Those calls are independent by construction: the model
+issued them together, before seeing any of their results (stock in two
+cities plus the promotions, say). ``ParallelToolCalls.start()`` submits all
+of them as soon as the LLM output is complete; the agent loop still asks
+for the results one by one, in their original order, and ``result()`` only
+waits for the matching future. The conversation therefore ends up exactly
+as with sequential calls, in less time. Identical calls in one output run
+once.
+
+Every call has a deadline of ``timeout`` seconds from its submission. A
+call that misses it is answered with a timeout message for the model, so
+the turn can still be completed with the other results; the call itself
+keeps its worker thread until it returns, which ``max_workers`` bounds.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def timeout_message(name: str, timeout: float) -> str:
+    return f"Tool `{name}` did not respond within {timeout:g} seconds. Answer with the other results or ask the user to try again."
+
+
+class ParallelToolCalls:
+    def __init__(self, call: Callable[[str, Any], Any], max_workers: int = 4, timeout: float = 30.0):
+        self.timeout = timeout
+        self._call = call
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-call")
+        self._pending: Dict[Tuple[str, str], Tuple[Future, float]] = {}
+        self._lock = threading.Lock()
+        self.parallel_batches = 0
+        self.timeouts = 0
+
+    def _submit(self, name: str, arguments: str) -> Tuple[Future, float]:
+        return self._executor.submit(self._call, name, arguments), time.monotonic() + self.timeout
+
+    def start(self, calls: List[Tuple[str, str]]) -> None:
+        """Submit the ``(name, arguments)`` calls of one LLM output."""
+        with self._lock:
+            self._pending = {}
+            for name, arguments in calls:
+                if (name, arguments) not in self._pending:
+                    self._pending[(name, arguments)] = self._submit(name, arguments)
+            if len(self._pending) > 1:
+                self.parallel_batches += 1
+
+    def result(self, name: str, arguments: str) -> Tuple[Any, bool]:
+        """The result of a call (submitted now if ``start`` did not) and whether it finished in time."""
+        with self._lock:
+            pending = self._pending.get((name, arguments))
+        future, deadline = pending or self._submit(name, arguments)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic())), True
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            return timeout_message(name, self.timeout), False
@@ -0,0 +1,389 @@
+"""
+Token-budgeted conversation history for multi-turn chat.
+
+A session keeps its recent turns verbatim (user question and final answer),
+a rolling summary of older turns and the latest tool results, "pinned" so
+that follow-ups ("what about the cheaper one?") can still refer to the data
+after the turn that fetched it has been summarized away.
+
+Each prompt is assembled within ``history_budget`` tokens:
+
+    [system: summary + pinned tool results] + recent turns + new message
+
+Recent turns are taken newest first until the budget is used up. After a
+turn is recorded, when the unsummarized turns exceed the budget the oldest
+ones are folded into the summary (down to half the budget, so this does not
+happen on every turn) by ``summarize``, normally a short LLM call, run on a
+background thread so it does not delay the answer.
+
+Sessions live in a SQLite file shared by all gunicorn workers, so a
+conversation can continue on any worker; each worker keeps a bounded LRU
+of parsed sessions and re-reads one only when another worker changed it.
+Sessions idle longer than ``idle_ttl`` and the least recently used beyond
+``max_stored`` are deleted.
+
+Token counts are estimates (characters / 4), good enough for budgeting; they
+cover the conversation messages, not the agent's own system prompt and tool
+schemas, which are the same on every turn.
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from streaming import message_text
+
+logger = logging.getLogger(__name__)
+
+# Approximate characters per token for Qwen style BPE on mixed Indonesian/English text
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated ON chat_sessions (updated_at);
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in ``text``."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message_text(message.get("content")))
+    function_call = message.get("function_call") or {}
+    return tokens + estimate_tokens(function_call.get("name") or "") + estimate_tokens(function_call.get("arguments") or "")
+
+
+@dataclass
+class Turn:
+    user: str
+    answer: str
+
+    def messages(self) -> List[Dict[str, Any]]:
+        return [{"role": "user", "content": self.user}, {"role": "assistant", "content": self.answer}]
+
+    def tokens(self) -> int:
+        return sum(message_tokens(m) for m in self.messages())
+
+
+@dataclass
+class PinnedResult:
+    name: str
+    arguments: str
+    content: str
+
+    def text(self) -> str:
+        return f"[{self.name} {self.arguments}]\n{self.content}"
+
+
+@dataclass
+class Session:
+    id: str
+    turns: List[Turn] = field(default_factory=list)
+    summary: str = ""
+    summarized_turns: int = 0
+    pinned: List[PinnedResult] = field(default_factory=list)
+    version: int = 0
+
+    @classmethod
+    def from_json(cls, session_id: str, version: int, data: str) -> "Session":
+        raw = json.loads(data)
+        return cls(
+            id=session_id,
+            turns=[Turn(**t) for t in raw.get("turns", [])],
+            summary=raw.get("summary", ""),
+            summarized_turns=raw.get("summarized_turns", 0),
+            pinned=[PinnedResult(**p) for p in raw.get("pinned", [])],
+            version=version,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "turns": [asdict(t) for t in self.turns],
+            "summary": self.summary,
+            "summarized_turns": self.summarized_turns,
+            "pinned": [asdict(p) for p in self.pinned],
+        }, ensure_ascii=False)
+
+
+def turn_from_response(user_message: str, response: List[Dict[str, Any]]) -> Tuple[Turn, List[PinnedResult]]:
+    """The final answer and the tool results of one ``bot.run()`` response."""
+    answer = ""
+    results: List[PinnedResult] = []
+    pending_call: Dict[str, Any] = {}
+    for message in response:
+        if message.get("role") == "assistant":
+            if message.get("function_call"):
+                pending_call = message["function_call"]
+            elif message_text(message.get("content")):
+                answer = message_text(message.get("content"))
+        elif message.get("role") == "function":
+            results.append(PinnedResult(
+                name=message.get("name") or pending_call.get("name") or "",
+                arguments=pending_call.get("arguments") or "",
+                content=message_text(message.get("content")),
+            ))
+    return Turn(user=user_message, answer=answer), results
+
+
+Summarizer = Callable[[str, List[Turn]], str]
+
+
+def extractive_summary(previous: str, turns: List[Turn], max_chars: int = 1200) -> str:
+    """Fallback when no LLM summary is available: keep the questions and answer openings."""
+    lines = [previous] if previous else []
+    for turn in turns:
+        lines.append(f"- User: {turn.user[:160]} | Asisten: {turn.answer[:200]}")
+    text = "\n".join(lines)
+    return text[-max_chars:]
+
+
+class SessionStore:
+    def __init__(
+        self,
+        path: str,
+        history_budget: int = 3000,
+        pinned_budget: int = 1200,
+        summary_budget: int = 300,
+        max_in_memory: int = 1000,
+        max_stored: int = 10000,
+        idle_ttl: float = 86400.0,
+        summarize: Optional[Summarizer] = None,
+    ):
+        self.history_budget = history_budget
+        self.pinned_budget = pinned_budget
+        self.summary_budget = summary_budget
+        self.max_in_memory = max_in_memory
+        self.max_stored = max_stored
+        self.idle_ttl = idle_ttl
+        self.summarize = summarize
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._summarizing: set = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    # -- storage ---------------------------------------------------------
+
+    def find(self, session_id: str) -> Optional[Session]:
+        """The stored session, or ``None`` when it was never stored (or expired)."""
+        with self._lock:
+            row = self._db.execute("SELECT version FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+            cached = self._sessions.get(session_id)
+            if row is None:
+                self._sessions.pop(session_id, None)
+                return None
+            if cached is not None and cached.version == row[0]:
+                session = cached
+            else:
+                version, data = self._db.execute(
+                    "SELECT version, data FROM chat_sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                session = Session.from_json(session_id, version, data)
+            self._remember(session)
+            return session
+
+    def get(self, session_id: str) -> Session:
+        """The stored session, or a new empty one; it is only cached once a turn is saved."""
+        return self.find(session_id) or Session(id=session_id)
+
+    def _remember(self, session: Session) -> None:
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_in_memory:
+            self._sessions.popitem(last=False)
+
+    def _save(self, session: Session) -> None:
+        session.version += 1
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO chat_sessions (id, version, data, updated_at) VALUES (?, ?, ?, ?)",
+            (session.id, session.version, session.to_json(), now),
+        )
+        self._remember(session)
+        self._db.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.idle_ttl,))
+        stored = self._db.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+        if stored > self.max_stored:
+            self._db.execute(
+                "DELETE FROM chat_sessions WHERE id IN "
+                "(SELECT id FROM chat_sessions ORDER BY updated_at LIMIT ?)",
+                (stored - self.max_stored,),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._db.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+
+    # -- prompt ----------------------------------------------------------
+
+    def build_prompt(self, session: Optional[Session], user_message: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Messages for the next turn and a report of their estimated size (``session=None``: no history)."""
+        session = session or Session(id="")
+        context_parts = []
+        if session.summary:
+            context_parts.append(f"Ringkasan percakapan sebelumnya:\n{session.summary}")
+        if session.pinned:
+            context_parts.append(
+                "Data dari tool pada giliran sebelumnya:\n" + "\n\n".join(p.text() for p in session.pinned)
+            )
+        context = [{"role": "system", "content": "\n\n".join(context_parts)}] if context_parts else []
+        new_message = {"role": "user", "content": user_message}
+
+        # Newest turns first until the history budget is used up
+        window: List[Turn] = []
+        history_tokens = 0
+        for turn in reversed(session.turns):
+            tokens = turn.tokens()
+            if window and history_tokens + tokens > self.history_budget:
+                break
+            window.insert(0, turn)
+            history_tokens += tokens
+
+        messages = context + [m for turn in window for m in turn.messages()] + [new_message]
+        report = {
+            "prompt_tokens": sum(message_tokens(m) for m in messages),
+            "summary_tokens": estimate_tokens(session.summary),
+            "pinned_tokens": sum(estimate_tokens(p.text()) for p in session.pinned),
+            "history_tokens": history_tokens,
+            "message_tokens": message_tokens(new_message),
+            "history_budget": self.history_budget,
+            "turns_in_window": len(window),
+            "turns_dropped": len(session.turns) - len(window),
+            "turns_summarized": session.summarized_turns,
+            "pinned_results": len(session.pinned),
+        }
+        return messages, report
+
+    # -- recording -------------------------------------------------------
+
+    def record_turn(self, session_id: str, user_message: str, response: List[Dict[str, Any]]) -> None:
+        turn, results = turn_from_response(user_message, response)
+        with self._lock:
+            session = self._reload(session_id)
+            session.turns.append(turn)
+            if results:
+                session.pinned = self._fit_pinned(session.pinned, results)
+            self._save(session)
+            needs_summary = sum(t.tokens() for t in session.turns) > self.history_budget
+        if needs_summary:
+            self._start_summary(session_id)
+
+    def _reload(self, session_id: str) -> Session:
+        row = self._db.execute("SELECT version, data FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+        return Session.from_json(session_id, *row) if row else Session(id=session_id)
+
+    def _fit_pinned(self, pinned: List[PinnedResult], results: List[PinnedResult]) -> List[PinnedResult]:
+        # A repeated call replaces the older result; newest results win the budget
+        keep = [p for p in pinned if not any(p.name == r.name and p.arguments == r.arguments for r in results)]
+        ordered = keep + results
+        fitted: List[PinnedResult] = []
+        used = 0
+        for result in reversed(ordered):
+            max_chars = max(0, (self.pinned_budget - used) * CHARS_PER_TOKEN)
+            if max_chars < 200:
+                break
+            if len(result.text()) > max_chars:
+                result = PinnedResult(result.name, result.arguments, result.content[: max_chars - 100] + "\n…")
+            fitted.insert(0, result)
+            used += estimate_tokens(result.text())
+        return fitted
+
+    def _start_summary(self, session_id: str) -> None:
+        with self._lock:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        threading.Thread(target=self._summarize, args=(session_id,), name="session-summary", daemon=True).start()
+
+    def _summarize(self, session_id: str) -> None:
+        try:
+            with self._lock:
+                session = self._reload(session_id)
+                # Fold the oldest turns until the rest fits in half the budget
+                remaining = sum(t.tokens() for t in session.turns)
+                folded = 0
+                while folded < len(session.turns) - 1 and remaining > self.history_budget // 2:
+                    remaining -= session.turns[folded].tokens()
+                    folded += 1
+                old_turns = session.turns[:folded]
+                previous = session.summary
+            if not old_turns:
+                return
+
+            summary = None
+            if self.summarize:
+                try:
+                    summary = self.summarize(previous, old_turns)
+                except Exception as e:
+                    logger.warning(f"Session summary failed, using extractive summary: {e}")
+            if not summary:
+                summary = extractive_summary(previous, old_turns)
+            summary = summary[: self.summary_budget * CHARS_PER_TOKEN]
+
+            with self._lock:
+                # Turns may have been added meanwhile; only drop the ones summarized
+                session = self._reload(session_id)
+                if session.turns[: len(old_turns)] != old_turns:
+                    return
+                session.turns = session.turns[len(old_turns):]
+                session.summary = summary
+                session.summarized_turns += len(old_turns)
+                self._save(session)
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored = self._db.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+            return {
+                "in_memory": len(self._sessions),
+                "stored": stored,
+                "summarizing": len(self._summarizing),
+                "history_budget": self.history_budget,
+                "pinned_budget": self.pinned_budget,
+            }
+
+
+SUMMARY_PROMPT = (
+    "Ringkas percakapan antara pengguna dan asisten penjualan Toyota berikut dalam maksimal {words} kata. "
+    "Pertahankan model, varian, harga, kota, budget dan preferensi yang disebut pengguna.\n\n"
+    "{previous}{turns}"
+)
+
+
+def llm_summarizer(llm, summary_budget: int = 300) -> Summarizer:
+    """Summarizer that asks ``llm`` (a qwen_agent chat model) for a short summary."""
+
+    def summarize(previous: str, turns: List[Turn]) -> str:
+        transcript = "\n".join(f"Pengguna: {t.user}\nAsisten: {t.answer}" for t in turns)
+        prompt = SUMMARY_PROMPT.format(
+            words=max(30, summary_budget * 3 // 4),
+            previous=f"Ringkasan sebelumnya:\n{previous}\n\n" if previous else "",
+            turns=transcript,
+        )
+        response = llm.chat(messages=[{"role": "user", "content": prompt}], stream=False)
+        return message_text(response[-1].get("content") if response else "").strip()
+
+    return summarize
@@ -0,0 +1,177 @@
+"""
+Server-sent events for qwen_agent runs.
+
+``bot.run()`` yields the whole response list of the turn every time it
+grows: the text of the last message is cumulative, and earlier messages
+(function calls, tool results) are repeated on every yield.
+``AgentEventStream`` turns that into incremental events:
+
+    event: delta        {"index": 0, "content": "new text"}
+    event: tool_call    {"index": 1, "name": "...", "arguments": "..."}
+    event: tool_result  {"index": 2, "name": "...", "content": "..."}
+    event: done         {"response": [...], "processing_time_ms": 1234}
+    event: error        {"error": "..."}
+
+The run happens on a background thread that only hands events to the HTTP
+response. While nothing is produced (tool calls, slow first token) the
+response sends SSE comments as heartbeats, so a client that went away is
+noticed by the failed write, and the run is stopped at its next step.
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def message_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return "" if content is None else str(content)
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class AgentEventStream:
+    """Diff successive ``bot.run()`` yields into delta and tool events."""
+
+    def __init__(self):
+        self._sent: Dict[int, str] = {}
+        self._finalized = 0
+
+    def feed(self, responses: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        # Every message but the last is complete once a newer one exists
+        return self._events(responses, complete=len(responses) - 1)
+
+    def finish(self, responses: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        return self._events(responses, complete=len(responses))
+
+    def _events(self, responses: List[Dict[str, Any]], complete: int) -> List[Tuple[str, Dict[str, Any]]]:
+        events = []
+        for index in range(self._finalized, len(responses)):
+            message = responses[index]
+            if message.get("role") == "assistant":
+                events.extend(self._delta(index, message_text(message.get("content"))))
+            if index < complete:
+                events.extend(self._completed(index, message))
+                self._finalized = index + 1
+        return events
+
+    def _delta(self, index: int, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        previous = self._sent.get(index, "")
+        if text == previous:
+            return []
+        self._sent[index] = text
+        if text.startswith(previous):
+            return [("delta", {"index": index, "content": text[len(previous):]})]
+        # The model rewrote its output (e.g. stripped a tool-call tag)
+        return [("delta", {"index": index, "content": text, "replace": True})]
+
+    @staticmethod
+    def _completed(index: int, message: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        function_call = message.get("function_call")
+        if message.get("role") == "assistant" and function_call:
+            return [("tool_call", {
+                "index": index,
+                "name": function_call.get("name"),
+                "arguments": function_call.get("arguments"),
+            })]
+        if message.get("role") == "function":
+            return [("tool_result", {
+                "index": index,
+                "name": message.get("name"),
+                "content": message_text(message.get("content")),
+            })]
+        return []
+
+
+_END = object()
+
+
+class EventStream:
+    """
+    Iterator of SSE text for one agent run, produced on a background thread.
+
+    The run starts as soon as the stream is created. ``close()`` (the WSGI
+    server calls it when the response ends or the client disconnects) stops
+    the run at its next step; ``on_exit`` runs on the run thread once the
+    run has ended either way, ``on_complete`` only after a run that finished
+    without error or cancellation. ``done_fields()`` is called at the end of
+    a completed run and its keys are added to the final ``done`` event.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[], Iterable[List[Dict[str, Any]]]],
+        heartbeat_seconds: float = 10.0,
+        on_exit: Optional[Callable[[], None]] = None,
+        on_complete: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        done_fields: Optional[Callable[[], Dict[str, Any]]] = None,
+    ):
+        self.heartbeat_seconds = heartbeat_seconds
+        self._events: "queue.Queue[Any]" = queue.Queue()
+        self._cancelled = threading.Event()
+        self._done = False
+        self._run = run
+        self._on_exit = on_exit
+        self._on_complete = on_complete
+        self._done_fields = done_fields
+        self._started = time.time()
+        threading.Thread(target=self._worker, name="agent-stream", daemon=True).start()
+
+    def _worker(self) -> None:
+        stream = AgentEventStream()
+        generator = None
+        responses: Optional[List[Dict[str, Any]]] = None
+        try:
+            generator = self._run()
+            for responses in generator:
+                if self._cancelled.is_set():
+                    break
+                for event in stream.feed(responses):
+                    self._events.put(event)
+            if not self._cancelled.is_set():
+                for event in stream.finish(responses or []):
+                    self._events.put(event)
+                self._events.put(("done", {
+                    "response": responses or [],
+                    "processing_time_ms": round((time.time() - self._started) * 1000),
+                    **(self._done_fields() if self._done_fields else {}),
+                }))
+                if self._on_complete and responses:
+                    self._on_complete(responses)
+        except Exception as e:
+            self._events.put(("error", {"error": str(e)}))
+        finally:
+            close = getattr(generator, "close", None)
+            if close:
+                # Unwinds qwen_agent's generators, which closes the LLM stream
+                close()
+            self._events.put(_END)
+            if self._on_exit:
+                self._on_exit()
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        if self._done:
+            raise StopIteration
+        try:
+            item = self._events.get(timeout=self.heartbeat_seconds)
+        except queue.Empty:
+            return ": keep-alive\n\n"
+        if item is _END:
+            self._done = True
+            raise StopIteration
+        event, data = item
+        return sse(event, data)
+
+    def close(self) -> None:
+        self._done = True
+        self._cancelled.set()
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from agent_pool import AgentPool, PoolBusy
+
+
+def numbered_agents():
+    count = iter(range(100))
+    return lambda: f"agent-{next(count)}"
+
+
+def test_agents_are_built_up_front_and_lent_one_at_a_time():
+    pool = AgentPool(numbered_agents(), size=2)
+    assert pool.agents == ["agent-0", "agent-1"]
+    with pool.lease() as first, pool.lease() as second:
+        assert {first, second} == {"agent-0", "agent-1"}
+        assert pool.stats()["idle"] == 0
+    assert pool.stats()["idle"] == 2
+    assert pool.stats()["served"] == 2
+
+
+def test_waiting_request_gets_the_released_agent():
+    pool = AgentPool(numbered_agents(), size=1, wait_timeout=2)
+    agent = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(agent,)).start()
+    assert pool.acquire() == agent
+    assert pool.stats()["avg_wait_ms"] > 0
+
+
+def test_times_out_when_no_agent_frees_up():
+    pool = AgentPool(numbered_agents(), size=1, wait_timeout=0.05)
+    pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolBusy, match="no agent free after 0.05s"):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["waiting"] == 0
+
+
+def test_rejects_immediately_when_the_queue_is_full():
+    pool = AgentPool(numbered_agents(), size=1, max_waiting=1, wait_timeout=1)
+    agent = pool.acquire()
+    waiter = threading.Thread(target=lambda: pool.release(pool.acquire()))
+    waiter.start()
+    while pool.stats()["waiting"] == 0:
+        time.sleep(0.005)
+    started = time.monotonic()
+    with pytest.raises(PoolBusy, match="1 requests already waiting"):
+        pool.acquire()
+    assert time.monotonic() - started < 0.5
+    pool.release(agent)
+    waiter.join()
+    assert pool.stats()["rejected"] == 1
+
+
+def test_lease_releases_on_error():
+    pool = AgentPool(numbered_agents(), size=1)
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            raise RuntimeError("run failed")
+    assert pool.try_acquire() == "agent-0"
+    assert pool.try_acquire() is None
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from evaluate import MAX_TOOL_RESULT_CHARS, final_answer, load_questions, percentile, summarize, tool_trace
+
+
+def call(name, arguments):
+    return {"role": "assistant", "content": "", "function_call": {"name": name, "arguments": arguments}}
+
+
+def result(name, content):
+    return {"role": "function", "name": name, "content": content}
+
+
+def recorded(name, arguments, duration_ms, ok=True):
+    return {"name": name, "arguments": arguments, "duration_ms": duration_ms, "ok": ok}
+
+
+def test_tool_trace_matches_results_to_calls_in_order():
+    messages = [
+        {"role": "user", "content": "Harga Avanza?"},
+        call("list_cars", '{"q": "avanza"}'),
+        call("get_variant_quote", '{"variant_id": "v1"}'),
+        result("list_cars", "Avanza"),
+        result("get_variant_quote", [{"text": "Rp 250"}, {"text": ".000.000"}]),
+        {"role": "assistant", "content": "Rp 250.000.000"},
+    ]
+    trace = tool_trace(messages, [])
+    assert [(step["name"], step["result"]) for step in trace] == [
+        ("list_cars", "Avanza"),
+        ("get_variant_quote", "Rp 250.000.000"),
+    ]
+    assert "duration_ms" not in trace[0]
+
+
+def test_tool_trace_matches_durations_recorded_in_completion_order():
+    messages = [
+        call("list_cars", '{"q": "avanza"}'), call("list_cars", '{"q": "rush"}'),
+        result("list_cars", "a"), result("list_cars", "b"),
+    ]
+    tool_calls = [recorded("list_cars", '{"q": "rush"}', 20.0, ok=False), recorded("list_cars", '{"q": "avanza"}', 80.0)]
+    trace = tool_trace(messages, tool_calls)
+    assert [(step["duration_ms"], step["ok"]) for step in trace] == [(80.0, True), (20.0, False)]
+
+
+def test_tool_trace_identical_calls_share_the_last_record():
+    messages = [call("list_cars", "{}"), call("list_cars", "{}"), result("list_cars", "a"), result("list_cars", "a")]
+    trace = tool_trace(messages, [recorded("list_cars", "{}", 15.0)])
+    assert [step["duration_ms"] for step in trace] == [15.0, 15.0]
+
+
+def test_tool_trace_truncates_long_results():
+    trace = tool_trace([call("list_cars", "{}"), result("list_cars", "x" * (MAX_TOOL_RESULT_CHARS + 10))], [])
+    assert trace[0]["result"] == "x" * MAX_TOOL_RESULT_CHARS + "…"
+
+
+def test_final_answer_skips_tool_calls():
+    messages = [{"role": "assistant", "content": "Jawaban"}, call("list_cars", "{}"), result("list_cars", "a")]
+    assert final_answer(messages) == "Jawaban"
+    assert final_answer([call("list_cars", "{}")]) == ""
+
+
+@pytest.mark.parametrize("pct, expected", [(0, 1.0), (50, 3.0), (90, 5.0), (100, 5.0)])
+def test_percentile(pct, expected):
+    assert percentile([5, 1, 4, 2, 3], pct) == expected
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 50) is None
+
+
+def test_load_questions(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text(
+        json.dumps({"id": "q1", "question": "Harga Avanza?", "expect": ["Rp"]}) + "\n\n"
+        + json.dumps({"message": "Stok Rush?"}) + "\n",
+        encoding="utf-8",
+    )
+    assert load_questions(str(path)) == [
+        {"id": "q1", "question": "Harga Avanza?", "expect": ["Rp"]},
+        {"id": "3", "question": "Stok Rush?", "expect": []},
+    ]
+
+
+def test_load_questions_requires_a_question(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text(json.dumps({"id": "q1"}) + "\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="questions.jsonl:1"):
+        load_questions(str(path))
+
+
+def test_summarize_counts_failures_and_tool_errors():
+    ok = {
+        "id": "q1", "ok": True, "passed": True, "latency_ms": 100.0, "llm_calls": 2, "fallback_calls": 0,
+        "tokens": {"prompt": 50, "completion": 10}, "tool_timeouts": [],
+        "tool_trace": [{"name": "list_cars", "ok": True}, {"name": "get_variant_quote", "ok": False}],
+    }
+    failed = {
+        "id": "q2", "ok": False, "error": "LLMUnavailable: down", "passed": False, "latency_ms": 5.0, "llm_calls": 0,
+        "fallback_calls": 1, "tokens": {"prompt": 0, "completion": 0}, "tool_timeouts": ["list_cars"], "tool_trace": [],
+    }
+    report = summarize([ok, failed], wall_seconds=2.0, concurrency=2)
+    assert (report["completed"], report["failed"], report["failure_rate"]) == (1, 1, 0.5)
+    assert report["latency_ms"]["p50"] == 100.0
+    assert report["throughput_qps"] == 0.5
+    assert report["tool_calls"] == {"list_cars": 1, "get_variant_quote": 1}
+    assert (report["tool_errors"], report["tool_timeouts"], report["fallback_calls"]) == (1, 1, 1)
+    assert (report["passed"], report["checked"]) == (1, 2)
+    assert report["failures"] == [{"id": "q2", "error": "LLMUnavailable: down"}]
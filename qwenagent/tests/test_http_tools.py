@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("qwen_agent")
+
+from http_tools import compact_operations, tool_name  # noqa: E402
+
+OPENAPI = {
+    "paths": {
+        "/variants/{variant_id}/quote": {
+            "get": {
+                "operationId": "get variant quote",
+                "description": "Hitung harga total varian plus aksesoris setelah promo aktif terbaik",
+                "parameters": [
+                    {"name": "variant_id", "in": "path", "required": True,
+                     "schema": {"type": "string", "format": "uuid", "title": "Variant Id"}},
+                    {"name": "accessory_ids", "in": "query", "required": False,
+                     "description": "Comma-separated accessory IDs",
+                     "schema": {"anyOf": [{"type": "string"}, {"type": "null"}], "default": None}},
+                    {"name": "x-request-id", "in": "header", "schema": {"type": "string"}},
+                ],
+            },
+        },
+        "/recommendations": {
+            "get": {
+                "operationId": "get car recommendations",
+                "summary": "Get Car Recommendations " + "x" * 200,
+                "parameters": [
+                    {"name": "budget_max", "in": "query",
+                     "schema": {"anyOf": [{"type": "number"}, {"type": "null"}], "description": "Budget maksimum"}},
+                    {"name": "seating_capacity", "in": "query",
+                     "schema": {"anyOf": [{"type": "integer"}, {"type": "null"}]}},
+                    {"name": "transmission", "in": "query",
+                     "schema": {"type": "string", "enum": ["AT", "MT"]}},
+                ],
+            },
+            "post": {"operationId": "create recommendation", "parameters": []},
+        },
+        "/debug/routes": {"get": {"operationId": "list routes"}},
+    },
+}
+
+
+def test_tool_name():
+    assert tool_name("get variant quote") == "get_variant_quote"
+    assert tool_name("  List Car-Variants ") == "list_car_variants"
+
+
+def test_compact_operations_keeps_the_configured_order():
+    operations = compact_operations(OPENAPI, ["get car recommendations", "get variant quote"])
+    assert [op["operation_id"] for op in operations] == ["get car recommendations", "get variant quote"]
+
+
+def test_compact_schema_for_path_and_query_parameters():
+    [quote] = compact_operations(OPENAPI, ["get variant quote"])
+    assert (quote["method"], quote["path"], quote["path_params"]) == ("GET", "/variants/{variant_id}/quote", ["variant_id"])
+    assert quote["function"] == {
+        "name": "get_variant_quote",
+        "description": "Hitung harga total varian plus aksesoris setelah promo aktif terbaik",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "variant_id": {"type": "string", "description": "UUID"},
+                "accessory_ids": {"type": "string", "description": "Comma-separated accessory IDs"},
+            },
+            "required": ["variant_id"],
+        },
+    }
+
+
+def test_compact_schema_drops_null_unions_and_shortens_text():
+    [recommend] = compact_operations(OPENAPI, ["get car recommendations"])
+    function = recommend["function"]
+    assert len(function["description"]) == 120 and function["description"].endswith("…")
+    assert function["parameters"]["properties"] == {
+        "budget_max": {"type": "number", "description": "Budget maksimum"},
+        "seating_capacity": {"type": "integer"},
+        "transmission": {"type": "string", "enum": ["AT", "MT"]},
+    }
+    assert function["parameters"]["required"] == []
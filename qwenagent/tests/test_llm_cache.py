@@ -0,0 +1,92 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_cache import ResponseCache, fingerprint, normalize_messages, tools_fingerprint
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache" / "llm.sqlite3"), ttl_seconds={"answer": 60, "call": 60})
+
+
+def test_get_returns_what_was_set(cache):
+    assert cache.get("call", "k") is None
+    cache.set("call", "k", "tools-1", [{"role": "assistant", "content": "Halo"}])
+    assert cache.get("call", "k") == [{"role": "assistant", "content": "Halo"}]
+    # Kinds have separate key spaces
+    assert cache.get("answer", "k") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == ({"answer": 0, "call": 1}, {"answer": 1, "call": 1})
+    assert stats["entries"] == {"call": 1}
+
+
+def test_entries_expire_after_their_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), ttl_seconds={"answer": 0.05, "call": 60})
+    cache.set("answer", "k", "tools-1", "old answer")
+    cache.set("call", "k", "tools-1", "call")
+    assert cache.get("answer", "k") == "old answer"
+    time.sleep(0.06)
+    assert cache.get("answer", "k") is None
+    assert cache.get("call", "k") == "call"
+    assert cache.stats()["entries"] == {"call": 1}
+
+
+def test_kinds_without_a_ttl_are_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), ttl_seconds={"answer": 0, "call": 60})
+    cache.set("answer", "k", "tools-1", "answer")
+    assert cache.get("answer", "k") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), max_entries=2)
+    cache.set("call", "a", "t", "A")
+    time.sleep(0.01)
+    cache.set("call", "b", "t", "B")
+    time.sleep(0.01)
+    cache.get("call", "a")
+    time.sleep(0.01)
+    cache.set("call", "c", "t", "C")
+    assert [cache.get("call", k) for k in ("a", "b", "c")] == ["A", None, "C"]
+
+
+def test_size_limit_evicts_by_bytes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.sqlite3"), max_bytes=250)
+    for key in ("a", "b", "c"):
+        cache.set("call", key, "t", "x" * 100)
+        time.sleep(0.01)
+    assert cache.get("call", "a") is None
+    assert cache.stats()["bytes"] <= 250
+
+
+def test_invalidate_tools_keeps_only_the_current_tool_list(cache):
+    cache.set("call", "a", "tools-1", "A")
+    cache.set("answer", "b", "tools-1", "B")
+    cache.set("call", "c", "tools-2", "C")
+    assert cache.invalidate_tools("tools-2") == 2
+    assert [cache.get("call", "a"), cache.get("answer", "b"), cache.get("call", "c")] == [None, None, "C"]
+    cache.clear()
+    assert cache.stats()["entries"] == {}
+
+
+def test_normalize_messages_keeps_what_the_model_sees():
+    messages = [
+        {"role": "user", "content": [{"text": " Harga "}, {"text": "Innova? ", "file": None}], "extra": 1},
+        SimpleNamespace(role="assistant", content="", name=None,
+                        function_call=SimpleNamespace(name="list cars", arguments="{}")),
+        {"role": "function", "name": "list cars", "content": "Innova|MPV\n"},
+    ]
+    assert normalize_messages(messages) == [
+        {"role": "user", "content": "Harga Innova?"},
+        {"role": "assistant", "content": "", "function_call": {"name": "list cars", "arguments": "{}"}},
+        {"role": "function", "content": "Innova|MPV", "name": "list cars"},
+    ]
+
+
+def test_fingerprints_are_order_independent_for_keys():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    tool = SimpleNamespace(function={"name": "list cars", "parameters": {}})
+    changed = SimpleNamespace(function={"name": "list cars", "parameters": {"model": {}}})
+    assert tools_fingerprint({"list cars": tool}) != tools_fingerprint({"list cars": changed})
+    assert tools_fingerprint({"a": tool, "b": changed}) == tools_fingerprint({"b": changed, "a": tool})
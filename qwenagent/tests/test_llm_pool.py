@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from llm_pool import LLMPool, LLMUnavailable, parse_backends
+
+
+def make_pool(primaries, fallbacks=(), **options):
+    options = {"wait_timeout": 1.0, "fallback_after": 0.1, "eject_failures": 2, "probe_interval": 0, **options}
+    return LLMPool(list(primaries), list(fallbacks), make_llm=lambda url, model: (url, model), **options)
+
+
+def test_parse_backends_fills_defaults():
+    assert parse_backends("http://a/v1|qwen3:8b|2, http://b/v1,,http://c/v1||", "qwen3:latest", 4) == [
+        ("http://a/v1", "qwen3:8b", 2),
+        ("http://b/v1", "qwen3:latest", 4),
+        ("http://c/v1", "qwen3:latest", 4),
+    ]
+
+
+def test_acquire_prefers_the_least_loaded_backend():
+    pool = make_pool([("http://a", "m", 2), ("http://b", "m", 4)])
+    first = pool.acquire()
+    second = pool.acquire()
+    third = pool.acquire()
+    assert [b.url for b in (first, second, third)] == ["http://a", "http://b", "http://b"]
+    assert first.llm == ("http://a", "m")
+
+
+def test_fallback_after_primaries_stay_full():
+    pool = make_pool([("http://a", "big", 1)], [("http://f", "small", 1)], fallback_after=0.05)
+    pool.acquire()
+    started = time.monotonic()
+    backend = pool.acquire()
+    assert backend.fallback and backend.model == "small"
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["fallback_calls"] == 1
+
+
+def test_primary_released_before_fallback_after_is_used():
+    pool = make_pool([("http://a", "big", 1)], [("http://f", "small", 1)], fallback_after=1.0)
+    busy = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(busy, True)).start()
+    assert pool.acquire() is busy
+
+
+def test_times_out_when_nothing_is_free():
+    pool = make_pool([("http://a", "m", 1)], wait_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(LLMUnavailable):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_failures_eject_a_backend_and_fallback_takes_over_immediately():
+    pool = make_pool([("http://a", "big", 4)], [("http://f", "small", 4)], fallback_after=5.0)
+    for _ in range(2):
+        pool.release(pool.acquire(), ok=False)
+    stats = pool.stats()["backends"][0]
+    assert (stats["healthy"], stats["ejections"], stats["errors"]) == (False, 1, 2)
+    started = time.monotonic()
+    assert pool.acquire().fallback
+    assert time.monotonic() - started < 1.0
+
+
+def test_success_resets_the_failure_count():
+    pool = make_pool([("http://a", "m", 4)])
+    pool.release(pool.acquire(), ok=False)
+    pool.release(pool.acquire(), ok=True)
+    pool.release(pool.acquire(), ok=False)
+    assert pool.backends[0].healthy
+
+
+def test_all_ejected_backends_are_still_tried():
+    pool = make_pool([("http://a", "m", 4), ("http://b", "m", 4)])
+    for backend in pool.backends:
+        backend.healthy = False
+    assert pool.acquire().url in ("http://a", "http://b")
+
+
+def test_exclude_skips_a_backend_for_retries():
+    pool = make_pool([("http://a", "m", 4), ("http://b", "m", 4)])
+    first = pool.acquire()
+    assert pool.acquire(exclude={first}) is not first
+    with pytest.raises(LLMUnavailable, match="no other LLM backend"):
+        pool.acquire(exclude=set(pool.backends))
+
+
+def test_probes_readmit_an_ejected_backend():
+    probes = []
+
+    def probe(backend):
+        probes.append(backend.url)
+
+    pool = make_pool([("http://a", "m", 4)], probe_interval=0.01, probe=probe, readmit_successes=2)
+    backend = pool.backends[0]
+    with pool._cond:
+        backend.healthy = False
+    deadline = time.monotonic() + 2
+    while not backend.healthy and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.healthy
+    assert len(probes) >= 2
@@ -0,0 +1,77 @@
+import pytest
+
+from metrics import Histogram, MetricsRegistry, RunMetrics, completion_tokens, prompt_tokens
+
+
+def test_histogram_quantile_is_the_bucket_upper_bound():
+    h = Histogram((10, 100, 1000))
+    assert h.quantile(0.5) is None
+    for value in (5, 10, 50, 60, 70, 500, 5000):
+        h.observe(value)
+    # Bucket counts: <=10: 2, <=100: 3, <=1000: 1, above: 1
+    assert h.counts == [2, 3, 1, 1]
+    assert h.quantile(0.25) == 10
+    assert h.quantile(0.5) == 100
+    assert h.quantile(6 / 7) == 1000
+    assert h.quantile(0.99) is None  # past the last bucket
+
+
+def test_histogram_snapshot_is_cumulative():
+    h = Histogram((10, 100))
+    for value in (1, 20, 200):
+        h.observe(value)
+    snapshot = h.snapshot()
+    assert snapshot["buckets"] == [[10, 1], [100, 2], ["+Inf", 3]]
+    assert (snapshot["count"], snapshot["sum"], snapshot["avg"]) == (3, 221.0, 73.7)
+
+
+@pytest.mark.parametrize("spans, expected_ms", [
+    ([], 0.0),
+    ([(0.0, 1.0)], 1000.0),
+    ([(0.0, 1.0), (2.0, 2.5)], 1500.0),  # sequential
+    ([(0.0, 1.0), (0.5, 1.5)], 1500.0),  # overlapping
+    ([(0.0, 2.0), (0.5, 1.0)], 2000.0),  # nested
+    ([(1.0, 2.0), (0.0, 1.0), (0.2, 0.4)], 2000.0),  # recorded out of order, touching
+])
+def test_tools_wall_ms_counts_overlapping_calls_once(spans, expected_ms):
+    run = RunMetrics()
+    for i, (started, ended) in enumerate(spans):
+        run.record_tool_call(f"tool{i}", started, ended, ok=True)
+    assert run._tools_wall_ms() == pytest.approx(expected_ms)
+
+
+def test_summary_splits_the_turn_into_stages():
+    run = RunMetrics()
+    run.queue_ms = 5.0
+    run.record_llm_call(0.0, 0.2, 1.2, prompt=100, completion=50, asked_for_tools=True, cached=False)
+    run.record_llm_call(2.0, None, 2.0, prompt=120, completion=10, asked_for_tools=False, cached=True,
+                        backend="small@http://f", fallback=True)
+    run.record_tool_call("list cars", 1.2, 1.7, ok=True, arguments="{}")
+    run.record_tool_call("get stock", 1.3, 1.9, ok=False, arguments='{"city": "Jakarta"}')
+    run.record_tool_timeout("get stock")
+    summary = run.summary()
+    assert summary["stages_ms"]["prompt_eval"] == 200.0
+    assert summary["stages_ms"]["generation"] == 1000.0
+    assert summary["stages_ms"]["tools"] == pytest.approx(700.0)
+    assert (summary["llm_call_count"], summary["tool_rounds"], summary["fallback_calls"]) == (2, 1, 1)
+    assert (summary["prompt_tokens"], summary["completion_tokens"]) == (220, 60)
+    # Cached calls have no generation speed
+    assert summary["llm_calls"][1]["tokens_per_second"] is None
+    assert summary["tokens_per_second"] == 50.0
+    assert summary["tool_calls"][1]["arguments"] == '{"city": "Jakarta"}'
+
+    registry = MetricsRegistry()
+    registry.record_turn(summary)
+    registry.record_cached_turn(3.0)
+    snapshot = registry.snapshot()
+    assert (snapshot["turns"], snapshot["cached_turns"], snapshot["tool_errors"]) == (2, 1, 1)
+    assert (snapshot["tool_timeouts"], snapshot["fallback_llm_calls"]) == (1, 1)
+    assert snapshot["histograms"]["prompt_eval_ms"]["count"] == 1
+    assert sorted(snapshot["tool_ms"]) == ["get stock", "list cars"]
+
+
+def test_token_estimates_include_function_schemas():
+    messages = [{"role": "user", "content": "x" * 40}]
+    assert prompt_tokens(messages) == 14
+    assert prompt_tokens(messages, [{"name": "list cars"}]) > 14
+    assert completion_tokens([{"role": "assistant", "content": "y" * 8}]) == 6
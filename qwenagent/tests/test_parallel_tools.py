@@ -0,0 +1,59 @@
+import threading
+import time
+
+from parallel_tools import ParallelToolCalls, timeout_message
+
+
+class RecordingTool:
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, name, arguments):
+        with self._lock:
+            self.calls.append((name, arguments))
+        time.sleep(self.delays.get(name, 0.0))
+        return f"{name}:{arguments}"
+
+
+def test_calls_run_concurrently_and_results_keep_their_order():
+    tool = RecordingTool({"slow": 0.2, "fast": 0.0, "medium": 0.1})
+    calls = ParallelToolCalls(tool, max_workers=4, timeout=5)
+    started = time.monotonic()
+    calls.start([("slow", "{}"), ("fast", "{}"), ("medium", "{}")])
+    results = [calls.result(name, "{}") for name in ("slow", "fast", "medium")]
+    elapsed = time.monotonic() - started
+    assert results == [("slow:{}", True), ("fast:{}", True), ("medium:{}", True)]
+    assert elapsed < 0.29  # sequential would take 0.3 s
+    assert calls.parallel_batches == 1
+
+
+def test_identical_calls_run_once():
+    tool = RecordingTool()
+    calls = ParallelToolCalls(tool, max_workers=2, timeout=5)
+    calls.start([("stock", '{"city": "Jakarta"}'), ("stock", '{"city": "Jakarta"}')])
+    assert calls.result("stock", '{"city": "Jakarta"}') == calls.result("stock", '{"city": "Jakarta"}')
+    assert tool.calls == [("stock", '{"city": "Jakarta"}')]
+    assert calls.parallel_batches == 0
+
+
+def test_call_not_started_is_submitted_on_demand():
+    tool = RecordingTool()
+    calls = ParallelToolCalls(tool, max_workers=2, timeout=5)
+    calls.start([("a", "{}")])
+    assert calls.result("b", "{}") == ("b:{}", True)
+
+
+def test_slow_call_is_answered_with_a_timeout_message():
+    tool = RecordingTool({"slow": 0.5})
+    calls = ParallelToolCalls(tool, max_workers=2, timeout=0.1)
+    calls.start([("slow", "{}"), ("fast", "{}")])
+    assert calls.result("slow", "{}") == (timeout_message("slow", 0.1), False)
+    # The deadline counts from submission, so the fast call is still answered
+    assert calls.result("fast", "{}") == ("fast:{}", True)
+    assert calls.timeouts == 1
+
+
+def test_timeout_message_mentions_the_tool():
+    assert timeout_message("get stock", 30.0).startswith("Tool `get stock` did not respond within 30 seconds.")
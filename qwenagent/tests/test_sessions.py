@@ -0,0 +1,88 @@
+import pytest
+
+from sessions import CHARS_PER_TOKEN, PinnedResult, Session, SessionStore, Turn
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / "sessions.sqlite3"), history_budget=100, pinned_budget=100)
+
+
+def turn(i):
+    # 40 characters each side: 10 + 4 overhead tokens per message, 28 per turn
+    return Turn(user=f"question {i}".ljust(40, "."), answer=f"answer {i}".ljust(40, "."))
+
+
+def test_build_prompt_without_history(store):
+    messages, report = store.build_prompt(None, "Halo")
+    assert messages == [{"role": "user", "content": "Halo"}]
+    assert report["turns_in_window"] == 0
+    assert report["prompt_tokens"] == report["message_tokens"] == 5
+
+
+def test_build_prompt_keeps_the_newest_turns_within_budget(store):
+    session = Session(id="s", turns=[turn(i) for i in range(5)])
+    messages, report = store.build_prompt(session, "next")
+    # Three turns (84 tokens) fit in 100, a fourth would not
+    assert (report["turns_in_window"], report["turns_dropped"]) == (3, 2)
+    assert report["history_tokens"] == 84
+    assert [m["content"] for m in messages[:-1:2]] == [turn(i).user for i in (2, 3, 4)]
+    assert messages[-1] == {"role": "user", "content": "next"}
+
+
+def test_build_prompt_keeps_one_turn_over_budget(store):
+    session = Session(id="s", turns=[Turn(user="u" * 1000, answer="a")])
+    _, report = store.build_prompt(session, "next")
+    assert report["turns_in_window"] == 1
+
+
+def test_build_prompt_puts_summary_and_pinned_results_first(store):
+    session = Session(id="s", summary="User cari MPV.", turns=[turn(0)],
+                      pinned=[PinnedResult("list cars", "{}", "Innova|MPV")])
+    messages, report = store.build_prompt(session, "next")
+    assert messages[0]["role"] == "system"
+    assert "Ringkasan percakapan sebelumnya:\nUser cari MPV." in messages[0]["content"]
+    assert "[list cars {}]\nInnova|MPV" in messages[0]["content"]
+    assert report["pinned_results"] == 1
+
+
+def test_fit_pinned_replaces_repeated_calls(store):
+    old = [PinnedResult("stock", '{"city": "Jakarta"}', "old"), PinnedResult("promos", "{}", "p")]
+    new = [PinnedResult("stock", '{"city": "Jakarta"}', "new")]
+    assert [(p.name, p.content) for p in store._fit_pinned(old, new)] == [("promos", "p"), ("stock", "new")]
+
+
+def test_fit_pinned_truncates_and_drops_the_oldest(store):
+    # The budget is 400 characters: the newest result is cut to fit and
+    # nothing older is kept once less than 200 characters remain
+    results = [PinnedResult("a", "{}", "x" * 300), PinnedResult("b", "{}", "y" * 1000)]
+    fitted = store._fit_pinned([], results)
+    assert [p.name for p in fitted] == ["b"]
+    assert fitted[0].content.endswith("\n…")
+    assert len(fitted[0].text()) <= store.pinned_budget * CHARS_PER_TOKEN
+
+
+def test_fit_pinned_keeps_small_results(store):
+    results = [PinnedResult("a", "{}", "x" * 50), PinnedResult("b", "{}", "y" * 50)]
+    assert store._fit_pinned([], results) == results
+
+
+def test_record_turn_and_find(store):
+    assert store.find("s") is None
+    response = [
+        {"role": "assistant", "content": "", "function_call": {"name": "list cars", "arguments": "{}"}},
+        {"role": "function", "name": "list cars", "content": "Innova|MPV"},
+        {"role": "assistant", "content": "Ada Innova."},
+    ]
+    store.record_turn("s", "Mobil apa saja?", response)
+    session = store.find("s")
+    assert session.turns == [Turn(user="Mobil apa saja?", answer="Ada Innova.")]
+    assert session.pinned == [PinnedResult("list cars", "{}", "Innova|MPV")]
+
+
+def test_unknown_sessions_are_not_cached(store):
+    assert store.get("ghost").turns == []
+    assert store.stats()["in_memory"] == 0
+    store.record_turn("s", "hi", [{"role": "assistant", "content": "halo"}])
+    store.delete("s")
+    assert store.find("s") is None
@@ -0,0 +1,69 @@
+from streaming import AgentEventStream, EventStream, sse
+
+CALL = {"role": "assistant", "content": "", "function_call": {"name": "list cars", "arguments": "{}"}}
+RESULT = {"role": "function", "name": "list cars", "content": [{"text": "Innova|MPV"}]}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+def test_cumulative_text_becomes_deltas():
+    stream = AgentEventStream()
+    assert stream.feed([assistant("Ha")]) == [("delta", {"index": 0, "content": "Ha"})]
+    assert stream.feed([assistant("Halo")]) == [("delta", {"index": 0, "content": "lo"})]
+    assert stream.feed([assistant("Halo")]) == []
+    assert stream.finish([assistant("Halo")]) == []
+
+
+def test_rewritten_text_is_replaced():
+    stream = AgentEventStream()
+    stream.feed([assistant("<tool_call>")])
+    assert stream.feed([assistant("")]) == [("delta", {"index": 0, "content": "", "replace": True})]
+
+
+def test_tool_events_are_sent_once_the_message_is_complete():
+    stream = AgentEventStream()
+    assert stream.feed([CALL]) == []
+    assert stream.feed([CALL, RESULT]) == [
+        ("tool_call", {"index": 0, "name": "list cars", "arguments": "{}"}),
+    ]
+    assert stream.feed([CALL, RESULT, assistant("Ada")]) == [
+        ("tool_result", {"index": 1, "name": "list cars", "content": "Innova|MPV"}),
+        ("delta", {"index": 2, "content": "Ada"}),
+    ]
+    # Earlier messages repeated by later yields produce nothing new
+    assert stream.finish([CALL, RESULT, assistant("Ada Innova.")]) == [
+        ("delta", {"index": 2, "content": " Innova."}),
+    ]
+
+
+def test_finish_completes_a_trailing_tool_call():
+    stream = AgentEventStream()
+    stream.feed([CALL])
+    assert stream.finish([CALL]) == [("tool_call", {"index": 0, "name": "list cars", "arguments": "{}"})]
+
+
+def test_event_stream_emits_done_after_the_run():
+    completed = []
+
+    def run():
+        yield [assistant("Ha")]
+        yield [assistant("Halo")]
+
+    stream = EventStream(run, heartbeat_seconds=5, on_complete=completed.append,
+                         done_fields=lambda: {"session_id": "s"})
+    events = list(stream)
+    assert events[:2] == [sse("delta", {"index": 0, "content": "Ha"}), sse("delta", {"index": 0, "content": "lo"})]
+    assert events[2].startswith("event: done\n")
+    assert '"session_id": "s"' in events[2]
+    assert completed == [[assistant("Halo")]]
+
+
+def test_event_stream_reports_errors():
+    def run():
+        yield [assistant("Ha")]
+        raise RuntimeError("LLM down")
+
+    events = list(EventStream(run, heartbeat_seconds=5))
+    assert events[-1] == sse("error", {"error": "LLM down"})
@@ -0,0 +1,58 @@
+import logging
+import time
+
+from warmup import Warmup
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_steps_are_retried_until_they_succeed(caplog):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("MCP not up yet")
+        return "tools"
+
+    results = []
+    with caplog.at_level(logging.INFO, logger="warmup"):
+        warmup = Warmup(lambda w: results.append(w.step("mcp", flaky)), retry_seconds=0.01, idle_seconds=0)
+        assert wait_for(lambda: warmup.ready)
+    assert results == ["tools"]
+    step = warmup.stats()["steps"]["mcp"]
+    assert (step["status"], step["attempts"]) == ("done", 3)
+    assert "error" not in step
+    messages = [(r.levelname, r.getMessage()) for r in caplog.records]
+    assert messages[0] == ("WARNING", "Warm-up step mcp failed (attempt 1), retrying in 0s: MCP not up yet")
+    assert messages[-1][0] == "INFO" and messages[-1][1].startswith("Warm-up finished in ")
+
+
+def test_not_ready_while_a_step_fails():
+    warmup = Warmup(lambda w: w.step("llm", lambda: 1 / 0), retry_seconds=0.01, max_retry_seconds=0.01)
+    assert wait_for(lambda: warmup.stats()["steps"].get("llm", {}).get("attempts", 0) >= 2)
+    assert not warmup.ready
+    assert warmup.stats()["steps"]["llm"]["status"] == "retrying"
+    warmup.stop()
+
+
+def test_rewarm_runs_after_idle_time(caplog):
+    calls = []
+
+    def rewarm(w):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("LLM busy")
+
+    # The re-warm loop checks every min(idle_seconds, 30) seconds
+    with caplog.at_level(logging.WARNING, logger="warmup"):
+        warmup = Warmup(lambda w: None, rewarm, idle_seconds=0.02)
+        assert wait_for(lambda: warmup.rewarms >= 1)
+    warmup.stop()
+    assert warmup.rewarm_errors == 1
+    assert any(r.getMessage() == "Re-warm failed: LLM busy" for r in caplog.records)
@@ -0,0 +1,117 @@
+"""
+Startup warm-up and readiness for the qwenagent API.
+
+The first request after a deploy would otherwise pay for the MCP connection
+and tool discovery of every pooled agent and for loading the model into the
+LLM server. ``Warmup`` runs those steps on a background thread as soon as
+the worker starts, retrying each one with backoff until it succeeds, and
+only then reports ready (``/api/ready``), so a load balancer or compose
+healthcheck keeps traffic away until the first turn can be fast.
+
+Once ready it keeps things warm: when no request has arrived for
+``idle_seconds`` it runs ``rewarm`` (a priming generation and a cheap tool
+call over the idle MCP connections) so the model is not unloaded and the
+connections are not dropped between quiet periods.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    def __init__(
+        self,
+        start: Callable[["Warmup"], None],
+        rewarm: Optional[Callable[["Warmup"], None]] = None,
+        idle_seconds: float = 240.0,
+        retry_seconds: float = 2.0,
+        max_retry_seconds: float = 30.0,
+    ):
+        self.idle_seconds = idle_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._start = start
+        self._rewarm = rewarm
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._last_activity = time.monotonic()
+        self.started_at = time.time()
+        self.ready_after_s: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.rewarms = 0
+        self.rewarm_errors = 0
+        self.last_rewarm: Optional[float] = None
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def touch(self) -> None:
+        """Record traffic; re-warming only happens after ``idle_seconds`` without any."""
+        with self._lock:
+            self._last_activity = time.monotonic()
+
+    def step(self, name: str, fn: Callable[[], Any]) -> Any:
+        """Run one warm-up step, retrying with backoff until it succeeds."""
+        record = self.steps.setdefault(name, {"status": "running", "attempts": 0})
+        delay = self.retry_seconds
+        while not self._stopped.is_set():
+            record["attempts"] += 1
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                record.update(status="retrying", error=str(e))
+                logger.warning(f"Warm-up step {name} failed (attempt {record['attempts']}), retrying in {delay:.0f}s: {e}")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry_seconds)
+                continue
+            record.update(status="done", duration_ms=round((time.monotonic() - started) * 1000))
+            record.pop("error", None)
+            return result
+        raise RuntimeError("warm-up stopped")
+
+    def _run(self) -> None:
+        try:
+            self._start(self)
+        except RuntimeError:
+            return
+        self.ready_after_s = round(time.time() - self.started_at, 2)
+        self._ready.set()
+        logger.info(f"Warm-up finished in {self.ready_after_s}s")
+        self.touch()
+        if self._rewarm is None or self.idle_seconds <= 0:
+            return
+        while not self._stopped.wait(min(self.idle_seconds, 30.0)):
+            with self._lock:
+                idle = time.monotonic() - self._last_activity
+            if idle < self.idle_seconds:
+                continue
+            try:
+                self._rewarm(self)
+                self.rewarms += 1
+                self.last_rewarm = time.time()
+            except Exception as e:
+                self.rewarm_errors += 1
+                logger.warning(f"Re-warm failed: {e}")
+            self.touch()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "ready_after_s": self.ready_after_s,
+            "steps": {name: dict(record) for name, record in self.steps.items()},
+            "idle_seconds": self.idle_seconds,
+            "rewarms": self.rewarms,
+            "rewarm_errors": self.rewarm_errors,
+            "last_rewarm": self.last_rewarm,
+        }